@@ -0,0 +1,183 @@
+"""Перенос завершённых заявок в архивную базу.
+
+Заявки со статусом "проверено" или "отклонено", поданные раньше
+ARCHIVE_AFTER_DAYS дней назад, вместе с представителями переносятся пачками
+в ARCHIVE_DB_PATH; страницы модерации, счётчики и поиск работают только с
+актуальными заявками. Карточка заявки (student_details) и договор читают
+архив, если заявки нет в основной базе.
+
+Запуск (например, раз в сутки из cron):
+    python archive.py run [--days 365] [--batch 500]
+Однократный перевод существующей базы на incremental auto_vacuum (VACUUM
+блокирует базу, запускать в окно обслуживания):
+    python archive.py enable-auto-vacuum
+"""
+import argparse
+import datetime
+import logging
+import os
+import re
+import sqlite3
+
+import db
+import details_cache
+
+ARCHIVE_DB_PATH = os.environ["ARCHIVE_DB_PATH"] if "ARCHIVE_DB_PATH" in os.environ else os.path.splitext(db.DB_PATH)[0] + "-archive.db"
+ARCHIVE_AFTER_DAYS = int(os.environ["ARCHIVE_AFTER_DAYS"]) if "ARCHIVE_AFTER_DAYS" in os.environ else 365
+ARCHIVE_BATCH = int(os.environ["ARCHIVE_BATCH"]) if "ARCHIVE_BATCH" in os.environ else 500
+# Сколько свободных страниц возвращать системе за один PRAGMA incremental_vacuum
+ARCHIVE_VACUUM_PAGES = 1000
+
+FINISHED_STATUSES = ('проверено', 'отклонено')
+ARCHIVE_TABLES = ('students', 'adult_students', 'representatives')
+
+logger = logging.getLogger(__name__)
+
+
+def _columns(conn, schema, table_name):
+    return [row[1] for row in conn.execute(f'PRAGMA {schema}.table_info({table_name})')]
+
+
+def attach(conn, path=ARCHIVE_DB_PATH):
+    """Подключает архив как схему archive и создаёт в нём таблицы по образцу основной базы."""
+    conn.execute('ATTACH DATABASE ? AS archive', (path,))
+    conn.execute('PRAGMA archive.journal_mode = WAL')
+    for table_name in ARCHIVE_TABLES:
+        sql = conn.execute("SELECT sql FROM main.sqlite_master WHERE type = 'table' AND name = ?",
+                           (table_name,)).fetchone()[0]
+        conn.execute(re.sub(r'^CREATE TABLE\s+(IF NOT EXISTS\s+)?"?\w+"?', f'CREATE TABLE IF NOT EXISTS archive.{table_name}', sql))
+        # Столбцы, добавленные миграциями после создания архива
+        existing = set(_columns(conn, 'archive', table_name))
+        for _, name, column_type, _, _, _ in conn.execute(f'PRAGMA main.table_info({table_name})').fetchall():
+            if name not in existing:
+                conn.execute(f'ALTER TABLE archive.{table_name} ADD COLUMN {name} {column_type}')
+    conn.execute('CREATE INDEX IF NOT EXISTS archive.idx_representatives_student_id ON representatives (student_id)')
+
+
+def _copy(conn, table_name, key, ids):
+    columns = ', '.join(_columns(conn, 'main', table_name))
+    placeholders = ', '.join('?' * len(ids))
+    conn.execute(f'INSERT OR REPLACE INTO archive.{table_name} ({columns}) '
+                 f'SELECT {columns} FROM main.{table_name} WHERE {key} IN ({placeholders})', ids)
+
+
+def archive_table(conn, table_name, cutoff, batch=ARCHIVE_BATCH):
+    """Переносит завершённые заявки таблицы, поданные до cutoff; возвращает их число.
+
+    Каждая пачка - две транзакции: копия в архив, затем удаление из основной
+    базы только тех заявок, что уже есть в архиве. В режиме WAL транзакция
+    над двумя файлами не атомарна как целое, а при таком порядке сбой между
+    шагами оставляет заявку в обеих базах (следующий запуск доделает перенос),
+    но не теряет её.
+    """
+    moved = 0
+    while True:
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            ids = [row[0] for row in conn.execute(f'''
+                SELECT id FROM main.{table_name} s
+                WHERE status IN (?, ?) AND submission_date < ?
+                  AND NOT EXISTS (SELECT 1 FROM main.outbox o WHERE o.table_name = ? AND o.student_id = s.id
+                                  AND o.state IN ('pending', 'sending'))
+                ORDER BY id LIMIT ?
+            ''', (*FINISHED_STATUSES, cutoff, table_name, batch))]
+            if ids:
+                _copy(conn, table_name, 'id', ids)
+                if table_name == 'students':
+                    _copy(conn, 'representatives', 'student_id', ids)
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        if not ids:
+            return moved
+
+        placeholders = ', '.join('?' * len(ids))
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            archived = [row[0] for row in conn.execute(
+                f'SELECT id FROM archive.{table_name} WHERE id IN ({placeholders})', ids)]
+            placeholders = ', '.join('?' * len(archived))
+            if table_name == 'students':
+                conn.execute(f'DELETE FROM main.representatives WHERE student_id IN ({placeholders})', archived)
+            conn.execute(f'DELETE FROM main.{table_name} WHERE id IN ({placeholders})', archived)
+            details_cache.invalidate(conn, table_name, archived)
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        moved += len(archived)
+
+
+def vacuum(conn):
+    """Возвращает свободные страницы основной базы порциями; число освобождённых страниц."""
+    if conn.execute('PRAGMA main.auto_vacuum').fetchone()[0] != 2:
+        logger.warning("auto_vacuum не incremental, место не освобождается: python archive.py enable-auto-vacuum")
+        return 0
+    start = free = conn.execute('PRAGMA main.freelist_count').fetchone()[0]
+    while free:
+        # execute() делает один шаг прагмы и освобождает одну страницу; executescript() - все
+        conn.executescript(f'PRAGMA main.incremental_vacuum({ARCHIVE_VACUUM_PAGES});')
+        remaining = conn.execute('PRAGMA main.freelist_count').fetchone()[0]
+        if remaining >= free:
+            break
+        free = remaining
+    return start - free
+
+
+def run(days=ARCHIVE_AFTER_DAYS, batch=ARCHIVE_BATCH, path=ARCHIVE_DB_PATH):
+    """Переносит заявки старше days дней и сжимает основную базу; возвращает статистику."""
+    cutoff = (datetime.datetime.now() - datetime.timedelta(days=days)).strftime('%Y-%m-%d %H:%M:%S')
+    conn = db.connect()
+    conn.isolation_level = None
+    try:
+        attach(conn, path)
+        stats = {table_name: archive_table(conn, table_name, cutoff, batch) for table_name in db.APPLICATION_TABLES}
+        conn.execute('DETACH DATABASE archive')
+        stats["released_pages"] = vacuum(conn)
+    finally:
+        conn.close()
+    logger.info(f"Архивация заявок до {cutoff}: {stats}")
+    return stats
+
+
+def enable_auto_vacuum():
+    conn = db.connect()
+    conn.isolation_level = None
+    try:
+        conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+        conn.execute('VACUUM')
+        return conn.execute('PRAGMA auto_vacuum').fetchone()[0]
+    finally:
+        conn.close()
+
+
+def fetch_application(table_name, student_id, path=ARCHIVE_DB_PATH):
+    """(student, representative) из архива или None, если заявки там нет."""
+    if not os.path.exists(path):
+        return None
+    conn = db.connect(path)
+    try:
+        return db.fetch_applications_by_ids(conn, table_name, [student_id]).get(student_id)
+    except sqlite3.OperationalError:
+        # Архив ещё не создан до конца (нет таблицы)
+        return None
+    finally:
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("command", choices=["run", "enable-auto-vacuum"])
+    parser.add_argument("--days", type=int, default=ARCHIVE_AFTER_DAYS)
+    parser.add_argument("--batch", type=int, default=ARCHIVE_BATCH)
+    args = parser.parse_args()
+
+    if args.command == "run":
+        print(run(args.days, args.batch))
+    else:
+        print("auto_vacuum =", enable_auto_vacuum())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""Сравнение скорости записи заявок: соединение на каждый запрос против пула WAL.
+
+Запуск из корня проекта:
+    python bench/bench_db.py --workers 2 --seconds 5
+
+Каждый процесс имитирует воркер gunicorn и в цикле выполняет INSERT заявки
+(как education_adult) вперемешку с чтением списка модерации.
+"""
+import argparse
+import multiprocessing
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+ROW = ("Иванов", "Иван", "Иванович", "2000-01-01", "г. Екатеринбург", "male", "123-456-789 00", "passport",
+       "6500", "123456", "ОВД", "2015-01-01", "", "+79000000000", "test@example.com",
+       "Экзамен для взрослых", "3", "2024-05-01", "2024-04-01 10:00:00", "scan.pdf")
+
+INSERT = '''
+    INSERT INTO adult_students (last_name, first_name, middle_name, birth_date, address, gender, snils, id_type, id_serial, id_number, id_issued_by, id_issued_date, bank_details, phone, email, study_plan, exam_selection, exam_date, submission_date, file_paths)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+'''
+SELECT = 'SELECT * FROM adult_students WHERE status = ? LIMIT 20'
+
+
+def run_legacy(path, seconds, result):
+    done = 0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        try:
+            conn = sqlite3.connect(path)
+            c = conn.cursor()
+            c.execute(INSERT, ROW)
+            conn.commit()
+            c.execute(SELECT, ("на проверке",))
+            c.fetchall()
+            conn.close()
+            done += 1
+        except sqlite3.OperationalError:
+            # "database is locked" - запрос завершился бы ошибкой 500
+            result.put(("error", 1))
+    result.put(("done", done))
+
+
+def run_pooled(path, seconds, result):
+    import db
+    done = 0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        try:
+            with db.transaction() as conn:
+                conn.execute(INSERT, ROW)
+            with db.connection() as conn:
+                conn.execute(SELECT, ("на проверке",)).fetchall()
+            done += 1
+        except sqlite3.OperationalError:
+            result.put(("error", 1))
+    result.put(("done", done))
+
+
+def measure(target, path, workers, seconds):
+    result = multiprocessing.Queue()
+    procs = [multiprocessing.Process(target=target, args=(path, seconds, result)) for _ in range(workers)]
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join()
+    done = errors = 0
+    while not result.empty():
+        kind, value = result.get()
+        if kind == "done":
+            done += value
+        else:
+            errors += value
+    return done / seconds, errors
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=2, help="число параллельных процессов записи")
+    parser.add_argument("--seconds", type=float, default=5, help="длительность каждого замера, с")
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    legacy_path = os.path.join(tmp, "legacy.db")
+    pooled_path = os.path.join(tmp, "pooled.db")
+
+    # Схема создаётся модулем db; для "старого" варианта режим журнала возвращается в DELETE
+    os.environ["DB_PATH"] = legacy_path
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    import db
+    db.init_db()
+    conn = sqlite3.connect(legacy_path)
+    conn.execute("PRAGMA journal_mode = DELETE")
+    conn.close()
+
+    db.DB_PATH = db.pool.path = pooled_path
+    os.environ["DB_PATH"] = pooled_path
+    db.init_db()
+
+    rate, errors = measure(run_legacy, legacy_path, args.workers, args.seconds)
+    print(f"до    (соединение на запрос, журнал отката): {rate:8.1f} заявок/с, {errors} ошибок блокировки")
+    rate, errors = measure(run_pooled, pooled_path, args.workers, args.seconds)
+    print(f"после (пул соединений, WAL):                  {rate:8.1f} заявок/с, {errors} ошибок блокировки")
+
+
+if __name__ == "__main__":
+    main()
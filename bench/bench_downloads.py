@@ -0,0 +1,202 @@
+"""Одновременные скачивания загрузок: отдача воркером против X-Accel-Redirect.
+
+Запуск из корня проекта (нужен gunicorn):
+    python bench/bench_downloads.py --clients 8 --size-mb 20 --rate-kb 8192
+
+Для каждого режима FILE_DELIVERY запускается gunicorn (gunicorn.conf.py) на
+копии проекта с одним сканом size-mb в хранилище загрузок. Модератор
+(--clients потоков) скачивает его, читая не быстрее rate-kb КБ/с; параллельно
+раз в 100 мс запрашивается /live.
+
+app     - клиенты обращаются к gunicorn напрямую (как в docker-compose), файл
+          отдаёт воркер.
+x-accel - перед gunicorn стоит простой прокси из этого скрипта, который, как
+          nginx с internal-location, сам отдаёт файл по X-Accel-Redirect;
+          воркер только проверяет вход и отвечает заголовками.
+"""
+import argparse
+import http.client
+import http.server
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from urllib.parse import unquote
+
+from load_uploads import free_port, wait_ready
+from suite import login
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODES = ("app", "x-accel")
+FILE_KEY = "be/nc/" + "bench" * 12 + "0000.pdf"
+CHUNK = 64 * 1024
+# Заголовки запроса, которые прокси передаёт приложению
+FORWARDED_HEADERS = ("cookie", "range", "if-none-match", "if-modified-since")
+
+
+class AccelProxy(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, upstream_port, locations):
+        super().__init__(("127.0.0.1", 0), AccelHandler)
+        self.upstream_port = upstream_port
+        # {префикс X-Accel-Redirect: каталог}
+        self.locations = locations
+
+
+class AccelHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        conn = http.client.HTTPConnection("127.0.0.1", self.server.upstream_port, timeout=60)
+        conn.request("GET", self.path, headers={k: v for k, v in self.headers.items() if k.lower() in FORWARDED_HEADERS})
+        upstream = conn.getresponse()
+        accel = upstream.getheader("X-Accel-Redirect")
+        if accel is None:
+            self.send_response(upstream.status)
+            for name, value in upstream.getheaders():
+                if name.lower() not in ("connection", "transfer-encoding", "server", "date"):
+                    self.send_header(name, value)
+            self.end_headers()
+            shutil.copyfileobj(upstream, self.wfile, CHUNK)
+            conn.close()
+            return
+
+        upstream.read()
+        conn.close()
+        path = None
+        for prefix, directory in self.server.locations.items():
+            if accel.startswith(prefix):
+                path = os.path.join(directory, unquote(accel[len(prefix):]))
+        if path is None or not os.path.isfile(path):
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", upstream.getheader("Content-Type"))
+        self.send_header("Content-Length", str(os.path.getsize(path)))
+        self.send_header("Cache-Control", upstream.getheader("Cache-Control"))
+        self.end_headers()
+        with open(path, "rb") as f:
+            shutil.copyfileobj(f, self.wfile, CHUNK)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def download(port, cookie, rate, results):
+    start = time.perf_counter()
+    received = 0
+    try:
+        conn = http.client.HTTPConnection("127.0.0.1", port, timeout=300)
+        conn.request("GET", "/" + FILE_KEY, headers={"Cookie": cookie})
+        response = conn.getresponse()
+        while True:
+            chunk = response.read(CHUNK)
+            if not chunk:
+                break
+            received += len(chunk)
+            time.sleep(len(chunk) / rate)
+        conn.close()
+        status = response.status
+    except OSError as e:
+        status = type(e).__name__
+    results.append((status, received, time.perf_counter() - start))
+
+
+def probe(port, stop, latencies):
+    while not stop.is_set():
+        start = time.perf_counter()
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+            conn.request("GET", "/live")
+            conn.getresponse().read()
+            conn.close()
+            latencies.append(time.perf_counter() - start)
+        except OSError:
+            latencies.append(float("inf"))
+        stop.wait(0.1)
+
+
+def run(mode, args):
+    workdir = tempfile.mkdtemp(prefix=f"downloads-{mode}-")
+    proxy = None
+    try:
+        app_dir = os.path.join(workdir, "app")
+        shutil.copytree(ROOT, app_dir, ignore=shutil.ignore_patterns(".git", "uploads", "*.db", "*.db-*", "bench",
+                                                                      "__pycache__", "*.json"))
+        upload_dir = os.path.join(app_dir, "uploads")
+        os.makedirs(os.path.join(upload_dir, os.path.dirname(FILE_KEY)))
+        with open(os.path.join(upload_dir, FILE_KEY), "wb") as f:
+            f.write(os.urandom(args.size_mb * 1024 * 1024))
+
+        port = free_port()
+        env = dict(os.environ, GUNICORN_BIND=f"127.0.0.1:{port}", GUNICORN_WORKERS=str(args.workers),
+                   GUNICORN_WORKER_CLASS=args.worker_class, GUNICORN_LOG_LEVEL="warning",
+                   DB_PATH=os.path.join(workdir, "bench.db"), DOCS_PATH=os.path.join(workdir, "docs"),
+                   METRICS_DIR=os.path.join(workdir, "metrics"), TEMPLATE_CACHE_DIR=os.path.join(workdir, "jinja"),
+                   LOG_LEVEL="WARNING", FILE_DELIVERY=mode)
+        subprocess.run([sys.executable, "-c", "import db"], cwd=app_dir, env=env, check=True)
+        log = open(os.path.join(workdir, "gunicorn.log"), "w")
+        process = subprocess.Popen([sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "chinaekb-forms:app"],
+                                   cwd=app_dir, env=env, stdout=log, stderr=subprocess.STDOUT)
+        try:
+            wait_ready(port, process)
+            cookie = login(port)
+            client_port = port
+            if mode == "x-accel":
+                proxy = AccelProxy(port, {"/_protected/uploads/": upload_dir})
+                threading.Thread(target=proxy.serve_forever, daemon=True).start()
+                client_port = proxy.server_address[1]
+
+            results, latencies = [], []
+            stop = threading.Event()
+            prober = threading.Thread(target=probe, args=(client_port, stop, latencies))
+            prober.start()
+            start = time.perf_counter()
+            clients = [threading.Thread(target=download, args=(client_port, cookie, args.rate_kb * 1024, results))
+                       for _ in range(args.clients)]
+            for client in clients:
+                client.start()
+            for client in clients:
+                client.join()
+            elapsed = time.perf_counter() - start
+            stop.set()
+            prober.join()
+        finally:
+            if proxy is not None:
+                proxy.shutdown()
+            process.terminate()
+            process.wait(30)
+            log.close()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    size = args.size_mb * 1024 * 1024
+    ok = [duration for status, received, duration in results if status == 200 and received == size]
+    finite = sorted(i for i in latencies if i != float("inf"))
+    print(f"{mode:7} скачано {len(ok)}/{args.clients} за {elapsed:6.1f} с  "
+          f"{len(ok) * args.size_mb / elapsed:7.2f} МБ/с  "
+          f"скачивание p50 {statistics.median(ok) if ok else 0:5.1f} с макс {max(ok) if ok else 0:5.1f} с  "
+          f"/live p50 {statistics.median(finite) * 1000 if finite else 0:7.1f} мс "
+          f"макс {finite[-1] * 1000 if finite else 0:7.1f} мс без ответа {len(latencies) - len(finite)}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clients", type=int, default=8, help="число одновременных скачиваний")
+    parser.add_argument("--size-mb", type=int, default=20, help="размер файла, МБ")
+    parser.add_argument("--rate-kb", type=int, default=8192, help="скорость чтения одного клиента, КБ/с")
+    parser.add_argument("--workers", type=int, default=2, help="число воркеров gunicorn")
+    parser.add_argument("--worker-class", default="sync", choices=["sync", "gevent"], help="класс воркеров gunicorn")
+    parser.add_argument("--only", choices=MODES, help="запустить только один режим отдачи")
+    args = parser.parse_args()
+
+    for mode in MODES:
+        if args.only is None or args.only == mode:
+            run(mode, args)
+
+
+if __name__ == "__main__":
+    main()
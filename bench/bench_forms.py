@@ -0,0 +1,118 @@
+"""Микробенчмарк обработки заявки: разбор формы и полный POST.
+
+Запуск из корня проекта:
+    python bench/bench_forms.py --iterations 20000 --posts 500
+
+1. Разбор полей формы: построчный код старых маршрутов (по вызову
+   flask.request.form.get(...) на каждое поле) против плана FormSpec.
+2. POST /exam_children_over14 через тестовый клиент Flask на временной базе:
+   разбор multipart, сохранение файла, INSERT студента и представителя.
+"""
+import argparse
+import io
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def form_data():
+    data = {}
+    for prefix in ("student", "client"):
+        data.update({
+            prefix + "name-lastname": " ИВАНОВ ", prefix + "name-name": "иван", prefix + "name-surname": "Иванович",
+            prefix + "birth": "2010-01-01", prefix + "address": "г. Екатеринбург", prefix + "gender": "male",
+            prefix + "snils": "123-456-789 00", prefix + "id-serial": "6500", prefix + "id-number": "123456",
+            prefix + "id-by": "ОВД", prefix + "id-issued": "2020-01-01", prefix + "bank": "",
+            prefix + "phone": "+79000000000", prefix + "email": "test@example.com",
+        })
+    data["examselection"] = "3"
+    data["examdate"] = "2024-05-01"
+    return data
+
+
+def legacy_rows(form):
+    # Извлечение полей так, как это делали маршруты до submissions.py
+    get = form.get
+    student = (
+        get('studentname-lastname').strip().lower().capitalize(), get('studentname-name').strip().lower().capitalize(),
+        get('studentname-surname').strip().lower().capitalize(), str(get('studentbirth')), get('studentaddress'),
+        get('studentgender'), get('studentsnils'), "over14", "passport", get('studentid-serial'),
+        get('studentid-number'), get('studentid-by'), str(get('studentid-issued')), get('studentbank'),
+        get('studentphone'), get('studentemail'), "Экзамен для детей (от 14 до 18 лет)", get('examselection'),
+        get('examdate'), "на проверке",
+    )
+    representative = (
+        get('clientname-lastname').strip().lower().capitalize(), get('clientname-name').strip().lower().capitalize(),
+        get('clientname-surname').strip().lower().capitalize(), str(get('clientbirth')), get('clientaddress'),
+        get('clientgender'), get('clientsnils'), get('clientid-serial'), get('clientid-number'), get('clientid-by'),
+        str(get('clientid-issued')), get('clientbank'), get('clientphone'), get('clientemail'),
+    )
+    return student, representative
+
+
+def bench_rows(iterations):
+    from werkzeug.datastructures import ImmutableMultiDict
+    import submissions
+
+    form = ImmutableMultiDict(form_data())
+    spec = next(i for i in submissions.FORMS if i.name == "exam_children_over14")
+    legacy = legacy_rows(form)
+    assert (tuple(spec.rows(form)[0]), tuple(spec.rows(form)[1])) == legacy
+
+    for name, func in (("старый", lambda: legacy_rows(form)), ("FormSpec", lambda: spec.rows(form))):
+        start = time.perf_counter()
+        for _ in range(iterations):
+            func()
+        elapsed = time.perf_counter() - start
+        print(f"разбор {name:9} {elapsed / iterations * 1e6:8.2f} мкс/форма")
+
+
+def bench_post(posts):
+    import importlib.util
+    import logging
+    spec = importlib.util.spec_from_file_location("chinaekb_forms", os.path.join(ROOT, "chinaekb-forms.py"))
+    app_module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(app_module)
+    logging.getLogger().setLevel(logging.WARNING)
+    client = app_module.app.test_client()
+    url = app_module.BASE_URL + "/exam_children_over14"
+
+    timings = []
+    for i in range(posts):
+        data = form_data()
+        # Половина файлов одинаковые - как повторно загруженные сканы
+        data["studentfiles"] = (io.BytesIO(b"%PDF-1.4 " + str(i % (posts // 2 or 1)).encode() * 1024), "scan.pdf")
+        start = time.perf_counter()
+        response = client.post(url, data=data, content_type="multipart/form-data")
+        timings.append(time.perf_counter() - start)
+        assert response.status_code == 302, response.data[:200]
+
+    timings.sort()
+    print(f"POST   {posts} запросов: p50 {timings[len(timings) // 2] * 1000:.2f} мс, "
+          f"p99 {timings[int(len(timings) * 0.99) - 1] * 1000:.2f} мс, {posts / sum(timings):.1f} запросов/с")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=20000, help="число разборов формы")
+    parser.add_argument("--posts", type=int, default=500, help="число POST-запросов")
+    args = parser.parse_args()
+
+    # База, загрузки и документы - во временном каталоге; db создаёт схему при импорте
+    tmp = tempfile.mkdtemp()
+    os.environ["DB_PATH"] = os.path.join(tmp, "bench.db")
+    os.environ["OUTBOX_WORKER"] = "0"
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    os.symlink(os.path.join(ROOT, "contracts_templates"), os.path.join(tmp, "contracts_templates"))
+    os.chdir(tmp)
+    sys.path.insert(0, ROOT)
+
+    bench_rows(args.iterations)
+    bench_post(args.posts)
+
+
+if __name__ == "__main__":
+    main()
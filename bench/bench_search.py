@@ -0,0 +1,78 @@
+"""Время поиска заявок по индексу FTS5 на большой базе.
+
+Запуск из корня проекта:
+    python bench/bench_search.py --rows 100000
+
+Создаёт временную базу, заполняет students (с представителями) и adult_students
+случайными заявками (индекс поддерживают триггеры) и печатает p50/max
+времени db.search_applications для типичных запросов модератора.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+LAST_NAMES = ["Иванов", "Петров", "Сидоров", "Смирнов", "Кузнецов", "Попов", "Васильев", "Соколов", "Михайлов",
+              "Новиков", "Фёдоров", "Морозов", "Волков", "Алексеев", "Лебедев", "Семёнов", "Егоров", "Павлов"]
+FIRST_NAMES = ["Иван", "Пётр", "Алексей", "Сергей", "Андрей", "Дмитрий", "Михаил", "Никита", "Артём", "Егор"]
+MIDDLE_NAMES = ["Иванович", "Петрович", "Сергеевич", "Андреевич", "Дмитриевич", "Алексеевич"]
+QUERIES = ["Семенов", "федоров пет", "иван", "Кузнецов Алексей Сергеевич", "7912", "mail", "4510 12"]
+
+
+def person(rnd, i):
+    return (rnd.choice(LAST_NAMES) + ("" if i % 3 else str(i)), rnd.choice(FIRST_NAMES), rnd.choice(MIDDLE_NAMES),
+            "2000-01-01", "г. Екатеринбург", "male", f"{rnd.randrange(10 ** 11):011d}",
+            f"{rnd.randrange(10 ** 4):04d}", f"{rnd.randrange(10 ** 6):06d}", "ОВД", "2015-01-01", "",
+            f"+79{rnd.randrange(10 ** 9):09d}", f"user{i}@mail.ru")
+
+
+def seed(db, rows):
+    rnd = random.Random(1)
+    with db.transaction() as conn:
+        for i in range(rows // 2):
+            p = person(rnd, i)
+            conn.execute('''
+                INSERT INTO adult_students (last_name, first_name, middle_name, birth_date, address, gender, snils, id_serial, id_number, id_issued_by, id_issued_date, bank_details, phone, email, id_type, study_plan, submission_date)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 'passport', 'Экзамен для взрослых', '2024-01-01 10:00:00')
+            ''', p)
+            p = person(rnd, i)
+            student_id = conn.execute('''
+                INSERT INTO students (last_name, first_name, middle_name, birth_date, address, gender, snils, id_serial, id_number, id_issued_by, id_issued_date, bank_details, phone, email, age_group, id_type, study_plan, submission_date)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 'over14', 'passport', 'Экзамен для детей (от 14 до 18 лет)', '2024-01-01 10:00:00')
+            ''', p).lastrowid
+            conn.execute('''
+                INSERT INTO representatives (student_id, last_name, first_name, middle_name, birth_date, address, gender, snils, id_serial, id_number, id_issued_by, id_issued_date, bank_details, phone, email)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (student_id,) + person(rnd, i))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=100000, help="число заявок (поровну взрослых и детей)")
+    parser.add_argument("--repeat", type=int, default=50, help="число повторов каждого запроса")
+    args = parser.parse_args()
+
+    os.environ["DB_PATH"] = os.path.join(tempfile.mkdtemp(), "search.db")
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    import db
+
+    start = time.perf_counter()
+    seed(db, args.rows)
+    print(f"создано {args.rows} заявок за {time.perf_counter() - start:.1f} с")
+
+    with db.connection() as conn:
+        for query in QUERIES:
+            timings = []
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                found = db.search_applications(conn, query)
+                timings.append(time.perf_counter() - start)
+            timings.sort()
+            print(f"{query!r:32} {len(found):3} найдено  p50 {timings[len(timings) // 2] * 1000:6.2f} мс"
+                  f"  макс {timings[-1] * 1000:6.2f} мс")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""Холодный старт воркера: импорт приложения и время первого ответа.
+
+Запуск из корня проекта:
+    python bench/bench_startup.py --runs 5
+
+Каждый замер - отдельный процесс (как новый воркер gunicorn после
+перевыкладки или перезапуска контейнера) на временной базе:
+1. lazy        - без прогрева и без кэша байткода (поведение до template_cache.py);
+2. prewarm     - прогрев при импорте, кэш байткода пуст (первый воркер);
+3. prewarm+bcc - прогрев из заполненного кэша байткода (остальные воркеры, рестарт).
+Выводится медиана времени импорта и первого ответа по страницам форм
+и компиляции шаблона договора при первой выдаче.
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PAGES = ("/exam_children_over14", "/education_children_over14", "/forms")
+CONTRACT = "contract_education_children_after14.html"
+
+
+def child():
+    import importlib.util
+    import logging
+    logging.disable(logging.INFO)
+    sys.path.insert(0, ROOT)
+
+    start = time.perf_counter()
+    spec = importlib.util.spec_from_file_location("chinaekb_forms", os.path.join(ROOT, "chinaekb-forms.py"))
+    app_module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(app_module)
+    result = {"импорт приложения": time.perf_counter() - start}
+
+    client = app_module.app.test_client()
+    for page in PAGES:
+        start = time.perf_counter()
+        response = client.get(app_module.BASE_URL + page)
+        assert response.status_code == 200, page
+        result[page] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    app_module.contract_renderer.env.get_template(CONTRACT)
+    result[CONTRACT] = time.perf_counter() - start
+    print(json.dumps(result))
+
+
+def run(env, runs):
+    samples = []
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, os.path.abspath(__file__), "--child"], cwd=ROOT, env=env,
+                                check=True, capture_output=True, text=True).stdout
+        samples.append(json.loads(output.strip().splitlines()[-1]))
+    return {key: statistics.median(i[key] for i in samples) for key in samples[0]}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5, help="число запусков каждого варианта")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        return child()
+
+    tmp = tempfile.mkdtemp(prefix="bench-startup-")
+    try:
+        base_env = dict(os.environ, DB_PATH=os.path.join(tmp, "bench.db"), METRICS_ENABLED="0",
+                        DOCS_PATH=os.path.join(tmp, "docs"))
+        cache_dir = os.path.join(tmp, "jinja")
+        scenarios = (
+            ("lazy", dict(base_env, TEMPLATE_PREWARM="0", TEMPLATE_CACHE_DIR="")),
+            ("prewarm", dict(base_env, TEMPLATE_PREWARM="1", TEMPLATE_CACHE_DIR=cache_dir)),
+            ("prewarm+bcc", dict(base_env, TEMPLATE_PREWARM="1", TEMPLATE_CACHE_DIR=cache_dir)),
+        )
+        results = {}
+        for name, env in scenarios:
+            if name == "prewarm":
+                # Каждый запуск - с пустым кэшем
+                runs = []
+                for _ in range(args.runs):
+                    shutil.rmtree(cache_dir, ignore_errors=True)
+                    runs.append(run(env, 1))
+                results[name] = {key: statistics.median(i[key] for i in runs) for key in runs[0]}
+            else:
+                results[name] = run(env, args.runs)
+
+        keys = list(results["lazy"])
+        print(f"{'':42}" + "".join(f"{name:>14}" for name in results))
+        for key in keys:
+            print(f"{key:42}" + "".join(f"{results[name][key] * 1000:11.1f} мс" for name in results))
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""Проверка, что горячие запросы используют индексы из миграций db.py.
+
+Запуск из корня проекта (по умолчанию на временной копии схемы):
+    python bench/check_query_plans.py [--db chinaekb.db]
+
+Запросы не переписываются здесь вручную: скрипт вызывает сами функции db.py и
+duplicates.py и перехватывает выполненный SQL (set_trace_callback), поэтому
+проверяется именно то, что выполняют страницы. Для каждого запроса печатается
+EXPLAIN QUERY PLAN; скрипт завершается с кодом 1, если ожидаемый индекс не
+используется, таблица читается целиком (SCAN) или для ORDER BY понадобилась
+временная сортировка. Те же проверки выполняет tests/test_query_plans.py.
+"""
+import argparse
+import datetime
+import os
+import sys
+import tempfile
+
+# Шаг плана, означающий сортировку всей выборки вместо чтения по индексу
+TEMP_SORT = "USE TEMP B-TREE"
+# Шаг плана, означающий чтение всей таблицы или индекса
+FULL_SCAN = "SCAN "
+
+
+def checks(db, duplicates):
+    """(название, вызов с соединением, фрагменты, которые должны быть в плане)."""
+    return [
+        ("страница модерации по статусу",
+         lambda conn: db.fetch_applications_page(conn, "students", "на проверке", after=0),
+         ["idx_students_status"]),
+        ("страница модерации по статусу, назад",
+         lambda conn: db.fetch_applications_page(conn, "adult_students", "на проверке", before=1000),
+         ["idx_adult_students_status"]),
+        ("страница модерации, все статусы",
+         lambda conn: db.fetch_applications_page(conn, "students", "all", after=0),
+         ["INTEGER PRIMARY KEY"]),
+        ("счётчик модерации",
+         lambda conn: db.count_applications(conn, "adult_students", "на проверке"),
+         ["idx_adult_students_status"]),
+        ("заявки по id с представителями",
+         lambda conn: db.fetch_applications_by_ids(conn, "students", [1, 2, 3]),
+         ["INTEGER PRIMARY KEY", "idx_representatives_student_id"]),
+        ("заявки взрослых по id",
+         lambda conn: db.fetch_applications_by_ids(conn, "adult_students", [1, 2, 3]),
+         ["INTEGER PRIMARY KEY"]),
+        ("поиск дубликата",
+         lambda conn: duplicates.find_duplicate(conn, "students", "0" * 32, before_id=1000),
+         ["idx_students_fingerprint"]),
+        ("повторная отправка",
+         lambda conn: duplicates.find_resubmission(conn, "adult_students", "0" * 32, datetime.datetime.now(),
+                                                   ("study_plan",), ("",), []),
+         ["idx_adult_students_fingerprint"]),
+        ("диапазон дат подачи",
+         lambda conn: conn.execute("SELECT id FROM students WHERE submission_date >= ?", ("2024-01-01",)).fetchall(),
+         ["idx_students_submission_date"]),
+        ("поиск по ФИО",
+         lambda conn: conn.execute("SELECT id FROM adult_students WHERE last_name = ? AND first_name = ? AND birth_date = ?",
+                                   ("Иванов", "Иван", "2000-01-01")).fetchall(),
+         ["idx_adult_students_name"]),
+    ]
+
+
+def traced(conn, call):
+    """SQL-выражения SELECT, выполненные вызовом call(conn), с подставленными параметрами."""
+    statements = []
+    conn.set_trace_callback(statements.append)
+    try:
+        call(conn)
+    finally:
+        conn.set_trace_callback(None)
+    return [sql for sql in statements if sql.lstrip().upper().startswith("SELECT")]
+
+
+def explain(conn, call, expected):
+    """[(запрос, план, проблемы)] для SELECT, выполненных call(conn); пустой список - запрос не выполнен."""
+    results = []
+    for query in traced(conn, call):
+        plan = [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + query)]
+        problems = [f"нет в плане: {index}" for index in expected if not any(index in step for step in plan)]
+        problems += [f"полный просмотр: {step}" for step in plan if step.startswith(FULL_SCAN)]
+        problems += [f"временная сортировка: {step}" for step in plan if TEMP_SORT in step]
+        results.append((query, plan, problems))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--db", help="путь к существующей базе (по умолчанию - новая временная)")
+    args = parser.parse_args()
+
+    os.environ["DB_PATH"] = os.path.abspath(args.db) if args.db else os.path.join(tempfile.mkdtemp(), "plans.db")
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    import db
+    import duplicates
+
+    failed = 0
+    with db.connection() as conn:
+        print(f"версия схемы: {db.schema_version(conn)}")
+        for name, call, expected in checks(db, duplicates):
+            results = explain(conn, call, expected)
+            if not results:
+                failed += 1
+                print(f"[FAIL] {name}: запрос не выполнен")
+                continue
+            for query, plan, problems in results:
+                failed += bool(problems)
+                print(f"[{'FAIL' if problems else 'ok'}] {name}")
+                print(f"       {' '.join(query.split())}")
+                for step in plan:
+                    print(f"       {step}")
+                for problem in problems:
+                    print(f"       {problem}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+"""Нагрузочный тест: одновременные медленные загрузки файлов на sync и gevent воркерах.
+
+Запуск из корня проекта (нужны gunicorn и gevent):
+    python bench/load_uploads.py --clients 12 --size-mb 4 --rate-kb 1024
+
+Для каждой конфигурации запускается gunicorn (gunicorn.conf.py, параметры -
+через GUNICORN_*) на копии проекта во временном каталоге. Клиенты отправляют
+POST /exam_adult с файлом size-mb, ограничивая скорость rate-kb КБ/с (мобильная
+сеть). Параллельно раз в 100 мс запрашивается /live - видно, отвечает ли сервер,
+пока все воркеры заняты приёмом загрузок.
+"""
+import argparse
+import http.client
+import os
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CONFIGS = (
+    ("sync", {"GUNICORN_WORKER_CLASS": "sync"}),
+    ("gevent", {"GUNICORN_WORKER_CLASS": "gevent"}),
+)
+FIELDS = {
+    "studentname-lastname": "Иванов", "studentname-name": "Иван", "studentname-surname": "Иванович",
+    "studentbirth": "1990-01-01", "studentaddress": "г. Екатеринбург", "studentgender": "male",
+    "studentsnils": "123-456-789 00", "studentid-serial": "6500", "studentid-number": "123456",
+    "studentid-by": "ОВД", "studentid-issued": "2010-01-01", "studentbank": "", "studentphone": "+79000000000",
+    "studentemail": "test@example.com", "examselection": "3", "examdate": "2024-05-01",
+}
+BOUNDARY = "----load-uploads-boundary"
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def multipart(client, size):
+    fields = dict(FIELDS, **{"studentname-lastname": f"Иванов{client}"})
+    head = "".join(f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'
+                   for name, value in fields.items())
+    head += (f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="studentfiles"; filename="scan{client}.pdf"\r\n'
+             f'Content-Type: application/pdf\r\n\r\n')
+    return head.encode(), os.urandom(size), f"\r\n--{BOUNDARY}--\r\n".encode()
+
+
+def upload(port, client, size, rate, results):
+    head, data, tail = multipart(client, size)
+    chunk = 64 * 1024
+    start = time.perf_counter()
+    try:
+        conn = http.client.HTTPConnection("127.0.0.1", port, timeout=300)
+        conn.putrequest("POST", "/exam_adult")
+        conn.putheader("Content-Type", f"multipart/form-data; boundary={BOUNDARY}")
+        conn.putheader("Content-Length", str(len(head) + len(data) + len(tail)))
+        conn.endheaders()
+        conn.send(head)
+        for offset in range(0, len(data), chunk):
+            conn.send(data[offset:offset + chunk])
+            time.sleep(chunk / rate)
+        conn.send(tail)
+        status = conn.getresponse().status
+        conn.close()
+    except OSError as e:
+        status = type(e).__name__
+    results.append((status, time.perf_counter() - start))
+
+
+def probe(port, stop, latencies):
+    while not stop.is_set():
+        start = time.perf_counter()
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+            conn.request("GET", "/live")
+            conn.getresponse().read()
+            conn.close()
+            latencies.append(time.perf_counter() - start)
+        except OSError:
+            latencies.append(float("inf"))
+        stop.wait(0.1)
+
+
+def wait_ready(port, process, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("gunicorn завершился при старте")
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=1)
+            conn.request("GET", "/live")
+            if conn.getresponse().status == 200:
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError("gunicorn не ответил на /live")
+
+
+def run(name, overrides, args):
+    workdir = tempfile.mkdtemp(prefix=f"load-{name}-")
+    try:
+        app_dir = os.path.join(workdir, "app")
+        shutil.copytree(ROOT, app_dir, ignore=shutil.ignore_patterns(".git", "uploads", "*.db", "*.db-*", "bench",
+                                                                      "__pycache__", "*.json"))
+        port = free_port()
+        env = dict(os.environ, GUNICORN_BIND=f"127.0.0.1:{port}", GUNICORN_WORKERS=str(args.workers),
+                   GUNICORN_LOG_LEVEL="warning", DB_PATH=os.path.join(workdir, "load.db"),
+                   DOCS_PATH=os.path.join(workdir, "docs"), METRICS_DIR=os.path.join(workdir, "metrics"),
+                   TEMPLATE_CACHE_DIR=os.path.join(workdir, "jinja"), LOG_LEVEL="WARNING", **overrides)
+        # База и миграции создаются заранее, а не параллельно всеми воркерами
+        subprocess.run([sys.executable, "-c", "import db"], cwd=app_dir, env=env, check=True)
+        log = open(os.path.join(workdir, "gunicorn.log"), "w")
+        process = subprocess.Popen([sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "chinaekb-forms:app"],
+                                   cwd=app_dir, env=env, stdout=log, stderr=subprocess.STDOUT)
+        try:
+            try:
+                wait_ready(port, process)
+            except RuntimeError:
+                with open(log.name) as f:
+                    print(f.read()[-3000:], file=sys.stderr)
+                raise
+            results, latencies = [], []
+            stop = threading.Event()
+            prober = threading.Thread(target=probe, args=(port, stop, latencies))
+            prober.start()
+            start = time.perf_counter()
+            clients = [threading.Thread(target=upload, args=(port, i, args.size_mb * 1024 * 1024,
+                                                             args.rate_kb * 1024, results))
+                       for i in range(args.clients)]
+            for client in clients:
+                client.start()
+            for client in clients:
+                client.join()
+            elapsed = time.perf_counter() - start
+            stop.set()
+            prober.join()
+        finally:
+            process.terminate()
+            process.wait(30)
+            log.close()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    ok = [duration for status, duration in results if status in (200, 302)]
+    finite = sorted(i for i in latencies if i != float("inf"))
+    print(f"{name:7} загружено {len(ok)}/{args.clients} за {elapsed:6.1f} с  "
+          f"{len(ok) * args.size_mb / elapsed:6.2f} МБ/с  {len(ok) / elapsed:5.2f} загрузок/с  "
+          f"загрузка p50 {statistics.median(ok) if ok else 0:5.1f} с макс {max(ok) if ok else 0:5.1f} с  "
+          f"/live p50 {statistics.median(finite) * 1000 if finite else 0:7.1f} мс "
+          f"макс {finite[-1] * 1000 if finite else 0:7.1f} мс без ответа {len(latencies) - len(finite)}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clients", type=int, default=12, help="число одновременных загрузок")
+    parser.add_argument("--size-mb", type=int, default=4, help="размер файла, МБ")
+    parser.add_argument("--rate-kb", type=int, default=1024, help="скорость одного клиента, КБ/с")
+    parser.add_argument("--workers", type=int, default=2, help="число воркеров gunicorn")
+    parser.add_argument("--only", choices=[name for name, _ in CONFIGS], help="запустить только один класс воркеров")
+    args = parser.parse_args()
+
+    for name, overrides in CONFIGS:
+        if args.only is None or args.only == name:
+            run(name, overrides, args)
+
+
+if __name__ == "__main__":
+    main()
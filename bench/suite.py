@@ -0,0 +1,393 @@
+"""Набор бенчмарков подачи заявок и модерации с результатами в JSON.
+
+Запуск из корня проекта (нужен gunicorn, для --worker-class gevent - gevent):
+    python bench/suite.py --size 100000 --requests 500 --concurrency 8
+    python bench/suite.py --size 10000 --compare bench/results/<прошлый запуск>.json
+
+1. База заполняется синтетическими заявками (--size: 10000, 100000, 1000000;
+   поровну несовершеннолетних с представителями и взрослых). Заполненная база
+   кэшируется в --seed-dir и копируется для каждого запуска.
+2. Запускается gunicorn (gunicorn.conf.py) на копии проекта и поддельный
+   сервер 1С, отвечающий 200 на любой POST.
+3. Сценарии выполняются по очереди, --requests запросов в --concurrency потоков:
+   POST шести форм с файлом, страницы /moderation, карточка заявки, одобрение
+   (с доставкой в поддельную 1С).
+4. Для каждого сценария - p50/p90/p99/max, запросов в секунду и ошибки;
+   результат пишется в bench/results/<время>-<size>.json.
+"""
+import argparse
+import contextlib
+import datetime
+import hashlib
+import http.client
+import http.server
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+
+from load_uploads import BOUNDARY, free_port, wait_ready
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(ROOT, "bench", "results")
+SEED_BATCH = 10000
+UPLOAD_SIZE = 200 * 1024
+FORMS = ("education_adult", "exam_adult", "education_children_under14", "education_children_over14",
+         "exam_children_under14", "exam_children_over14")
+LAST_NAMES = ("Иванов", "Петров", "Сидоров", "Кузнецов", "Смирнов", "Попов", "Васильев", "Соколов", "Михайлов",
+              "Новиков", "Фёдоров", "Морозов", "Волков", "Алексеев", "Лебедев", "Семёнов", "Егоров", "Павлов")
+FIRST_NAMES = ("Иван", "Пётр", "Анна", "Мария", "Алексей", "Ольга", "Дмитрий", "Елена", "Сергей", "Наталья")
+MIDDLE_NAMES = ("Иванович", "Петрович", "Сергеевич", "Алексеевич", "Дмитриевич", "Андреевич")
+STATUSES = ("на проверке",) * 7 + ("проверено",) * 2 + ("отклонено",)
+STUDY_PLANS = {
+    "students": ("Практический базовый курс китайского языка для детей", "Экзамен для детей (до 14 лет)",
+                 "Экзамен для детей (от 14 до 18 лет)"),
+    "adult_students": ("Практический базовый курс китайского языка", "Экзамен для взрослых"),
+}
+
+
+# --- заполнение базы ---------------------------------------------------------
+
+def _person(rnd, number):
+    return {
+        "last_name": rnd.choice(LAST_NAMES) + ("а" if rnd.random() < 0.5 else ""),
+        "first_name": rnd.choice(FIRST_NAMES), "middle_name": rnd.choice(MIDDLE_NAMES),
+        "birth_date": f"{rnd.randint(1960, 2018)}-{rnd.randint(1, 12):02}-{rnd.randint(1, 28):02}",
+        "address": f"г. Екатеринбург, ул. Ленина, д. {rnd.randint(1, 200)}", "gender": rnd.choice(("male", "female")),
+        "snils": f"{number:011}", "id_type": "passport", "id_serial": f"{rnd.randint(6500, 6599)}",
+        "id_number": f"{number % 1000000:06}", "id_issued_by": "ОВД", "id_issued_date": "2015-01-01",
+        "bank_details": "", "phone": f"+79{number % 1000000000:09}", "email": f"user{number}@example.com",
+    }
+
+
+def seed(size):
+    """Заполняет базу DB_PATH (вызывается в отдельном процессе с нужным DB_PATH)."""
+    sys.path.insert(0, ROOT)
+    import db
+    import duplicates
+    import submissions
+
+    rnd = random.Random(size)
+    start = datetime.datetime(2023, 1, 1)
+    number = 0
+    for table_name in db.APPLICATION_TABLES:
+        columns = submissions.TABLE_COLUMNS[table_name]
+        total = size // 2 + (size % 2 if table_name == "students" else 0)
+        for offset in range(0, total, SEED_BATCH):
+            students, representatives = [], []
+            for _ in range(min(SEED_BATCH, total - offset)):
+                number += 1
+                person = _person(rnd, number)
+                person.update({
+                    "age_group": rnd.choice(("under14", "over14")), "study_plan": rnd.choice(STUDY_PLANS[table_name]),
+                    "exam_selection": str(rnd.randint(1, 15)), "exam_date": "2024-05-01",
+                    "status": rnd.choice(STATUSES),
+                    "submission_date": (start + datetime.timedelta(seconds=number * 60)).strftime('%Y-%m-%d %H:%M:%S'),
+                    "file_paths": json.dumps([f"seed/{number}.pdf"]), "duplicate_of": None,
+                })
+                person["fingerprint"] = duplicates.fingerprint(*(person[i] for i in duplicates.FINGERPRINT_COLUMNS))
+                students.append(tuple(person[i] for i in columns))
+                if table_name == "students":
+                    representatives.append(_person(rnd, number + 10 ** 9))
+            with db.transaction() as conn:
+                first_id = conn.execute(f"SELECT COALESCE(MAX(id), 0) + 1 FROM {table_name}").fetchone()[0]
+                conn.executemany(submissions.INSERTS[table_name], students)
+                if representatives:
+                    conn.executemany(submissions.INSERTS["representatives"], [
+                        (first_id + i,) + tuple(person[c] for c in submissions.TABLE_COLUMNS["representatives"][1:])
+                        for i, person in enumerate(representatives)
+                    ])
+        print(f"{table_name}: {total}", file=sys.stderr)
+    with db.connection() as conn:
+        conn.execute("PRAGMA optimize")
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+
+def seeded_db(size, seed_dir):
+    # Имя зависит от схемы и генератора: после изменения db.py/submissions.py база пересоздаётся
+    digest = hashlib.sha256()
+    for name in ("db.py", "submissions.py", "duplicates.py", os.path.join("bench", "suite.py")):
+        with open(os.path.join(ROOT, name), "rb") as f:
+            digest.update(f.read())
+    path = os.path.join(seed_dir, f"seed-{size}-{digest.hexdigest()[:12]}.db")
+    if not os.path.exists(path):
+        os.makedirs(seed_dir, exist_ok=True)
+        tmp_path = path + ".tmp"
+        for i in (tmp_path, tmp_path + "-wal", tmp_path + "-shm"):
+            if os.path.exists(i):
+                os.remove(i)
+        start = time.perf_counter()
+        subprocess.run([sys.executable, os.path.abspath(__file__), "--seed-only", "--size", str(size)],
+                       cwd=ROOT, env=dict(os.environ, DB_PATH=tmp_path, METRICS_ENABLED="0"), check=True)
+        os.replace(tmp_path, path)
+        print(f"база на {size} заявок заполнена за {time.perf_counter() - start:.1f} с", file=sys.stderr)
+    return path
+
+
+# --- поддельная 1С -----------------------------------------------------------
+
+class Fake1C(http.server.BaseHTTPRequestHandler):
+    received = 0
+    lock = threading.Lock()
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        with Fake1C.lock:
+            Fake1C.received += 1
+        self.send_response(200)
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write(b"ok")
+
+    def log_message(self, *args):
+        pass
+
+
+# --- клиент ------------------------------------------------------------------
+
+class Client:
+    """HTTP-клиент одного потока: постоянное соединение и cookie сессии модератора."""
+
+    def __init__(self, port, cookie=None):
+        self.port = port
+        self.cookie = cookie
+        self.conn = None
+
+    def request(self, method, path, body=None, headers=None):
+        headers = dict(headers or {})
+        if self.cookie:
+            headers["Cookie"] = self.cookie
+        for attempt in (0, 1):
+            if self.conn is None:
+                self.conn = http.client.HTTPConnection("127.0.0.1", self.port, timeout=60)
+            try:
+                self.conn.request(method, path, body=body, headers=headers)
+                response = self.conn.getresponse()
+                response.read()
+                return response
+            except (http.client.HTTPException, ConnectionError):
+                # Сервер закрыл keep-alive соединение - повтор на новом
+                self.conn.close()
+                self.conn = None
+                if attempt:
+                    raise
+
+
+def login(port):
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+    conn.request("POST", "/login", body="username=moder1&password=password1",
+                 headers={"Content-Type": "application/x-www-form-urlencoded"})
+    response = conn.getresponse()
+    response.read()
+    cookies = [i.split(";", 1)[0] for name, i in response.getheaders() if name.lower() == "set-cookie"]
+    if response.status != 302 or not cookies:
+        raise RuntimeError(f"Не удалось войти: {response.status}")
+    return "; ".join(cookies)
+
+
+def form_body(form, number):
+    fields = {}
+    for prefix in (("student", "client") if "children" in form else ("student",)):
+        fields.update({
+            prefix + "name-lastname": f"Бенчмарков{number}", prefix + "name-name": "Иван",
+            prefix + "name-surname": "Иванович", prefix + "birth": "2010-01-01", prefix + "address": "г. Екатеринбург",
+            prefix + "gender": "male", prefix + "snils": "123-456-789 00", prefix + "id-serial": "6500",
+            prefix + "id-number": f"{number:06}", prefix + "id-by": "ОВД", prefix + "id-issued": "2020-01-01",
+            prefix + "bank": "", prefix + "phone": "+79000000000", prefix + "email": "bench@example.com",
+        })
+    fields.update({"examselection": "3", "examdate": "2024-05-01"})
+    body = "".join(f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'
+                   for name, value in fields.items()).encode()
+    body += (f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="studentfiles"; filename="scan{number}.pdf"\r\n'
+             f'Content-Type: application/pdf\r\n\r\n').encode()
+    # Случайное содержимое: одинаковые файлы хранилище загрузок не записывает повторно
+    body += b"%PDF-1.4\n" + os.urandom(UPLOAD_SIZE) + f"\r\n--{BOUNDARY}--\r\n".encode()
+    return body
+
+
+def run_scenario(port, cookie, requests, concurrency, make_request):
+    """make_request(client, i) -> ожидаемый ли ответ. Возвращает сводку по задержкам."""
+    local = threading.local()
+    latencies = []
+    errors = 0
+    lock = threading.Lock()
+
+    def one(i):
+        nonlocal errors
+        client = getattr(local, "client", None)
+        if client is None:
+            client = local.client = Client(port, cookie)
+        start = time.perf_counter()
+        try:
+            ok = make_request(client, i)
+        except OSError:
+            ok = False
+        elapsed = time.perf_counter() - start
+        with lock:
+            latencies.append(elapsed)
+            if not ok:
+                errors += 1
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as executor:
+        list(executor.map(one, range(requests)))
+    wall = time.perf_counter() - start
+    ordered = sorted(latencies)
+
+    def percentile(p):
+        return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))] * 1000
+
+    return {
+        "requests": requests, "errors": errors, "seconds": round(wall, 3), "rps": round(requests / wall, 2),
+        "mean_ms": round(statistics.mean(ordered) * 1000, 2), "p50_ms": round(percentile(50), 2),
+        "p90_ms": round(percentile(90), 2), "p99_ms": round(percentile(99), 2), "max_ms": round(ordered[-1] * 1000, 2),
+    }
+
+
+def scenarios(args, size):
+    students = size // 2 + size % 2
+    adults = size // 2
+    rnd = random.Random(0)
+
+    def ids(table_name, count):
+        return [rnd.randint(1, students if table_name == "students" else adults) for _ in range(count)]
+
+    result = []
+    for form in FORMS:
+        headers = {"Content-Type": f"multipart/form-data; boundary={BOUNDARY}"}
+        result.append((f"post_{form}", False, lambda c, i, form=form, headers=headers:
+                       c.request("POST", f"/{form}", form_body(form, i), headers).status == 302))
+
+    for table_name in ("students", "adult_students"):
+        cursors = ids(table_name, args.requests)
+        status = urllib.parse.quote("на проверке")
+        result.append((f"moderation_{table_name}", True, lambda c, i, t=table_name, cursors=cursors, status=status:
+                       c.request("GET", f"/moderation?table_name={t}&status={status}&limit=20"
+                                        f"{'' if i % 4 == 0 else f'&after={cursors[i]}'}").status == 200))
+        details = ids(table_name, args.requests)
+        result.append((f"details_{table_name}", True, lambda c, i, t=table_name, details=details:
+                       c.request("GET", f"/moderation/{t}/student/{details[i]}").status == 200))
+
+    approve = ids("adult_students", args.requests)
+    result.append(("approve_adult_students", True, lambda c, i, approve=approve:
+                   c.request("POST", f"/moderation/adult_students/student/{approve[i]}", "action=approve",
+                             {"Content-Type": "application/x-www-form-urlencoded"}).status == 302))
+    return result
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(current, previous_path):
+    with open(previous_path) as f:
+        previous = json.load(f)
+    print(f"\nсравнение с {previous_path} ({previous['meta'].get('revision')}):")
+    for name, result in current["scenarios"].items():
+        old = previous["scenarios"].get(name)
+        if old is None:
+            continue
+        print(f"{name:36} p50 {old['p50_ms']:8.2f} -> {result['p50_ms']:8.2f} ms  "
+              f"p99 {old['p99_ms']:8.2f} -> {result['p99_ms']:8.2f} ms  rps {old['rps']:8.1f} -> {result['rps']:8.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size", type=int, default=10000, help="заявок в базе (10000, 100000, 1000000)")
+    parser.add_argument("--requests", type=int, default=300, help="запросов на сценарий")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--worker-class", default="sync")
+    parser.add_argument("--seed-dir", default=os.path.join(tempfile.gettempdir(), "chinaekb-bench"))
+    parser.add_argument("--output", help="файл результата (по умолчанию bench/results/<время>-<size>.json)")
+    parser.add_argument("--compare", help="JSON прошлого запуска для сравнения")
+    parser.add_argument("--seed-only", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.seed_only:
+        return seed(args.size)
+
+    seed_path = seeded_db(args.size, args.seed_dir)
+    fake_1c = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Fake1C)
+    threading.Thread(target=fake_1c.serve_forever, daemon=True).start()
+
+    workdir = tempfile.mkdtemp(prefix="bench-suite-")
+    try:
+        app_dir = os.path.join(workdir, "app")
+        shutil.copytree(ROOT, app_dir, ignore=shutil.ignore_patterns(".git", "uploads", "*.db", "*.db-*", "bench",
+                                                                      "__pycache__", "*.json"))
+        db_path = os.path.join(workdir, "bench.db")
+        shutil.copyfile(seed_path, db_path)
+        port = free_port()
+        env = dict(os.environ, GUNICORN_BIND=f"127.0.0.1:{port}", GUNICORN_WORKERS=str(args.workers),
+                   GUNICORN_WORKER_CLASS=args.worker_class, GUNICORN_LOG_LEVEL="warning", DB_PATH=db_path,
+                   DOCS_PATH=os.path.join(workdir, "docs"), METRICS_DIR=os.path.join(workdir, "metrics"),
+                   TEMPLATE_CACHE_DIR=os.path.join(workdir, "jinja"), LOG_LEVEL="WARNING",
+                   ONEC_URL=f"http://127.0.0.1:{fake_1c.server_address[1]}/put_contract", OUTBOX_BACKOFF="1")
+        log = open(os.path.join(workdir, "gunicorn.log"), "w")
+        process = subprocess.Popen([sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "chinaekb-forms:app"],
+                                   cwd=app_dir, env=env, stdout=log, stderr=subprocess.STDOUT)
+        try:
+            wait_ready(port, process, timeout=120)
+            cookie = login(port)
+            results = {}
+            for name, authorized, make_request in scenarios(args, args.size):
+                results[name] = run_scenario(port, cookie if authorized else None, args.requests, args.concurrency,
+                                             make_request)
+                r = results[name]
+                print(f"{name:36} p50 {r['p50_ms']:8.2f} ms  p99 {r['p99_ms']:8.2f} ms  "
+                      f"{r['rps']:8.1f} req/s  errors {r['errors']}")
+
+            # Доставка одобренных заявок фоновым обработчиком outbox
+            deadline = time.monotonic() + 60
+            start = time.perf_counter()
+            while time.monotonic() < deadline:
+                with contextlib.closing(sqlite3.connect(db_path, timeout=5)) as conn:
+                    pending = conn.execute("SELECT COUNT(*) FROM outbox WHERE state IN ('pending', 'sending')").fetchone()[0]
+                if not pending:
+                    break
+                time.sleep(0.2)
+            results["outbox_drain"] = {"delivered": Fake1C.received, "pending": pending,
+                                       "seconds": round(time.perf_counter() - start, 3)}
+            print(f"{'outbox_drain':36} доставлено в 1С {Fake1C.received}, осталось {pending}")
+        finally:
+            process.terminate()
+            process.wait(30)
+            log.close()
+    finally:
+        fake_1c.shutdown()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        "meta": {
+            "timestamp": datetime.datetime.now().isoformat(timespec="seconds"), "revision": git_revision(),
+            "size": args.size, "requests": args.requests, "concurrency": args.concurrency, "workers": args.workers,
+            "worker_class": args.worker_class, "python": platform.python_version(), "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+        },
+        "scenarios": results,
+    }
+    output = args.output or os.path.join(RESULTS_DIR, f"{datetime.datetime.now():%Y%m%d-%H%M%S}-{args.size}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"результат: {output}")
+    if args.compare:
+        compare(report, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,30 @@
-import requests
 from flask import Flask, render_template, request, redirect, url_for, current_app, session
 from flask_login import LoginManager, UserMixin, login_user, login_required, logout_user, current_user
-import sqlite3
 import flask
 import json
-import datetime
 import os
 import shutil
+import werkzeug.security
 
-from werkzeug.utils import secure_filename
-
+import archive
+import contracts
 import db
+import details_cache
+import exams
+import export
+import file_delivery
+from docs_sweeper import DocsSweeper
+import health
+import images
+import logs
+import metrics
+import outbox
+import static_assets
+import submissions
+import template_cache
+import uploads
 import logging
+import datetime
 from datetime import timedelta
 from math import ceil
 from flask import jsonify, request
@@ -21,11 +34,13 @@ BASE_URL = os.environ["BASE_URL"] if "BASE_URL" in os.environ else ""
 DOCS_PATH = os.environ["DOCS_PATH"] if "DOCS_PATH" in os.environ else "docs"
 DOCS_PATH = DOCS_PATH[:-1] if DOCS_PATH[-1] == "/" else DOCS_PATH
 CONTRACTS_PATH = os.environ["CONTRACTS_PATH"] if "CONTRACTS_PATH" in os.environ else "contracts_templates"
-LOG_LEVEL = os.environ["LOG_LEVEL"] if "LOG_LEVEL" in os.environ else "DEBUG"
 DOCS_TTL = int(os.environ["DOCS_TTL"]) if "DOCS_TTL" in os.environ else 3600
 
-app = flask.Flask("chinaekb_form")
-app.logger.setLevel(LOG_LEVEL)
+# Журнал пишется фоновым потоком (см. logs.py); настраивается до создания app.logger
+logs.setup()
+
+# Встроенный маршрут /static отключён: статику отдаёт getstatic() (см. static_assets.py)
+app = flask.Flask("chinaekb_form", static_folder=None)
 app.secret_key = 'secret_123'
 
 app.config['MAX_CONTENT_LENGTH'] = 20 * 1024 * 1024  # 20 MB
@@ -33,7 +48,23 @@ app.config['UPLOAD_FOLDER'] = 'uploads'
 if not os.path.exists(app.config['UPLOAD_FOLDER']):
     os.makedirs(app.config['UPLOAD_FOLDER'])
 
-pdfoptions = {}
+# Загрузки пишутся потоком во временный файл с подсчётом хэша
+# и складываются в хранилище с адресацией по содержимому
+upload_store = uploads.UploadStore(app.config['UPLOAD_FOLDER'])
+app.request_class = uploads.UploadRequest
+uploads.UploadRequest.upload_tmp_dir = upload_store.tmp_dir
+# Фотографии документов пережимаются и получают превью в фоне (см. images.py)
+image_processor = images.ImageProcessor(upload_store)
+upload_store.on_commit = image_processor.submit
+
+@app.teardown_request
+def discard_uploads(error):
+    flask.request.discard_uploads()
+
+if not os.path.exists(DOCS_PATH):
+    os.makedirs(DOCS_PATH)
+
+pdfoptions = {'encoding': 'UTF-8', 'quiet': ''}
 
 # Настройка Flask-Login
 login_manager = LoginManager()
@@ -50,11 +81,9 @@ class User(UserMixin):
 def load_user(user_id):
     return User(user_id)
 
-# Настройка логирования
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-if not os.path.exists('chinaekb.db'):
+if not os.path.exists(db.DB_PATH):
     db.init_db()
 
 if CONTRACTS_PATH != "contracts_templates":
@@ -63,88 +92,55 @@ if CONTRACTS_PATH != "contracts_templates":
         if not os.path.exists(CONTRACTS_PATH + "/" + i):
             shutil.copy2("contracts_templates/" + i, CONTRACTS_PATH + "/" + i)
 
+# Справочник экзаменов из базы, перечитывается при изменении цен (см. exams.py)
+exam_catalog = exams.ExamCatalog()
+
 def select_exam(examselection):
-    if examselection == "1":
-        examprise = 2000
-        examlevel = 1
-        examtype = "HSK"
-    elif examselection == "2":
-        examprise = 2000
-        examlevel = 2
-        examtype = "HSK"
-    elif examselection == "3":
-        examprise = 3000
-        examlevel = 3
-        examtype = "HSK"
-    elif examselection == "4":
-        examprise = 3000
-        examlevel = 4
-        examtype = "HSK"
-    elif examselection == "5":
-        examprise = 4000
-        examlevel = 5
-        examtype = "HSK"
-    elif examselection == "6":
-        examprise = 4000
-        examlevel = 6
-        examtype = "HSK"
-    elif examselection == "7":
-        examprise = 2000
-        examlevel = "базовый"
-        examtype = "HSKK"
-    elif examselection == "8":
-        examprise = 3000
-        examlevel = "средний"
-        examtype = "HSKK"
-    elif examselection == "9":
-        examprise = 4000
-        examlevel = "высокий"
-        examtype = "HSKK"
-    elif examselection == "10":
-        examprise = 2000
-        examlevel = "A"
-        examtype = "BCT"
-    elif examselection == "11":
-        examprise = 3000
-        examlevel = "B"
-        examtype = "BCT"
-    elif examselection == "12":
-        examprise = 1000
-        examlevel = 1
-        examtype = "YCT"
-    elif examselection == "13":
-        examprise = 1000
-        examlevel = 2
-        examtype = "YCT"
-    elif examselection == "14":
-        examprise = 1500
-        examlevel = 3
-        examtype = "YCT"
-    elif examselection == "15":
-        examprise = 1500
-        examlevel = 4
-        examtype = "YCT"
-    else:
-        examprise = 0
-        examlevel = 0
-        examtype = "_____________"
+    return exam_catalog.select(examselection)
 
-    return examprise, examlevel, examtype
+# Фоновая очистка устаревших документов в DOCS_PATH
+docs_sweeper = DocsSweeper(DOCS_PATH, DOCS_TTL)
+docs_sweeper.start()
 
-def clear_docs() -> None:
-    if DOCS_TTL == 0:
-        return
-    files = os.listdir(DOCS_PATH)
-    for i in files:
-        if datetime.datetime.now().timestamp() - os.path.getmtime(DOCS_PATH + "/" + i) > DOCS_TTL:
-            os.remove(DOCS_PATH + "/" + i)
+# Кэш карточек заявок для модерации
+application_cache = details_cache.ApplicationCache()
+
+contract_renderer = contracts.ContractRenderer(CONTRACTS_PATH, DOCS_PATH, pdfoptions, on_document=docs_sweeper.touch,
+                                               bytecode_cache=template_cache.bytecode_cache())
 
 # Healthcheck uri
 @app.route(BASE_URL + "/status")
 def status():
-    resp = {"success":True, "version":VERSION, "status":"ok"}
+    resp = {"success":True, "version":VERSION, "status":"ok", "docs_sweeper":docs_sweeper.stats, "details_cache":application_cache.stats, "exam_catalog":exam_catalog.stats, "logs":logs.stats, "images":image_processor.stats, "file_delivery":{"uploads":upload_sender.stats, "docs":docs_sender.stats}}
     return flask.Response(json.dumps(resp), 200, mimetype="application/json")
 
+# Проверки готовности: база, свободное место и запись в каталоги, очередь 1С
+readiness = health.Readiness({
+    "db": health.check_db,
+    "db_dir": lambda: health.check_directory(os.path.dirname(os.path.abspath(db.DB_PATH))),
+    "uploads": lambda: health.check_directory(app.config['UPLOAD_FOLDER']),
+    "docs": lambda: health.check_directory(DOCS_PATH),
+    "outbox": health.check_outbox,
+})
+
+# Liveness: процесс отвечает, без обращения к базе и диску
+@app.route(BASE_URL + "/live")
+def live():
+    return flask.Response(json.dumps({"status":"ok"}), 200, mimetype="application/json")
+
+# Readiness: 503, если хотя бы одна подсистема в состоянии fail
+@app.route(BASE_URL + "/ready")
+def ready():
+    result = readiness.result()
+    code = 503 if result["status"] == health.FAIL else 200
+    return flask.Response(json.dumps(result), code, mimetype="application/json")
+
+# Время запросов и шаблонов, /metrics в формате Prometheus
+metrics.init_app(app, BASE_URL + "/metrics")
+
+# Скомпилированные шаблоны хранятся на диске и переиспользуются воркерами
+app.jinja_env.bytecode_cache = template_cache.bytecode_cache()
+
 @app.errorhandler(500)
 def error(error):
     if flask.request.method == "POST":
@@ -163,18 +159,33 @@ def not_found(error):
 def not_allowed(error):
     return flask.Response(json.dumps({"success":False, "message":"Method not allowed"}), 405, mimetype="application/json")
 
+# Статика с хэшем содержимого в адресе и заранее сжатыми вариантами;
+# в шаблонах адрес файла - static_url('style.css')
+assets = static_assets.StaticAssets("static", BASE_URL + "/static").build()
+app.jinja_env.globals['static_url'] = assets.url
+
 @app.route("/favicon.ico")
 def favicon():
-    return flask.send_file("static/favicon.ico")
+    response = assets.send("favicon.ico")
+    return response if response is not None else flask.send_file("static/favicon.ico")
 
 @app.route(BASE_URL + "/static/<path:path>")
 def getstatic(path):
-    return flask.send_from_directory("static", path)
+    response = assets.send(path)
+    return response if response is not None else flask.send_from_directory("static", path)
+
+# Загрузки и договоры отдаются только модератору; байты передаёт фронт-прокси
+# (FILE_DELIVERY=x-accel/x-sendfile) или сам воркер (см. file_delivery.py)
+upload_sender = file_delivery.FileSender(app.config['UPLOAD_FOLDER'], "uploads", file_delivery.UPLOADS_MAX_AGE)
+docs_sender = file_delivery.FileSender(DOCS_PATH, "docs", DOCS_TTL)
 
 @app.route(BASE_URL + "/docs/<path:path>")
+@login_required
 def getdocs(path):
-    clear_docs()
-    return flask.send_from_directory(DOCS_PATH, path)
+    full_path = werkzeug.security.safe_join(DOCS_PATH, path)
+    if full_path is None or not os.path.isfile(full_path):
+        flask.abort(404)
+    return docs_sender.send(full_path)
 
 @app.route(BASE_URL + "/")
 def index():
@@ -184,444 +195,28 @@ def index():
 def forms():
     return flask.render_template("forms.html", base_url=BASE_URL)
 
-@app.route(BASE_URL + "/education_adult", methods=["GET", "POST"])
-def education_adult():
-    if flask.request.method == 'GET':
-        return flask.render_template("education_adult.html", base_url=BASE_URL, formtitle="Образование для взрослых")
-    elif flask.request.method == 'POST':
-        # Обработка данных формы
-        studentname_lastname = flask.request.form.get('studentname-lastname').strip().lower().capitalize()
-        studentname_name = flask.request.form.get('studentname-name').strip().lower().capitalize()
-        studentname_surname = flask.request.form.get('studentname-surname').strip().lower().capitalize()
-        studentbirth = str(flask.request.form.get('studentbirth'))
-        studentaddress = flask.request.form.get('studentaddress')
-        studentgender = flask.request.form.get('studentgender')
-        studentsnils = flask.request.form.get('studentsnils')
-        studentid_serial = flask.request.form.get('studentid-serial')
-        studentid_number = flask.request.form.get('studentid-number')
-        studentid_by = flask.request.form.get('studentid-by')
-        studentid_issued = str(flask.request.form.get('studentid-issued'))
-        studentbank = flask.request.form.get('studentbank')
-        studentphone = flask.request.form.get('studentphone')
-        studentemail = flask.request.form.get('studentemail')
-        study_plan = "Практический курс китайского языка для взрослых"
-        exam_selection = flask.request.form.get('examselection')
-        exam_date = flask.request.form.get('examdate')
-        submission_date = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-
-        # Проверка наличия загруженных файлов
-        studentfiles = flask.request.files.getlist('studentfiles')
-        if not studentfiles:
-            return "No files uploaded", 400
-
-        # Обработка загруженных файлов
-        file_paths = []
-        for studentfile in studentfiles:
-            if studentfile and studentfile.filename:
-                filename = secure_filename(studentfile.filename)
-                file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-                studentfile.save(file_path)
-                file_paths.append(filename)
-
-        # Сохранение данных в базу данных
-        conn = sqlite3.connect('chinaekb.db')
-        c = conn.cursor()
-
-        c.execute('''
-            INSERT INTO adult_students (last_name, first_name, middle_name, birth_date, address, gender, snils, id_type, id_serial, id_number, id_issued_by, id_issued_date, bank_details, phone, email, study_plan, exam_selection, exam_date, submission_date, file_paths)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (studentname_lastname, studentname_name, studentname_surname, studentbirth, studentaddress, studentgender, studentsnils, "passport", studentid_serial, studentid_number, studentid_by, studentid_issued, studentbank, studentphone, studentemail, study_plan, exam_selection, exam_date, submission_date, ','.join(file_paths)))
-
-        conn.commit()
-        conn.close()
-
-        # Возвращаем успешный ответ
-        return redirect(url_for('success'))
-
-@app.route(BASE_URL + "/exam_adult", methods=["GET", "POST"])
-def exam_adult():
-    if flask.request.method == 'GET':
-        return flask.render_template("exam_adult.html", base_url=BASE_URL)
-    elif flask.request.method == 'POST':
-        # Обработка данных формы
-        studentname_lastname = flask.request.form.get('studentname-lastname').strip().lower().capitalize()
-        studentname_name = flask.request.form.get('studentname-name').strip().lower().capitalize()
-        studentname_surname = flask.request.form.get('studentname-surname').strip().lower().capitalize()
-        studentbirth = str(flask.request.form.get('studentbirth'))
-        studentaddress = flask.request.form.get('studentaddress')
-        studentgender = flask.request.form.get('studentgender')
-        studentsnils = flask.request.form.get('studentsnils')
-        studentid_serial = flask.request.form.get('studentid-serial')
-        studentid_number = flask.request.form.get('studentid-number')
-        studentid_by = flask.request.form.get('studentid-by')
-        studentid_issued = str(flask.request.form.get('studentid-issued'))
-        studentbank = flask.request.form.get('studentbank')
-        studentphone = flask.request.form.get('studentphone')
-        studentemail = flask.request.form.get('studentemail')
-        study_plan = "Экзамен для взрослых"
-        exam_selection = flask.request.form.get('examselection')
-        exam_date = flask.request.form.get('examdate')
-        submission_date = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-
-        # Проверка наличия загруженных файлов
-        studentfiles = flask.request.files.getlist('studentfiles')
-        if not studentfiles:
-            return "No files uploaded", 400
-
-        # Обработка загруженных файлов
-        file_paths = []
-        for studentfile in studentfiles:
-            if studentfile and studentfile.filename:
-                filename = secure_filename(studentfile.filename)
-                file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-                studentfile.save(file_path)
-                file_paths.append(filename)
-
-        # Сохранение данных в базу данных
-        conn = sqlite3.connect('chinaekb.db')
-        c = conn.cursor()
-
-        c.execute('''
-            INSERT INTO adult_students (last_name, first_name, middle_name, birth_date, address, gender, snils, id_type, id_serial, id_number, id_issued_by, id_issued_date, bank_details, phone, email, study_plan, exam_selection, exam_date, submission_date, file_paths)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (studentname_lastname, studentname_name, studentname_surname, studentbirth, studentaddress, studentgender, studentsnils, "passport", studentid_serial, studentid_number, studentid_by, studentid_issued, studentbank, studentphone, studentemail, study_plan, exam_selection, exam_date, submission_date, ','.join(file_paths)))
-        conn.commit()
-        conn.close()
-
-        # Возвращаем успешный ответ
-        return redirect(url_for('success'))
-
-@app.route(BASE_URL + "/education_children_under14", methods=["GET", "POST"])
-def education_children_under14():
-    if flask.request.method == 'GET':
-        return flask.render_template("education_children_under14.html", base_url=BASE_URL, formtitle="Образование для несовершеннолетних (до 14 лет)")
-    elif flask.request.method == 'POST':
-        # Обработка данных формы
-        studentname_lastname = flask.request.form.get('studentname-lastname').strip().lower().capitalize()
-        studentname_name = flask.request.form.get('studentname-name').strip().lower().capitalize()
-        studentname_surname = flask.request.form.get('studentname-surname').strip().lower().capitalize()
-        studentbirth = str(flask.request.form.get('studentbirth'))
-        studentaddress = flask.request.form.get('studentaddress')
-        studentgender = flask.request.form.get('studentgender')
-        studentsnils = flask.request.form.get('studentsnils')
-        studentid_serial = flask.request.form.get('studentid-serial')
-        studentid_number = flask.request.form.get('studentid-number')
-        studentid_by = flask.request.form.get('studentid-by')
-        studentid_issued = str(flask.request.form.get('studentid-issued'))
-        id_type = "birth certificate"
-        studentbank = flask.request.form.get('studentbank')
-        studentphone = flask.request.form.get('studentphone')
-        studentemail = flask.request.form.get('studentemail')
-        study_plan = "Практический базовый курс китайского языка для детей"
-        exam_selection = flask.request.form.get('examselection')
-        exam_date = flask.request.form.get('examdate')
-        submission_date = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-
-        clientname_lastname = flask.request.form.get('clientname-lastname').strip().lower().capitalize()
-        clientname_name = flask.request.form.get('clientname-name').strip().lower().capitalize()
-        clientname_surname = flask.request.form.get('clientname-surname').strip().lower().capitalize()
-        clientbirth = str(flask.request.form.get('clientbirth'))
-        clientaddress = flask.request.form.get('clientaddress')
-        clientgender = flask.request.form.get('clientgender')
-        clientsnils = flask.request.form.get('clientsnils')
-        clientid_serial = flask.request.form.get('clientid-serial')
-        clientid_number = flask.request.form.get('clientid-number')
-        clientid_by = flask.request.form.get('clientid-by')
-        clientid_issued = str(flask.request.form.get('clientid-issued'))
-        clientbank = flask.request.form.get('clientbank')
-        clientphone = flask.request.form.get('clientphone')
-        clientemail = flask.request.form.get('clientemail')
-
-        # Проверка наличия загруженных файлов
-        studentfiles = flask.request.files.getlist('studentfiles')
-        if not studentfiles:
-            return "No files uploaded", 400
-
-        # Обработка загруженных файлов
-        file_paths = []
-        for studentfile in studentfiles:
-            if studentfile and studentfile.filename:
-                filename = secure_filename(studentfile.filename)
-                file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-                studentfile.save(file_path)
-                file_paths.append(filename)
-
-        # Сохранение данных в базу данных
-        conn = sqlite3.connect('chinaekb.db')
-        c = conn.cursor()
-
-        c.execute('''
-            INSERT INTO students (last_name, first_name, middle_name, birth_date, address, gender, snils, age_group, id_type, id_serial, id_number, id_issued_by, id_issued_date, bank_details, phone, email, study_plan, exam_selection, exam_date, status, submission_date, file_paths)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            studentname_lastname, studentname_name, studentname_surname, studentbirth, studentaddress, studentgender,
-            studentsnils, "under14", id_type, studentid_serial, studentid_number, studentid_by, studentid_issued,
-            studentbank, studentphone, studentemail, study_plan, exam_selection, exam_date, "на проверке",
-            submission_date, ','.join(file_paths)
-        ))
-
-        student_id = c.lastrowid
-
-        c.execute('''
-            INSERT INTO representatives (student_id, last_name, first_name, middle_name, birth_date, address, gender, snils, id_serial, id_number, id_issued_by, id_issued_date, bank_details, phone, email)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            student_id, clientname_lastname, clientname_name, clientname_surname, clientbirth, clientaddress, clientgender,
-            clientsnils, clientid_serial, clientid_number, clientid_by, clientid_issued, clientbank, clientphone,
-            clientemail
-        ))
-
-        conn.commit()
-        conn.close()
-
-        # Возвращаем успешный ответ
-        return redirect(url_for('success'))
-
-@app.route(BASE_URL + "/education_children_over14", methods=["GET", "POST"])
-def education_children_over14():
-    if flask.request.method == 'GET':
-        return flask.render_template("education_children_over14.html", base_url=BASE_URL, formtitle="Образование для несовершеннолетних (от 14 до 18 лет)")
-    elif flask.request.method == 'POST':
-        # Обработка данных формы
-        studentname_lastname = flask.request.form.get('studentname-lastname').strip().lower().capitalize()
-        studentname_name = flask.request.form.get('studentname-name').strip().lower().capitalize()
-        studentname_surname = flask.request.form.get('studentname-surname').strip().lower().capitalize()
-        studentbirth = str(flask.request.form.get('studentbirth'))
-        studentaddress = flask.request.form.get('studentaddress')
-        studentgender = flask.request.form.get('studentgender')
-        studentsnils = flask.request.form.get('studentsnils')
-        studentid_serial = flask.request.form.get('studentid-serial')
-        studentid_number = flask.request.form.get('studentid-number')
-        studentid_by = flask.request.form.get('studentid-by')
-        studentid_issued = str(flask.request.form.get('studentid-issued'))
-        id_type = "passport"
-        studentbank = flask.request.form.get('studentbank')
-        studentphone = flask.request.form.get('studentphone')
-        studentemail = flask.request.form.get('studentemail')
-        study_plan = "Практический базовый курс китайского языка для детей"
-        exam_selection = flask.request.form.get('examselection')
-        exam_date = flask.request.form.get('examdate')
-        submission_date = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-
-        clientname_lastname = flask.request.form.get('clientname-lastname').strip().lower().capitalize()
-        clientname_name = flask.request.form.get('clientname-name').strip().lower().capitalize()
-        clientname_surname = flask.request.form.get('clientname-surname').strip().lower().capitalize()
-        clientbirth = str(flask.request.form.get('clientbirth'))
-        clientaddress = flask.request.form.get('clientaddress')
-        clientgender = flask.request.form.get('clientgender')
-        clientsnils = flask.request.form.get('clientsnils')
-        clientid_serial = flask.request.form.get('clientid-serial')
-        clientid_number = flask.request.form.get('clientid-number')
-        clientid_by = flask.request.form.get('clientid-by')
-        clientid_issued = str(flask.request.form.get('clientid-issued'))
-        clientbank = flask.request.form.get('clientbank')
-        clientphone = flask.request.form.get('clientphone')
-        clientemail = flask.request.form.get('clientemail')
-
-        # Проверка наличия загруженных файлов
-        studentfiles = flask.request.files.getlist('studentfiles')
-        if not studentfiles:
-            return "No files uploaded", 400
-
-        # Обработка загруженных файлов
-        file_paths = []
-        for studentfile in studentfiles:
-            if studentfile and studentfile.filename:
-                filename = secure_filename(studentfile.filename)
-                file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-                studentfile.save(file_path)
-                file_paths.append(filename)
-
-        # Сохранение данных в базу данных
-        conn = sqlite3.connect('chinaekb.db')
-        c = conn.cursor()
-
-        c.execute('''
-            INSERT INTO students (last_name, first_name, middle_name, birth_date, address, gender, snils, age_group, id_type, id_serial, id_number, id_issued_by, id_issued_date, bank_details, phone, email, study_plan, exam_selection, exam_date, status, submission_date)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            studentname_lastname, studentname_name, studentname_surname, studentbirth, studentaddress, studentgender,
-            studentsnils, "over14", id_type, studentid_serial, studentid_number, studentid_by, studentid_issued,
-            studentbank, studentphone, studentemail, study_plan, exam_selection, exam_date, "на проверке", submission_date, ','.join(file_paths)))
-
-        student_id = c.lastrowid
-
-        c.execute('''
-            INSERT INTO representatives (student_id, last_name, first_name, middle_name, birth_date, address, gender, snils, id_serial, id_number, id_issued_by, id_issued_date, bank_details, phone, email)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            student_id, clientname_lastname, clientname_name, clientname_surname, clientbirth, clientaddress, clientgender,
-            clientsnils, clientid_serial, clientid_number, clientid_by, clientid_issued, clientbank, clientphone,
-            clientemail))
-
-        conn.commit()
-        conn.close()
-
-        # Возвращаем успешный ответ
-        return redirect(url_for('success'))
-
-@app.route(BASE_URL + "/exam_children_under14", methods=["GET", "POST"])
-def exam_children_under14():
-    if flask.request.method == 'GET':
-        return flask.render_template("exam_children_under14.html", base_url=BASE_URL, formtitle="Экзамен для несовершеннолетних(до 14 лет)")
-    elif flask.request.method == 'POST':
-        # Обработка данных формы
-        studentname_lastname = flask.request.form.get('studentname-lastname').strip().lower().capitalize()
-        studentname_name = flask.request.form.get('studentname-name').strip().lower().capitalize()
-        studentname_surname = flask.request.form.get('studentname-surname').strip().lower().capitalize()
-        studentbirth = str(flask.request.form.get('studentbirth'))
-        studentaddress = flask.request.form.get('studentaddress')
-        studentgender = flask.request.form.get('studentgender')
-        studentsnils = flask.request.form.get('studentsnils')
-        studentid_serial = flask.request.form.get('studentid-serial')
-        studentid_number = flask.request.form.get('studentid-number')
-        studentid_by = flask.request.form.get('studentid-by')
-        studentid_issued = str(flask.request.form.get('studentid-issued'))
-        id_type = "birth certificate"
-        studentbank = flask.request.form.get('studentbank')
-        studentphone = flask.request.form.get('studentphone')
-        studentemail = flask.request.form.get('studentemail')
-        study_plan = "Экзамен для детей (до 14 лет)"
-        exam_selection = flask.request.form.get('examselection')
-        exam_date = flask.request.form.get('examdate')
-        submission_date = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-
-        clientname_lastname = flask.request.form.get('clientname-lastname').strip().lower().capitalize()
-        clientname_name = flask.request.form.get('clientname-name').strip().lower().capitalize()
-        clientname_surname = flask.request.form.get('clientname-surname').strip().lower().capitalize()
-        clientbirth = str(flask.request.form.get('clientbirth'))
-        clientaddress = flask.request.form.get('clientaddress')
-        clientgender = flask.request.form.get('clientgender')
-        clientsnils = flask.request.form.get('clientsnils')
-        clientid_serial = flask.request.form.get('clientid-serial')
-        clientid_number = flask.request.form.get('clientid-number')
-        clientid_by = flask.request.form.get('clientid-by')
-        clientid_issued = str(flask.request.form.get('clientid-issued'))
-        clientbank = flask.request.form.get('clientbank')
-        clientphone = flask.request.form.get('clientphone')
-        clientemail = flask.request.form.get('clientemail')
+def application_form(spec):
+    def view():
+        if flask.request.method == 'GET':
+            return flask.render_template(spec.template, base_url=BASE_URL, formtitle=spec.title, exams=exam_catalog.snapshot().active)
 
         # Проверка наличия загруженных файлов
         studentfiles = flask.request.files.getlist('studentfiles')
         if not studentfiles:
             return "No files uploaded", 400
 
-        # Обработка загруженных файлов
-        file_paths = []
-        for studentfile in studentfiles:
-            if studentfile and studentfile.filename:
-                filename = secure_filename(studentfile.filename)
-                file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-                studentfile.save(file_path)
-                file_paths.append(filename)
-
-        # Сохранение данных в базу данных
-        conn = sqlite3.connect('chinaekb.db')
-        c = conn.cursor()
-
-        c.execute('''
-            INSERT INTO students (last_name, first_name, middle_name, birth_date, address, gender, snils, age_group, id_type, id_serial, id_number, id_issued_by, id_issued_date, bank_details, phone, email, study_plan, exam_selection, exam_date, status, submission_date, file_paths)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            studentname_lastname, studentname_name, studentname_surname, studentbirth, studentaddress, studentgender,
-            studentsnils, "under14", id_type, studentid_serial, studentid_number, studentid_by, studentid_issued,
-            studentbank, studentphone, studentemail, study_plan, exam_selection, exam_date, "на проверке",
-            submission_date, ','.join(file_paths)
-        ))
-        student_id = c.lastrowid
-
-        c.execute('''
-            INSERT INTO representatives (student_id, last_name, first_name, middle_name, birth_date, address, gender, snils, id_serial, id_number, id_issued_by, id_issued_date, bank_details, phone, email)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (student_id, clientname_lastname, clientname_name, clientname_surname, clientbirth, clientaddress, clientgender, clientsnils, clientid_serial, clientid_number, clientid_by, clientid_issued, clientbank, clientphone, clientemail))
-
-        conn.commit()
-        conn.close()
+        try:
+            submissions.submit(spec, flask.request.form, studentfiles, upload_store)
+        except submissions.FormError as e:
+            return json.dumps({"success": False, "message": str(e)}), 400, {'Content-Type': 'application/json'}
 
         # Возвращаем успешный ответ
         return redirect(url_for('success'))
+    return view
 
-@app.route(BASE_URL + "/exam_children_over14", methods=["GET", "POST"])
-def exam_children_over14():
-    if flask.request.method == 'GET':
-        return flask.render_template("exam_children_over14.html", base_url=BASE_URL, formtitle="Экзамен для несовершеннолетних (от 14 до 18 лет)")
-    elif flask.request.method == 'POST':
-        # Обработка данных формы
-        studentname_lastname = flask.request.form.get('studentname-lastname').strip().lower().capitalize()
-        studentname_name = flask.request.form.get('studentname-name').strip().lower().capitalize()
-        studentname_surname = flask.request.form.get('studentname-surname').strip().lower().capitalize()
-        studentbirth = str(flask.request.form.get('studentbirth'))
-        studentaddress = flask.request.form.get('studentaddress')
-        studentgender = flask.request.form.get('studentgender')
-        studentsnils = flask.request.form.get('studentsnils')
-        studentid_serial = flask.request.form.get('studentid-serial')
-        studentid_number = flask.request.form.get('studentid-number')
-        studentid_by = flask.request.form.get('studentid-by')
-        studentid_issued = str(flask.request.form.get('studentid-issued'))
-        id_type = "passport"
-        studentbank = flask.request.form.get('studentbank')
-        studentphone = flask.request.form.get('studentphone')
-        studentemail = flask.request.form.get('studentemail')
-        study_plan = "Экзамен для детей (от 14 до 18 лет)"
-        exam_selection = flask.request.form.get('examselection')
-        exam_date = flask.request.form.get('examdate')
-        submission_date = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-
-        clientname_lastname = flask.request.form.get('clientname-lastname').strip().lower().capitalize()
-        clientname_name = flask.request.form.get('clientname-name').strip().lower().capitalize()
-        clientname_surname = flask.request.form.get('clientname-surname').strip().lower().capitalize()
-        clientbirth = str(flask.request.form.get('clientbirth'))
-        clientaddress = flask.request.form.get('clientaddress')
-        clientgender = flask.request.form.get('clientgender')
-        clientsnils = flask.request.form.get('clientsnils')
-        clientid_serial = flask.request.form.get('clientid-serial')
-        clientid_number = flask.request.form.get('clientid-number')
-        clientid_by = flask.request.form.get('clientid-by')
-        clientid_issued = str(flask.request.form.get('clientid-issued'))
-        clientbank = flask.request.form.get('clientbank')
-        clientphone = flask.request.form.get('clientphone')
-        clientemail = flask.request.form.get('clientemail')
-
-        # Проверка наличия загруженных файлов
-        studentfiles = flask.request.files.getlist('studentfiles')
-        if not studentfiles:
-            return "No files uploaded", 400
-
-        # Обработка загруженных файлов
-        file_paths = []
-        for studentfile in studentfiles:
-            if studentfile and studentfile.filename:
-                filename = secure_filename(studentfile.filename)
-                file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-                studentfile.save(file_path)
-                file_paths.append(filename)
-
-        # Сохранение данных в базу данных
-        conn = sqlite3.connect('chinaekb.db')
-        c = conn.cursor()
-
-        c.execute('''
-            INSERT INTO students (last_name, first_name, middle_name, birth_date, address, gender, snils, age_group, id_type, id_serial, id_number, id_issued_by, id_issued_date, bank_details, phone, email, study_plan, exam_selection, exam_date, status, submission_date, file_paths)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            studentname_lastname, studentname_name, studentname_surname, studentbirth, studentaddress, studentgender,
-            studentsnils, "over14", id_type, studentid_serial, studentid_number, studentid_by, studentid_issued,
-            studentbank, studentphone, studentemail, study_plan, exam_selection, exam_date, "на проверке",
-            submission_date, ','.join(file_paths)
-        ))
-
-        student_id = c.lastrowid
-
-        c.execute('''
-            INSERT INTO representatives (student_id, last_name, first_name, middle_name, birth_date, address, gender, snils, id_serial, id_number, id_issued_by, id_issued_date, bank_details, phone, email)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (student_id, clientname_lastname, clientname_name, clientname_surname, clientbirth, clientaddress, clientgender, clientsnils, clientid_serial, clientid_number, clientid_by, clientid_issued, clientbank, clientphone, clientemail))
-
-        conn.commit()
-        conn.close()
-
-        # Возвращаем успешный ответ
-        return redirect(url_for('success'))
+# Маршруты форм заявок описаны в submissions.FORMS
+for form_spec in submissions.FORMS:
+    app.add_url_rule(BASE_URL + "/" + form_spec.name, form_spec.name, application_form(form_spec), methods=["GET", "POST"])
 
 # Устанавливаем время жизни "запомнить меня" куки (например, 7 дней)
 app.config['REMEMBER_COOKIE_DURATION'] = timedelta(days=7)
@@ -661,51 +256,125 @@ def moderation():
         # Получаем параметры фильтрации
         table_name = request.args.get('table_name', default='students')
         status = request.args.get('status', default='all')
-        limit = int(request.args.get('limit', default='20'))
-        page = int(request.args.get('page', default='1'))
-
-        conn = sqlite3.connect('chinaekb.db')
-        c = conn.cursor()
-
-        # Извлекаем данные из выбранной таблицы
-        query = f'SELECT * FROM {table_name}'
-        if status != 'all':
-            query += f' WHERE status = ?'
-            c.execute(query, (status,))
+        limit = min(max(int(request.args.get('limit', default='20')), 1), 500)
+        page = max(int(request.args.get('page', default='1')), 1)
+        after = request.args.get('after', type=int)
+        before = request.args.get('before', type=int)
+
+        if table_name not in db.APPLICATION_TABLES:
+            flask.abort(404)
+
+        with db.connection() as conn:
+            total_records = db.count_applications(conn, table_name, status)
+            total_pages = ceil(total_records / limit)
+            rows, has_more = db.fetch_applications_page(conn, table_name, status, limit, after=after, before=before)
+
+        # Курсоры для ссылок "назад"/"вперёд": id первой и последней записи на странице
+        if before is not None:
+            has_prev, has_next = has_more, True
         else:
-            c.execute(query)
-
-        total_records = len(c.fetchall())
-        total_pages = ceil(total_records / limit)
-
-        offset = (page - 1) * limit
-        query += f' LIMIT ? OFFSET ?'
-        c.execute(query, (limit, offset) if status == 'all' else (status, limit, offset))
+            has_prev, has_next = after is not None, has_more
+        first_id = rows[0].id if rows else None
+        last_id = rows[-1].id if rows else None
 
         if table_name == 'students':
-            students = c.fetchall()
+            students = rows
             minor_students_with_representatives = []
             adult_students = []
         elif table_name == 'adult_students':
-            adult_students = c.fetchall()
+            adult_students = rows
             students = []
             minor_students_with_representatives = []
 
-        conn.close()
-
-        # Логирование данных, передаваемых в шаблон
-        current_app.logger.info(f"Rendering template with table_name={table_name}, status={status}, limit={limit}, page={page}, total_pages={total_pages}")
-        current_app.logger.info(f"Students: {students}")
-        current_app.logger.info(f"Adult Students: {adult_students}")
+        logs.event(logger, "moderation.page", table_name=table_name, status=status, limit=limit, page=page, rows=len(rows))
 
         # Получаем сообщение из сессии и удаляем его
         success_message = session.pop('success_message', None)
 
-        return render_template("moderation.html", base_url=BASE_URL, students=students, adult_students=adult_students, minor_students_with_representatives=minor_students_with_representatives, table_name=table_name, status=status, limit=limit, page=page, total_pages=total_pages, success_message=success_message)
+        return render_template("moderation.html", base_url=BASE_URL, students=students, adult_students=adult_students, minor_students_with_representatives=minor_students_with_representatives, table_name=table_name, status=status, limit=limit, page=page, total_pages=total_pages, total_records=total_records, has_prev=has_prev and first_id is not None, has_next=has_next and last_id is not None, first_id=first_id, last_id=last_id, success_message=success_message)
+
+@app.route(BASE_URL + "/moderation/search")
+@login_required
+def moderation_search():
+    query = request.args.get('q', default='').strip()
+    limit = min(max(request.args.get('limit', default=50, type=int), 1), 200)
+
+    results = []
+    if query:
+        with db.connection() as conn:
+            found = db.search_applications(conn, query, limit)
+            applications = {}
+            for table_name in db.APPLICATION_TABLES:
+                ids = [student_id for table, student_id in found if table == table_name]
+                if ids:
+                    applications[table_name] = db.fetch_applications_by_ids(conn, table_name, ids)
+        # Порядок - по релевантности из индекса
+        for table_name, student_id in found:
+            application = applications.get(table_name, {}).get(student_id)
+            if application is not None:
+                results.append((table_name,) + application)
+        # Текст запроса не пишется: в нём обычно ФИО или телефон
+        logs.event(logger, "moderation.search", results=len(results), limit=limit)
+
+    return render_template("search.html", base_url=BASE_URL, query=query, limit=limit, results=results)
+
+@app.route(BASE_URL + "/moderation/export")
+@login_required
+def moderation_export():
+    table_name = request.args.get('table_name', default='all')
+    status = request.args.get('status', default='all')
+    export_format = request.args.get('format', default='csv')
+
+    if table_name != 'all' and table_name not in db.APPLICATION_TABLES:
+        flask.abort(404)
+    if export_format not in ('csv', 'xlsx'):
+        return json.dumps({"success": False, "message": "Unknown export format"}), 400, {'Content-Type': 'application/json'}
+    try:
+        date_from = export.parse_date(request.args.get('date_from'))
+        date_to = export.parse_date(request.args.get('date_to'))
+    except ValueError:
+        return json.dumps({"success": False, "message": "Dates must be YYYY-MM-DD"}), 400, {'Content-Type': 'application/json'}
+
+    tables = db.APPLICATION_TABLES if table_name == 'all' else (table_name,)
+    rows = export.iter_rows(tables, status, date_from, date_to, decode_exam=select_exam)
+    if export_format == 'csv':
+        body, mimetype = export.csv_stream(rows), 'text/csv; charset=utf-8'
+    else:
+        body, mimetype = export.xlsx_stream(rows), 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+    filename = f"applications-{table_name}-{datetime.date.today().isoformat()}.{export_format}"
+    return flask.Response(body, mimetype=mimetype, headers={'Content-Disposition': f'attachment; filename="{filename}"'})
+
+# Число заявок и сумма по экзаменам (по текущим ценам справочника)
+@app.route(BASE_URL + "/moderation/exams/report")
+@login_required
+def exams_report():
+    table_name = request.args.get('table_name', default='all')
+    status = request.args.get('status', default='all')
+    if table_name != 'all' and table_name not in db.APPLICATION_TABLES:
+        flask.abort(404)
+
+    counts = {}
+    with db.connection() as conn:
+        for table in (db.APPLICATION_TABLES if table_name == 'all' else (table_name,)):
+            for code, count in exams.count_by_exam(conn, table, status):
+                counts[code] = counts.get(code, 0) + count
+
+    snapshot = exam_catalog.snapshot()
+    rows, total = snapshot.totals(counts.items())
+    report = []
+    for code, count, amount in rows:
+        exam = snapshot.get(code)
+        report.append({"code": code, "label": exam.label if exam else None, "price": exam.price if exam else 0,
+                       "count": count, "amount": amount})
+    resp = {"success": True, "catalog_version": snapshot.version, "exams": report, "total_count": sum(counts.values()),
+            "total_amount": total}
+    return flask.Response(json.dumps(resp, ensure_ascii=False), 200, mimetype="application/json")
 
 # Функция для удаления файлов
 def delete_files(file_paths):
-    for file_path in file_paths:
+    # Файлы из хранилища загрузок удаляются по счётчику ссылок,
+    # файлы, загруженные до его появления, - напрямую
+    for file_path in upload_store.release(file_paths):
         full_path = os.path.join(app.config['UPLOAD_FOLDER'], file_path)
         if os.path.exists(full_path):
             os.remove(full_path)
@@ -713,152 +382,73 @@ def delete_files(file_paths):
         else:
             logger.warning(f"Файл {full_path} не найден")
 
+# Удаляем файлы, связанные с заявкой, только после успешной отправки данных в 1С
+def on_delivered(table_name, student_id, student_data):
+    file_paths = student_data['file_paths'].split(',') if student_data.get('file_paths') else []
+    delete_files(file_paths)
+
+outbox.start(on_delivered=on_delivered)
+
 @app.route(BASE_URL + "/moderation/<table_name>/student/<int:student_id>", methods=["GET", "POST"])
 @login_required
 def student_details(table_name, student_id):
+    if table_name not in db.APPLICATION_TABLES:
+        flask.abort(404)
+
     if request.method == 'GET':
-        conn = sqlite3.connect('chinaekb.db')
-        c = conn.cursor()
-        c.execute(f'SELECT * FROM {table_name} WHERE id = ?', (student_id,))
-        student = c.fetchone()
-        representative = None
-        if student and table_name == 'students':
-            c.execute('SELECT * FROM representatives WHERE student_id = ?', (student_id,))
-            representative = c.fetchone()
-        conn.close()
+        with db.connection() as conn:
+            student, representative = application_cache.get(conn, table_name, student_id) or (None, None)
+            delivery = outbox.delivery_state(conn, table_name, student_id) if student else None
+
+        # Завершённые старые заявки перенесены в архивную базу (см. archive.py)
+        archived = student is None
+        if archived:
+            student, representative = archive.fetch_application(table_name, student_id) or (None, None)
 
         if student:
-            return render_template("student_details.html", base_url=BASE_URL, student=student, representative=representative, table_name=table_name)
+            thumbnails = upload_store.thumbnails(student.files)
+            return render_template("student_details.html", base_url=BASE_URL, student=student, representative=representative, table_name=table_name, delivery=delivery, thumbnails=thumbnails, archived=archived)
         else:
             return "Студент не найден", 404
 
     elif request.method == 'POST':
         action = request.form.get('action')
 
-        # Логирование значения table_name
-        logger.info(f"table_name: {table_name}")
-
         if action == 'approve':
-            conn = sqlite3.connect('chinaekb.db')
-            c = conn.cursor()
+            conn = db.pool.acquire()
 
             try:
-                # Получаем данные заявки для отправки в 1С
-                c.execute(f'SELECT * FROM {table_name} WHERE id = ?', (student_id,))
-                student = c.fetchone()
-
-                # Получаем данные ответственного, если это несовершеннолетний студент
-                representative = None
-                if table_name == 'students':
-                    c.execute('SELECT * FROM representatives WHERE student_id = ?', (student_id,))
-                    representative = c.fetchone()
+                # Получаем данные заявки (и ответственного для несовершеннолетних) для отправки в 1С
+                student, representative = application_cache.get(conn, table_name, student_id) or (None, None)
 
                 # Проверка на None
                 if student is None:
                     logger.error(f"Студент с ID {student_id} не найден в таблице {table_name}")
                     return json.dumps({"success": False, "message": "Студент не найден"}), 404, {'Content-Type': 'application/json'}
 
-                # Выводим количество столбцов и сами данные студента
-                logger.info(f"Количество столбцов в данных студента с ID {student_id} в таблице {table_name}: {len(student)}")
-                logger.info(f"Данные студента с ID {student_id} в таблице {table_name}: {student}")
-
-                # Формируем JSON и отправляем данные в 1С
-                if table_name == 'students':
-                    student_data = {
-                        'id': student[0],
-                        'last_name': student[1],
-                        'first_name': student[2],
-                        'middle_name': student[3],
-                        'birth_date': student[4],
-                        'address': student[5],
-                        'gender': student[6],
-                        'snils': student[7],
-                        'age_group': student[8],
-                        'id_type': student[9],
-                        'id_serial': student[10],
-                        'id_number': student[11],
-                        'id_issued_by': student[12],
-                        'id_issued_date': student[13],
-                        'bank_details': student[14],
-                        'phone': student[15],
-                        'email': student[16],
-                        'study_plan': student[17],
-                        'exam_selection': student[18],
-                        'exam_date': student[19],
-                        'status': student[20],
-                        'submission_date': student[21],
-                        'file_paths': student[22],
-                        'representative': {
-                            'last_name': representative[2],
-                            'first_name': representative[3],
-                            'middle_name': representative[4],
-                            'birth_date': representative[5],
-                            'address': representative[6],
-                            'gender': representative[7],
-                            'snils': representative[8],
-                            'id_serial': representative[9],
-                            'id_number': representative[10],
-                            'id_issued_by': representative[11],
-                            'id_issued_date': representative[12],
-                            'bank_details': representative[13],
-                            'phone': representative[14],
-                            'email': representative[15]
-                        } if representative else None
-                    }
-                elif table_name == 'adult_students':
-                    # Формируем JSON и отправляем данные в 1С
-                    student_data = {
-                        'id': student[0],
-                        'last_name': student[1],
-                        'first_name': student[2],
-                        'middle_name': student[3],
-                        'birth_date': student[4],
-                        'address': student[5],
-                        'gender': student[6],
-                        'snils': student[7],
-                        'id_type': student[8],
-                        'id_serial': student[9],
-                        'id_number': student[10],
-                        'id_issued_by': student[11],
-                        'id_issued_date': student[12],
-                        'bank_details': student[13],
-                        'phone': student[14],
-                        'email': student[15],
-                        'study_plan': student[16],
-                        'exam_selection': student[17],
-                        'exam_date': student[18],
-                        'status': student[19],
-                        'submission_date': student[20],
-                        'file_paths': student[21]
-                    }
+                # Как в moderation_batch: обработанная заявка повторно в 1С не отправляется
+                if student.status != 'на проверке':
+                    return json.dumps({"success": False, "message": "Заявка уже обработана"}), 409, {'Content-Type': 'application/json'}
+
+                student_data = student.to_1c(representative)
 
                 # Сохраняем данные JSON в файл
                 ##filename = f"student_{student_id}_{table_name}.json"
                 ##save_json_to_file(student_data, filename)
 
-                # Отправка данных в 1С
-                try:
-                    response = requests.post('https://1c.rsvpu.ru/univer_prof_test/hs/confucius_center/put_contract',
-                                             json=student_data, auth=('AbiturWeb', 's5*Uzjea'))
-                    response.raise_for_status()  # Проверка на ошибки HTTP
-                    logger.info(f"Заявка {student_id} одобрена и отправлена в 1С")
-
-                    # Обновляем статус заявки на "проверено"
-                    c.execute(f'UPDATE {table_name} SET status = ? WHERE id = ?', ('проверено', student_id))
-                    conn.commit()
-
-                    # Удаляем файлы, связанные с заявкой, только если данные успешно отправлены в 1С
-                    file_paths = student[22].split(',') if len(student) > 22 else []
-                    delete_files(file_paths)
+                # Ставим заявку в очередь отправки в 1С. Статус "проверено" выставит
+                # фоновый обработчик outbox после подтверждения от 1С
+                queued = outbox.enqueue(conn, table_name, student_id, student_data)
+                conn.commit()
 
-                    # Добавляем сообщение в сессию
-                    session['success_message'] = "Заявка успешно отправлена в 1С"
+                if queued:
+                    logger.info(f"Заявка {student_id} одобрена и поставлена в очередь отправки в 1С")
+                    session['success_message'] = "Заявка одобрена и поставлена в очередь отправки в 1С"
+                else:
+                    session['success_message'] = "Заявка уже ожидает отправки в 1С"
 
-                    # Перенаправляем пользователя на страницу модерации
-                    return redirect(url_for('moderation'))
-                except requests.exceptions.RequestException as e:
-                    logger.error(f"Ошибка при отправке данных в 1С: {e}")
-                    return json.dumps({"success": False, "message": "Ошибка при отправке данных в 1С"}), 500, {'Content-Type': 'application/json'}
+                # Перенаправляем пользователя на страницу модерации
+                return redirect(url_for('moderation'))
 
             except Exception as e:
                 # Откат транзакции в случае ошибки
@@ -867,21 +457,91 @@ def student_details(table_name, student_id):
                 return json.dumps({"success": False, "message": "Ошибка при обработке заявки"}), 500, {'Content-Type': 'application/json'}
 
             finally:
-                conn.close()
+                db.pool.release(conn)
 
         elif action == 'reject':
-            # Обновляем статус заявки на "отклонено"
-            conn = sqlite3.connect('chinaekb.db')
-            c = conn.cursor()
-            c.execute(f'UPDATE {table_name} SET status = ? WHERE id = ?', ('отклонено', student_id))
-            conn.commit()
-            conn.close()
+            # Обновляем статус заявки на "отклонено", только если она ещё не обработана
+            # (доставленную в 1С заявку отклонить нельзя)
+            with db.transaction() as conn:
+                row = conn.execute(f'SELECT status FROM {table_name} WHERE id = ?', (student_id,)).fetchone()
+                if row is None:
+                    return json.dumps({"success": False, "message": "Студент не найден"}), 404, {'Content-Type': 'application/json'}
+                if row[0] != 'на проверке':
+                    return json.dumps({"success": False, "message": "Заявка уже обработана"}), 409, {'Content-Type': 'application/json'}
+                conn.execute(f'UPDATE {table_name} SET status = ? WHERE id = ?', ('отклонено', student_id))
+                details_cache.invalidate(conn, table_name, [student_id])
 
             logger.info(f"Заявка {student_id} отклонена")
             return json.dumps({"success": True, "message": "Заявка отклонена"}), 200, {'Content-Type': 'application/json'}
 
         return json.dumps({"success": False, "message": "Неизвестное действие"}), 400, {'Content-Type': 'application/json'}
 
+@app.route(BASE_URL + "/moderation/<table_name>/student/<int:student_id>/contract")
+@login_required
+def student_contract(table_name, student_id):
+    if table_name not in db.APPLICATION_TABLES:
+        flask.abort(404)
+
+    with db.connection() as conn:
+        application = db.fetch_applications_by_ids(conn, table_name, [student_id]).get(student_id)
+    if application is None:
+        application = archive.fetch_application(table_name, student_id)
+    if application is None:
+        return "Студент не найден", 404
+
+    student, representative = application
+    student_data = student.to_1c(representative)
+    try:
+        filename = contract_renderer.render(student_data, select_exam(student_data['exam_selection']))
+    except RuntimeError as e:
+        logger.error(f"Договор для заявки {student_id} в таблице {table_name} не сформирован: {e}")
+        return json.dumps({"success": False, "message": "Ошибка при формировании договора"}), 500, {'Content-Type': 'application/json'}
+
+    if filename is None:
+        # PDF ещё собирается в фоне - страница обновится сама
+        return render_template("contract_pending.html", base_url=BASE_URL), 202
+    return redirect(BASE_URL + "/docs/" + filename)
+
+@app.route(BASE_URL + "/moderation/<table_name>/batch", methods=["POST"])
+@login_required
+def moderation_batch(table_name):
+    if table_name not in db.APPLICATION_TABLES:
+        flask.abort(404)
+
+    action = request.form.get('action')
+    if action not in ('approve', 'reject'):
+        return json.dumps({"success": False, "message": "Неизвестное действие"}), 400, {'Content-Type': 'application/json'}
+
+    try:
+        ids = sorted({int(i) for i in request.form.getlist('ids')})
+    except ValueError:
+        return json.dumps({"success": False, "message": "Некорректный список заявок"}), 400, {'Content-Type': 'application/json'}
+
+    # Все изменения по пачке применяются одной транзакцией
+    results = {}
+    with db.transaction() as conn:
+        applications = db.fetch_applications_by_ids(conn, table_name, ids)
+        to_reject = []
+        for student_id in ids:
+            if student_id not in applications:
+                results[student_id] = "not_found"
+                continue
+            student, representative = applications[student_id]
+            if student.status != 'на проверке':
+                results[student_id] = "already_processed"
+            elif action == 'approve':
+                queued = outbox.enqueue(conn, table_name, student_id, student.to_1c(representative))
+                results[student_id] = "queued" if queued else "already_queued"
+            else:
+                to_reject.append(('отклонено', student_id))
+                results[student_id] = "rejected"
+        if to_reject:
+            conn.executemany(f'UPDATE {table_name} SET status = ? WHERE id = ?', to_reject)
+            details_cache.invalidate(conn, table_name, [student_id for _, student_id in to_reject])
+
+    logger.info(f"Пакетная обработка ({action}) в таблице {table_name}: {len(ids)} заявок")
+    return json.dumps({"success": True, "action": action, "results": {str(k): v for k, v in results.items()}}), 200, {'Content-Type': 'application/json'}
+
 def save_json_to_file(data, filename):
     try:
         with open(filename, 'w', encoding='utf-8') as f:
@@ -894,9 +554,22 @@ def save_json_to_file(data, filename):
 def success():
     return flask.render_template("success.html", base_url=BASE_URL)
 
+# Вход проверяется раньше поиска файла: без входа любой путь, в том числе
+# несуществующий, перенаправляет на /login, и по ответу нельзя узнать, есть ли
+# такой файл. После входа отсутствующий ключ - 404
 @app.route(BASE_URL + "/<path:file_path>", methods=['GET', 'POST'])
+@login_required
 def get_file(file_path):
-    return flask.send_from_directory(app.config['UPLOAD_FOLDER'], file_path)
+    path = upload_store.path(file_path)
+    if path is None or not os.path.isfile(path):
+        flask.abort(404)
+    return upload_sender.send(path)
+
+# Все шаблоны форм и договоров компилируются при импорте, до приёма запросов воркером
+if template_cache.TEMPLATE_PREWARM:
+    for env in (app.jinja_env, contract_renderer.env):
+        count, elapsed = template_cache.prewarm(env)
+        logger.info(f"Прогрев шаблонов: {count} за {elapsed * 1000:.0f} мс")
 
 # Debug only
 if __name__ == "__main__":
@@ -0,0 +1,160 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import jinja2
+import pdfkit
+
+CONTRACTS_WORKERS = int(os.environ["CONTRACTS_WORKERS"]) if "CONTRACTS_WORKERS" in os.environ else 2
+
+logger = logging.getLogger(__name__)
+
+
+def select_template(student_data):
+    """Шаблон договора по типу заявки: взрослый/ребёнок до или после 14 лет, обучение/экзамен."""
+    exam = student_data['study_plan'].startswith('Экзамен')
+    age_group = student_data.get('age_group')
+    if age_group == 'under14':
+        return 'contract_exam_before14.html' if exam else 'contract_education_children_before14.html'
+    if age_group == 'over14':
+        return 'contract_exam_after14.html' if exam else 'contract_education_children_after14.html'
+    return 'contract_exam_adult.html' if exam else 'contract_education_adult.html'
+
+
+def _full_name(person):
+    return ' '.join(i for i in (person['last_name'], person['first_name'], person['middle_name']) if i)
+
+
+def _requisits(person):
+    # [документ, банковские реквизиты, телефон, email] - порядок из шаблонов договоров
+    document = ' '.join(i for i in (person['id_serial'], person['id_number']) if i)
+    if person.get('id_issued_by'):
+        document += f", выдан {person['id_issued_by']}"
+    if person.get('id_issued_date'):
+        document += f" {person['id_issued_date']}"
+    return [document, person['bank_details'], person['phone'], person['email']]
+
+
+def build_context(student_data, exam):
+    """Переменные шаблона договора из JSON заявки (records: to_1c()) и select_exam()."""
+    examprise, examlevel, examtype = exam
+    context = {
+        'contractnumber': '',
+        'contractdate': '',
+        'studentname': _full_name(student_data),
+        'studentbirth': student_data['birth_date'],
+        'studentaddress': student_data['address'],
+        'studentrequisits': _requisits(student_data),
+        'examtype': examtype,
+        'examlevel': examlevel,
+        'examdate': student_data['exam_date'],
+        'examprise_digit': examprise,
+        'examprise_text': '',
+        'examnds': round(examprise / 6, 2),
+    }
+    representative = student_data.get('representative')
+    if representative:
+        context.update({
+            'clientname': _full_name(representative),
+            'clientbirth': representative['birth_date'],
+            'clientaddress': representative['address'],
+            'clientrequisits': _requisits(representative),
+        })
+    # В шаблонах номер договора выводится переменной contactnumber
+    context['contactnumber'] = context['contractnumber']
+    return context
+
+
+def _render_pdf(html, path, options):
+    # Выполняется в дочернем процессе: wkhtmltopdf не занимает воркер gunicorn
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        pdfkit.from_string(html, tmp_path, options=options)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return path
+
+
+class ContractRenderer:
+    """Генерация договоров в PDF с кэшем готовых документов в DOCS_PATH.
+
+    Имя файла - хэш исходников шаблона и данных договора, поэтому повторная
+    выдача того же договора сводится к проверке наличия файла. PDF собирается
+    в пуле процессов; пока документ готовится, render() возвращает None.
+    on_document(path) вызывается для созданного и для повторно выданного документа.
+    """
+
+    def __init__(self, templates_path, docs_path, options=None, on_document=None, bytecode_cache=None):
+        self.templates_path = templates_path
+        self.docs_path = docs_path
+        self.options = options or {}
+        self.on_document = on_document
+        self.env = jinja2.Environment(loader=jinja2.FileSystemLoader(templates_path), autoescape=True,
+                                      bytecode_cache=bytecode_cache)
+        self._digests = {}
+        self._pending = {}
+        self._errors = {}
+        self._lock = threading.RLock()
+        self._executor = None
+
+    def _template_digest(self, name):
+        # Договор наследует base.html, поэтому он тоже входит в хэш
+        sources = [os.path.join(self.templates_path, i) for i in (name, 'base.html')]
+        mtimes = tuple(os.path.getmtime(i) for i in sources)
+        cached = self._digests.get(name)
+        if cached is None or cached[0] != mtimes:
+            digest = hashlib.sha256()
+            for source in sources:
+                with open(source, 'rb') as f:
+                    digest.update(f.read())
+            cached = (mtimes, digest.hexdigest())
+            self._digests[name] = cached
+        return cached[1]
+
+    def document_name(self, template_name, context):
+        key = hashlib.sha256()
+        key.update(self._template_digest(template_name).encode())
+        key.update(json.dumps(context, ensure_ascii=False, sort_keys=True, default=str).encode())
+        return f"contract_{key.hexdigest()[:32]}.pdf"
+
+    def render(self, student_data, exam):
+        """Имя готового PDF в docs_path или None, если документ ещё генерируется."""
+        template_name = select_template(student_data)
+        context = build_context(student_data, exam)
+        filename = self.document_name(template_name, context)
+        path = os.path.join(self.docs_path, filename)
+
+        if os.path.exists(path):
+            if self.on_document is not None:
+                self.on_document(path)
+            return filename
+
+        with self._lock:
+            error = self._errors.pop(filename, None)
+            if error is not None:
+                raise RuntimeError(f"Ошибка генерации договора: {error}")
+            future = self._pending.get(filename)
+            if future is None:
+                if self._executor is None:
+                    self._executor = ProcessPoolExecutor(max_workers=CONTRACTS_WORKERS)
+                html = self.env.get_template(template_name).render(context)
+                future = self._executor.submit(_render_pdf, html, path, self.options)
+                self._pending[filename] = future
+                future.add_done_callback(lambda f, name=filename: self._done(name, f))
+        return None
+
+    def _done(self, filename, future):
+        error = future.exception()
+        with self._lock:
+            self._pending.pop(filename, None)
+            if error is not None:
+                self._errors[filename] = error
+        if error is not None:
+            logger.error(f"Ошибка генерации договора {filename}: {error}")
+        elif self.on_document is not None:
+            self.on_document(future.result())
@@ -1,9 +1,531 @@
+import os
+import queue
+import re
 import sqlite3
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+import metrics
+import records
+
+DB_PATH = os.environ["DB_PATH"] if "DB_PATH" in os.environ else "chinaekb.db"
+DB_POOL_SIZE = int(os.environ["DB_POOL_SIZE"]) if "DB_POOL_SIZE" in os.environ else 4
+DB_BUSY_TIMEOUT = int(os.environ["DB_BUSY_TIMEOUT"]) if "DB_BUSY_TIMEOUT" in os.environ else 5000  # мс
+DB_CACHE_SIZE = int(os.environ["DB_CACHE_SIZE"]) if "DB_CACHE_SIZE" in os.environ else 8192  # КБ
+DB_MMAP_SIZE = int(os.environ["DB_MMAP_SIZE"]) if "DB_MMAP_SIZE" in os.environ else 64 * 1024 * 1024
+DB_STATEMENT_CACHE = 256
+
+
+def _gevent_patched():
+    # Воркер gunicorn gevent подменяет socket и time до импорта приложения
+    monkey = sys.modules.get("gevent.monkey")
+    return monkey is not None and monkey.is_module_patched("socket")
+
+
+# В режиме gevent ожидание блокировки внутри SQLite (busy_timeout) останавливает
+# все запросы процесса, поэтому вместо него - повтор с кооперативным time.sleep
+DB_COOPERATIVE = os.environ["DB_COOPERATIVE"] != "0" if "DB_COOPERATIVE" in os.environ else _gevent_patched()
+
+# Настройки соединения. journal_mode=WAL сохраняется в самом файле базы,
+# остальные параметры действуют только на текущее соединение.
+PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    f"PRAGMA busy_timeout = {DB_BUSY_TIMEOUT}",
+    f"PRAGMA cache_size = -{DB_CACHE_SIZE}",
+    f"PRAGMA mmap_size = {DB_MMAP_SIZE}",
+    "PRAGMA temp_store = MEMORY",
+)
+
+
+# Первое слово SQL-выражения - метка операции в db_query_duration_seconds
+_operations = {}
+
+
+def _operation(sql):
+    operation = _operations.get(sql)
+    if operation is None:
+        operation = sql.split(None, 1)[0].upper() if sql.strip() else ''
+        if len(_operations) < 1000:
+            _operations[sql] = operation
+    return operation
+
+
+def _is_busy(error):
+    # Только SQLITE_BUSY: BUSY_SNAPSHOT и прочие расширенные коды повтором не лечатся
+    code = getattr(error, "sqlite_errorcode", None)
+    return code == sqlite3.SQLITE_BUSY if code is not None else str(error) == "database is locked"
+
+
+class TimedConnection(sqlite3.Connection):
+    """Соединение, замеряющее execute, executemany и commit для metrics.
+
+    При cooperative = True (DB_COOPERATIVE) busy_timeout у соединения нулевой,
+    а SQLITE_BUSY повторяется с нарастающей паузой через time.sleep, который
+    под gevent отдаёт управление другим запросам, в пределах DB_BUSY_TIMEOUT.
+    """
+
+    cooperative = False
+
+    def _call(self, method, *args):
+        if not self.cooperative:
+            return method(*args)
+        deadline = None
+        delay = 0.001
+        while True:
+            try:
+                return method(*args)
+            except sqlite3.OperationalError as e:
+                if not _is_busy(e):
+                    raise
+                now = time.monotonic()
+                if deadline is None:
+                    deadline = now + DB_BUSY_TIMEOUT / 1000
+                if now >= deadline:
+                    raise
+                time.sleep(min(delay, deadline - now))
+                delay = min(delay * 2, 0.05)
+
+    def execute(self, sql, parameters=()):
+        start = time.perf_counter()
+        try:
+            return self._call(super().execute, sql, parameters)
+        finally:
+            metrics.DB_QUERY_DURATION.observe(time.perf_counter() - start, _operation(sql))
+
+    def executemany(self, sql, parameters):
+        start = time.perf_counter()
+        try:
+            return self._call(super().executemany, sql, parameters)
+        finally:
+            metrics.DB_QUERY_DURATION.observe(time.perf_counter() - start, _operation(sql))
+
+    def commit(self):
+        start = time.perf_counter()
+        try:
+            return self._call(super().commit)
+        finally:
+            metrics.DB_QUERY_DURATION.observe(time.perf_counter() - start, 'COMMIT')
+
+
+def connect(path=None):
+    conn = sqlite3.connect(path or DB_PATH, timeout=0 if DB_COOPERATIVE else DB_BUSY_TIMEOUT / 1000,
+                           factory=TimedConnection, cached_statements=DB_STATEMENT_CACHE, check_same_thread=False)
+    conn.cooperative = DB_COOPERATIVE
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+    if DB_COOPERATIVE:
+        conn.execute('PRAGMA busy_timeout = 0')
+    return conn
+
+
+class ConnectionPool:
+    """Пул соединений одного процесса gunicorn.
+
+    Простаивающие соединения хранятся в LIFO-очереди, чтобы чаще
+    использовалось "тёплое" соединение с заполненным кэшем выражений.
+    После fork пул пересоздаётся: соединения SQLite нельзя делить между процессами.
+    """
+
+    def __init__(self, path, size):
+        self.path = path
+        self.size = size
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self._idle = queue.LifoQueue(maxsize=size)
+
+    def _check_pid(self):
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._idle = queue.LifoQueue(maxsize=self.size)
+                    self._pid = os.getpid()
+
+    def acquire(self):
+        self._check_pid()
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            return connect(self.path)
+
+    def release(self, conn):
+        if conn.in_transaction:
+            conn.rollback()
+        if self._pid != os.getpid():
+            conn.close()
+            return
+        try:
+            self._idle.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    def close_all(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+pool = ConnectionPool(DB_PATH, DB_POOL_SIZE)
+
+
+@contextmanager
+def connection():
+    """Соединение из пула. Незакоммиченная транзакция откатывается при возврате."""
+    conn = pool.acquire()
+    try:
+        yield conn
+    finally:
+        pool.release(conn)
+
+
+@contextmanager
+def transaction():
+    """Соединение из пула в транзакции: commit при успехе, rollback при исключении."""
+    with connection() as conn:
+        try:
+            yield conn
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+
+
+# Таблицы заявок, которые можно подставлять в запросы по имени из URL
+APPLICATION_TABLES = ('students', 'adult_students')
+
+
+def count_applications(conn, table_name, status='all'):
+    if status == 'all':
+        return conn.execute(f'SELECT COUNT(*) FROM {table_name}').fetchone()[0]
+    return conn.execute(f'SELECT COUNT(*) FROM {table_name} WHERE status = ?', (status,)).fetchone()[0]
+
+
+def fetch_applications_page(conn, table_name, status='all', limit=20, after=None, before=None):
+    """Страница заявок с постраничной навигацией по ключу (id).
+
+    after  - вернуть записи с id больше курсора (следующая страница),
+    before - записи с id меньше курсора (предыдущая страница).
+    Возвращает (rows, has_more): rows - records.Summary (только поля списка),
+    has_more - есть ли записи дальше в направлении перехода.
+    """
+    conditions = []
+    params = []
+    if status != 'all':
+        conditions.append('status = ?')
+        params.append(status)
+    if before is not None:
+        conditions.append('id < ?')
+        params.append(before)
+        order = 'DESC'
+    else:
+        if after is not None:
+            conditions.append('id > ?')
+            params.append(after)
+        order = 'ASC'
+
+    query = f'SELECT {records.select(records.SUMMARY_COLUMNS)} FROM {table_name}'
+    if conditions:
+        query += ' WHERE ' + ' AND '.join(conditions)
+    query += f' ORDER BY id {order} LIMIT ?'
+    params.append(limit + 1)
+
+    rows = list(map(records.Summary._make, conn.execute(query, params)))
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if before is not None:
+        rows.reverse()
+    return rows, has_more
+
+
+def fetch_applications_by_ids(conn, table_name, ids, chunk_size=500):
+    """Заявки вместе с представителями одним запросом на пачку id.
+
+    Возвращает словарь {id: (student, representative)} с записями records;
+    representative равен None для взрослых и для заявок без представителя.
+    """
+    result = {}
+    ids = list(ids)
+    record = records.APPLICATIONS[table_name]
+    for start in range(0, len(ids), chunk_size):
+        chunk = ids[start:start + chunk_size]
+        placeholders = ', '.join('?' * len(chunk))
+        if table_name == 'students':
+            c = conn.execute(f'''
+                SELECT {records.select(records.STUDENT_COLUMNS, 's')}, {records.select(records.REPRESENTATIVE_COLUMNS, 'r')}
+                FROM students s
+                LEFT JOIN representatives r ON r.student_id = s.id
+                WHERE s.id IN ({placeholders})
+            ''', chunk)
+            split = len(records.STUDENT_COLUMNS)
+            for row in c:
+                if row[0] not in result:
+                    result[row[0]] = (record._make(row[:split]),
+                                      records.Representative._make(row[split:]) if row[split] is not None else None)
+        else:
+            c = conn.execute(f'SELECT {records.select(record._fields)} FROM {table_name} WHERE id IN ({placeholders})', chunk)
+            for row in c:
+                result[row[0]] = (record._make(row), None)
+    return result
+
+
+# Полнотекстовый поиск заявок (FTS5). Одна строка индекса на студента, взрослого
+# или представителя; rowid = id * 4 + номер таблицы-источника, student_id - заявка,
+# на которую ведёт найденная строка (для представителя - несовершеннолетний студент).
+SEARCH_COLUMNS = ('last_name', 'first_name', 'middle_name', 'phone', 'email', 'documents')
+SEARCH_SOURCES = {
+    # таблица-источник: (номер в rowid, таблица заявки, столбец с id заявки)
+    'students': (0, 'students', 'id'),
+    'adult_students': (1, 'adult_students', 'id'),
+    'representatives': (2, 'students', 'student_id'),
+}
+# Веса bm25 по столбцам индекса (первый - student_id, не индексируется)
+SEARCH_WEIGHTS = (0, 10, 5, 3, 2, 2, 2)
+SEARCH_CANDIDATES = 1000
+
+
+def _fold_sql(expression):
+    # unicode61 не приводит "ё" к "е" - делаем это при индексации и в запросе
+    return f"replace(replace({expression}, 'ё', 'е'), 'Ё', 'Е')"
+
+
+def _search_values(prefix):
+    columns = [prefix + i for i in SEARCH_COLUMNS[:-1]]
+    documents = " || ' ' || ".join(f"COALESCE({prefix}{i}, '')" for i in ('snils', 'id_serial', 'id_number'))
+    return ', '.join(_fold_sql(i) for i in columns + [documents])
+
+
+def _create_search_index(conn):
+    columns = ', '.join(SEARCH_COLUMNS)
+    conn.execute(f'''
+        CREATE VIRTUAL TABLE IF NOT EXISTS applications_fts USING fts5(
+            student_id UNINDEXED, {columns},
+            tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3'
+        )
+    ''')
+    conn.execute("INSERT INTO applications_fts (applications_fts, rank) VALUES ('rank', ?)",
+                 (f"bm25({', '.join(map(str, SEARCH_WEIGHTS))})",))
+    watched = ', '.join(SEARCH_COLUMNS[:-1] + ('snils', 'id_serial', 'id_number'))
+    for source, (number, _, id_column) in SEARCH_SOURCES.items():
+        insert = f'''
+            INSERT INTO applications_fts (rowid, student_id, {columns})
+            VALUES (new.id * 4 + {number}, new.{id_column}, {_search_values('new.')});
+        '''
+        delete = f'DELETE FROM applications_fts WHERE rowid = old.id * 4 + {number};'
+        conn.execute(f'CREATE TRIGGER IF NOT EXISTS {source}_fts_insert AFTER INSERT ON {source} BEGIN {insert} END')
+        conn.execute(f'CREATE TRIGGER IF NOT EXISTS {source}_fts_update AFTER UPDATE OF {watched} ON {source} '
+                     f'BEGIN {delete} {insert} END')
+        conn.execute(f'CREATE TRIGGER IF NOT EXISTS {source}_fts_delete AFTER DELETE ON {source} BEGIN {delete} END')
+        conn.execute(f'''
+            INSERT INTO applications_fts (rowid, student_id, {columns})
+            SELECT id * 4 + {number}, {id_column}, {_search_values('')} FROM {source}
+        ''')
+
+
+def search_applications(conn, query, limit=50):
+    """Поиск заявок по ФИО, телефону, email и номерам документов (студента и представителя).
+
+    Каждое слово запроса ищется как префикс, слова объединяются через И.
+    Возвращает [(table_name, student_id), ...] по убыванию релевантности.
+    """
+    terms = re.findall(r'\w+', query.replace('ё', 'е').replace('Ё', 'Е'))
+    if not terms:
+        return []
+    match = ' '.join(f'"{term}"*' for term in terms)
+    tables = {number: table for number, table, _ in SEARCH_SOURCES.values()}
+
+    # bm25 считается только для SEARCH_CANDIDATES самых новых совпадений: при частом
+    # слове ("иван", домен почты) ранжирование всех строк индекса заняло бы сотни мс.
+    # Студент и его представитель могут найтись оба - берём с запасом и убираем повторы.
+    result = []
+    seen = set()
+    rows = conn.execute('''
+        SELECT rowid, student_id FROM (
+            SELECT rowid, student_id, rank FROM applications_fts WHERE applications_fts MATCH ?
+            ORDER BY rowid DESC LIMIT ?
+        ) ORDER BY rank LIMIT ?
+    ''', (match, SEARCH_CANDIDATES, limit * 2))
+    for rowid, student_id in rows:
+        key = (tables[rowid % 4], student_id)
+        if key not in seen:
+            seen.add(key)
+            result.append(key)
+            if len(result) == limit:
+                break
+    return result
+
+
+# Миграции схемы. Номер последней применённой миграции хранится в PRAGMA user_version,
+# поэтому существующая база обновляется на месте без потери данных.
+# Элемент списка - SQL-выражение или функция, принимающая соединение.
+# Справочник экзаменов на момент переноса из select_exam(): код, тип, уровень, название, цена
+EXAM_CATALOG_SEED = (
+    ('1', 'HSK', '1', 'HSK (Уровень 1)', 2000),
+    ('2', 'HSK', '2', 'HSK (Уровень 2)', 2000),
+    ('3', 'HSK', '3', 'HSK (Уровень 3)', 3000),
+    ('4', 'HSK', '4', 'HSK (Уровень 4)', 3000),
+    ('5', 'HSK', '5', 'HSK (Уровень 5)', 4000),
+    ('6', 'HSK', '6', 'HSK (Уровень 6)', 4000),
+    ('7', 'HSKK', 'базовый', 'HSKK (Базовый уровень)', 2000),
+    ('8', 'HSKK', 'средний', 'HSKK (Средний уровень)', 3000),
+    ('9', 'HSKK', 'высокий', 'HSKK (Высокий уровень)', 4000),
+    ('10', 'BCT', 'A', 'BCT (A)', 2000),
+    ('11', 'BCT', 'B', 'BCT (B)', 3000),
+    ('12', 'YCT', '1', 'YCT (Уровень 1)', 1000),
+    ('13', 'YCT', '2', 'YCT (Уровень 2)', 1000),
+    ('14', 'YCT', '3', 'YCT (Уровень 3)', 1500),
+    ('15', 'YCT', '4', 'YCT (Уровень 4)', 1500),
+)
+
+
+def _create_exam_catalog(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS exam_catalog (
+            code TEXT PRIMARY KEY,
+            exam_type TEXT NOT NULL,
+            level TEXT NOT NULL,
+            label TEXT NOT NULL,
+            price INTEGER NOT NULL,
+            position INTEGER NOT NULL,
+            active INTEGER NOT NULL DEFAULT 1
+        )
+    ''')
+    # Номер версии справочника: воркеры перечитывают его, только когда номер изменился
+    conn.execute('CREATE TABLE IF NOT EXISTS exam_catalog_version (id INTEGER PRIMARY KEY CHECK (id = 1), version INTEGER NOT NULL)')
+    conn.execute('INSERT OR IGNORE INTO exam_catalog_version (id, version) VALUES (1, 1)')
+    for event in ('INSERT', 'UPDATE', 'DELETE'):
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS exam_catalog_{event.lower()} AFTER {event} ON exam_catalog BEGIN
+                UPDATE exam_catalog_version SET version = version + 1 WHERE id = 1;
+            END
+        ''')
+    conn.executemany(
+        'INSERT OR IGNORE INTO exam_catalog (code, exam_type, level, label, price, position) VALUES (?, ?, ?, ?, ?, ?)',
+        [row + (position,) for position, row in enumerate(EXAM_CATALOG_SEED, start=1)],
+    )
+
+
+MIGRATIONS = [
+    # 1: индексы для фильтра модерации, поиска представителя и поиска по ФИО
+    (
+        'CREATE INDEX IF NOT EXISTS idx_students_status ON students (status, id)',
+        'CREATE INDEX IF NOT EXISTS idx_adult_students_status ON adult_students (status, id)',
+        'CREATE INDEX IF NOT EXISTS idx_students_submission_date ON students (submission_date)',
+        'CREATE INDEX IF NOT EXISTS idx_adult_students_submission_date ON adult_students (submission_date)',
+        'CREATE INDEX IF NOT EXISTS idx_representatives_student_id ON representatives (student_id)',
+        'CREATE INDEX IF NOT EXISTS idx_students_name ON students (last_name, first_name, birth_date)',
+        'CREATE INDEX IF NOT EXISTS idx_adult_students_name ON adult_students (last_name, first_name, birth_date)',
+    ),
+    # 2: очередь отправки договоров в 1С (см. outbox.py)
+    (
+        '''
+        CREATE TABLE IF NOT EXISTS outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            table_name TEXT NOT NULL,
+            student_id INTEGER NOT NULL,
+            payload TEXT NOT NULL,
+            state TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at REAL NOT NULL,
+            locked_until REAL,
+            last_error TEXT,
+            created_at TEXT NOT NULL,
+            delivered_at TEXT
+        )
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_outbox_due ON outbox (state, next_attempt_at)',
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_outbox_active ON outbox (table_name, student_id) WHERE state IN ('pending', 'sending')",
+    ),
+    # 3: счётчики ссылок хранилища загрузок (см. uploads.py)
+    (
+        '''
+        CREATE TABLE IF NOT EXISTS uploads (
+            key TEXT PRIMARY KEY,
+            size INTEGER NOT NULL,
+            refcount INTEGER NOT NULL,
+            created_at TEXT NOT NULL
+        )
+        ''',
+    ),
+    # 4: журнал изменений заявок для сброса кэшей воркеров (см. details_cache.py)
+    (
+        '''
+        CREATE TABLE IF NOT EXISTS cache_invalidations (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            table_name TEXT NOT NULL,
+            student_id INTEGER NOT NULL
+        )
+        ''',
+    ),
+    # 5: полнотекстовый индекс для поиска заявок в модерации
+    (
+        _create_search_index,
+    ),
+    # 6: отпечаток заявки и ссылка на более раннюю заявку того же человека (см. duplicates.py)
+    (
+        'ALTER TABLE students ADD COLUMN fingerprint TEXT',
+        'ALTER TABLE students ADD COLUMN duplicate_of INTEGER',
+        'ALTER TABLE adult_students ADD COLUMN fingerprint TEXT',
+        'ALTER TABLE adult_students ADD COLUMN duplicate_of INTEGER',
+        'CREATE INDEX IF NOT EXISTS idx_students_fingerprint ON students (fingerprint)',
+        'CREATE INDEX IF NOT EXISTS idx_adult_students_fingerprint ON adult_students (fingerprint)',
+    ),
+    # 7: справочник экзаменов вместо цепочки условий в select_exam() (см. exams.py)
+    (
+        _create_exam_catalog,
+    ),
+]
+
+
+def schema_version(conn):
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+
+def migrate(conn):
+    """Применяет недостающие миграции, каждую в отдельной транзакции.
+
+    BEGIN IMMEDIATE не даёт двум воркерам gunicorn применить одну миграцию дважды:
+    второй дождётся блокировки и увидит уже обновлённую версию.
+    """
+    isolation_level = conn.isolation_level
+    conn.isolation_level = None
+    try:
+        for number, steps in enumerate(MIGRATIONS, start=1):
+            if schema_version(conn) >= number:
+                continue
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                if schema_version(conn) >= number:
+                    conn.execute('COMMIT')
+                    continue
+                for step in steps:
+                    if callable(step):
+                        step(conn)
+                    else:
+                        conn.execute(step)
+                conn.execute(f'PRAGMA user_version = {number}')
+                conn.execute('COMMIT')
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+    finally:
+        conn.isolation_level = isolation_level
+
 
 def init_db():
-    conn = sqlite3.connect('chinaekb.db')
+    conn = connect()
     c = conn.cursor()
 
+    # Новая база - с incremental auto_vacuum: место после архивации заявок
+    # возвращается порциями (см. archive.py). Режим применяется VACUUM, который
+    # для пустой базы мгновенный; существующие базы переводятся отдельно
+    if conn.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()[0] == 0:
+        conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+        conn.execute('VACUUM')
+
     # Создание таблицы для хранения данных о студентах
     c.execute('''
         CREATE TABLE IF NOT EXISTS students (
@@ -85,6 +607,7 @@ def init_db():
     ''')
 
     conn.commit()
+    migrate(conn)
     conn.close()
 
-init_db()
\ No newline at end of file
+init_db()
@@ -0,0 +1,98 @@
+import os
+import threading
+from collections import OrderedDict
+
+import db
+
+DETAILS_CACHE_SIZE = int(os.environ["DETAILS_CACHE_SIZE"]) if "DETAILS_CACHE_SIZE" in os.environ else 1024
+# Сколько последних записей журнала инвалидации хранить в базе
+INVALIDATION_LOG_SIZE = 10000
+# Как часто (в записях журнала) удалять записи старше INVALIDATION_LOG_SIZE
+INVALIDATION_PRUNE_EVERY = 1000
+
+
+def invalidate(conn, table_name, student_ids):
+    """Отмечает изменение заявок в журнале в транзакции вызывающего кода.
+
+    Кэши всех процессов увидят запись при следующем обращении и выбросят эти заявки.
+    """
+    first = seq = None
+    for student_id in student_ids:
+        seq = conn.execute('INSERT INTO cache_invalidations (table_name, student_id) VALUES (?, ?)',
+                           (table_name, student_id)).lastrowid
+        if first is None:
+            first = seq
+    # Чистка раз в INVALIDATION_PRUNE_EVERY записей: пачка (пакетная модерация, архивация)
+    # добавляет несколько seq сразу, поэтому проверяется, перешёл ли диапазон через кратное
+    if seq is not None and seq // INVALIDATION_PRUNE_EVERY > (first - 1) // INVALIDATION_PRUNE_EVERY:
+        conn.execute('DELETE FROM cache_invalidations WHERE seq <= ?', (seq - INVALIDATION_LOG_SIZE,))
+
+
+class ApplicationCache:
+    """LRU-кэш заявок (студент и представитель) по ключу (таблица, id).
+
+    Общий для процессов счётчик - seq последней записи таблицы
+    cache_invalidations. Перед каждым чтением кэш дочитывает журнал с
+    последнего увиденного seq и выбрасывает изменённые заявки; если
+    нужные записи журнала уже удалены, кэш очищается целиком.
+    """
+
+    def __init__(self, size=DETAILS_CACHE_SIZE):
+        self.size = size
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0, "size": 0, "hit_rate": 0.0}
+        self._entries = OrderedDict()
+        self._seq = None
+        self._lock = threading.Lock()
+
+    def sync(self, conn):
+        with self._lock:
+            seq = self._seq
+        if seq is None:
+            rows = []
+            last = conn.execute('SELECT COALESCE(MAX(seq), 0) FROM cache_invalidations').fetchone()[0]
+        else:
+            rows = conn.execute('SELECT seq, table_name, student_id FROM cache_invalidations WHERE seq > ? ORDER BY seq',
+                                (seq,)).fetchall()
+            last = rows[-1][0] if rows else seq
+
+        with self._lock:
+            if self._seq != seq:
+                # Журнал параллельно дочитал другой поток
+                return
+            if seq is None or (rows and rows[0][0] != seq + 1):
+                self.stats["invalidations"] += len(self._entries)
+                self._entries.clear()
+            else:
+                for _, table_name, student_id in rows:
+                    if self._entries.pop((table_name, student_id), None) is not None:
+                        self.stats["invalidations"] += 1
+            self._seq = last
+            self.stats["size"] = len(self._entries)
+
+    def get(self, conn, table_name, student_id):
+        """(student, representative) из кэша или из базы; None, если заявки нет."""
+        self.sync(conn)
+        key = (table_name, student_id)
+        with self._lock:
+            application = self._entries.get(key)
+            if application is not None:
+                self._entries.move_to_end(key)
+                self.stats["hits"] += 1
+                self._update_hit_rate()
+                return application
+            self.stats["misses"] += 1
+            self._update_hit_rate()
+
+        application = db.fetch_applications_by_ids(conn, table_name, [student_id]).get(student_id)
+        if application is not None and self.size > 0:
+            with self._lock:
+                self._entries[key] = application
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.size:
+                    self._entries.popitem(last=False)
+                    self.stats["evictions"] += 1
+                self.stats["size"] = len(self._entries)
+        return application
+
+    def _update_hit_rate(self):
+        self.stats["hit_rate"] = round(self.stats["hits"] / (self.stats["hits"] + self.stats["misses"]), 4)
@@ -0,0 +1,135 @@
+import heapq
+import logging
+import os
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows: блокировки нет, полное сканирование делает каждый процесс
+    fcntl = None
+
+DOCS_SWEEP_INTERVAL = float(os.environ["DOCS_SWEEP_INTERVAL"]) if "DOCS_SWEEP_INTERVAL" in os.environ else 60  # с
+DOCS_SWEEP_BATCH = int(os.environ["DOCS_SWEEP_BATCH"]) if "DOCS_SWEEP_BATCH" in os.environ else 500
+
+LOCK_NAME = ".sweeper.lock"
+
+logger = logging.getLogger(__name__)
+
+
+class DocsSweeper:
+    """Удаление устаревших документов из DOCS_PATH в фоновом потоке.
+
+    Каждый процесс держит кучу сроков истечения для документов, которые он
+    создал или выдал, и раз в DOCS_SWEEP_INTERVAL удаляет истёкшие пачками
+    до DOCS_SWEEP_BATCH файлов. Документы других (в том числе завершившихся)
+    процессов подхватывает полное сканирование каталога раз в ttl; его делает
+    только процесс, захвативший файловую блокировку LOCK_NAME.
+    Перед удалением mtime проверяется заново: документ, выданный повторно
+    (os.utime в touch()), живёт ещё ttl секунд.
+    """
+
+    def __init__(self, docs_path, ttl, interval=DOCS_SWEEP_INTERVAL, batch=DOCS_SWEEP_BATCH):
+        self.docs_path = docs_path
+        self.ttl = ttl
+        self.interval = interval
+        self.batch = batch
+        self.stats = {"runs": 0, "scans": 0, "tracked": 0, "files_reclaimed": 0, "bytes_reclaimed": 0}
+        self._heap = []
+        self._expiry = {}
+        self._lock = threading.Lock()
+        self._lock_file = None
+        self._last_scan = 0
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="docs-sweeper", daemon=True)
+
+    def start(self):
+        if self.ttl > 0:
+            self._thread.start()
+
+    def stop(self, timeout=None):
+        self._stopped.set()
+        if self._thread.is_alive():
+            self._thread.join(timeout)
+
+    def track(self, path, mtime=None):
+        """Регистрирует документ; срок истечения - mtime + ttl."""
+        expiry = (mtime if mtime is not None else time.time()) + self.ttl
+        with self._lock:
+            if self._expiry.get(path) == expiry:
+                return
+            self._expiry[path] = expiry
+            heapq.heappush(self._heap, (expiry, path))
+            self.stats["tracked"] = len(self._expiry)
+
+    def touch(self, path):
+        """Продлевает жизнь документа при повторной выдаче."""
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return
+        self.track(path)
+
+    def _is_leader(self):
+        if fcntl is None:
+            return True
+        if self._lock_file is None:
+            lock_file = open(os.path.join(self.docs_path, LOCK_NAME), "a")
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                lock_file.close()
+                return False
+            self._lock_file = lock_file
+        return True
+
+    def scan(self):
+        with os.scandir(self.docs_path) as entries:
+            for entry in entries:
+                if entry.name.startswith(".") or not entry.is_file():
+                    continue
+                self.track(entry.path, entry.stat().st_mtime)
+        self._last_scan = time.time()
+        self.stats["scans"] += 1
+
+    def sweep(self, now=None):
+        """Удаляет до batch истёкших документов. Возвращает число удалённых файлов."""
+        now = now if now is not None else time.time()
+        expired = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now and len(expired) < self.batch:
+                expiry, path = heapq.heappop(self._heap)
+                if self._expiry.get(path) == expiry:
+                    del self._expiry[path]
+                    expired.append(path)
+            self.stats["tracked"] = len(self._expiry)
+
+        removed = 0
+        for path in expired:
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            if stat.st_mtime + self.ttl > now:
+                self.track(path, stat.st_mtime)
+                continue
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                continue
+            removed += 1
+            self.stats["files_reclaimed"] += 1
+            self.stats["bytes_reclaimed"] += stat.st_size
+        self.stats["runs"] += 1
+        return removed
+
+    def _run(self):
+        while not self._stopped.is_set():
+            try:
+                if self._is_leader() and time.time() - self._last_scan >= self.ttl:
+                    self.scan()
+                while self.sweep() >= self.batch:
+                    pass
+            except Exception as e:
+                logger.error(f"Ошибка очистки {self.docs_path}: {e}")
+            self._stopped.wait(self.interval)
@@ -0,0 +1,108 @@
+"""Поиск повторных заявок по отпечатку: нормализованные ФИО + дата рождения + номер документа.
+
+Заполнение отпечатков у заявок, поданных до появления проверки (пачками):
+    python duplicates.py backfill [--batch 500]
+"""
+import argparse
+import datetime
+import hashlib
+import os
+import re
+
+import db
+import details_cache
+
+# Повторная отправка той же формы в пределах окна (двойной клик, обновление страницы)
+# не создаёт новую заявку; остальные совпадения помечаются для модератора.
+DUPLICATE_MERGE_WINDOW = int(os.environ["DUPLICATE_MERGE_WINDOW"]) if "DUPLICATE_MERGE_WINDOW" in os.environ else 600  # с
+
+# Столбцы, из которых считается отпечаток
+FINGERPRINT_COLUMNS = ('last_name', 'first_name', 'middle_name', 'birth_date', 'id_number')
+
+
+def _normalize(value):
+    return re.sub(r'\s+', ' ', str(value or '')).strip().lower().replace('ё', 'е')
+
+
+def fingerprint(last_name, first_name, middle_name, birth_date, id_number):
+    parts = [_normalize(i) for i in (last_name, first_name, middle_name, birth_date)]
+    parts.append(re.sub(r'\D', '', str(id_number or '')))
+    return hashlib.sha256('|'.join(parts).encode()).hexdigest()[:32]
+
+
+def find_duplicate(conn, table_name, value, before_id=None):
+    """Самая ранняя не отклонённая заявка с тем же отпечатком: (id, study_plan, status, submission_date)."""
+    query = f"SELECT id, study_plan, status, submission_date FROM {table_name} WHERE fingerprint = ? AND status != 'отклонено'"
+    params = [value]
+    if before_id is not None:
+        query += ' AND id < ?'
+        params.append(before_id)
+    return conn.execute(query + ' ORDER BY id LIMIT 1', params).fetchone()
+
+
+def find_resubmission(conn, table_name, value, now, columns, values, file_keys, representative=None):
+    """id заявки, повторной отправкой которой является новая, или None.
+
+    Повтор - заявка "на проверке" того же человека в пределах DUPLICATE_MERGE_WINDOW,
+    у которой совпадают значения всех столбцов columns (в том числе постоянные
+    столбцы формы: study_plan, age_group, id_type), набор файлов (ключи - хэши
+    содержимого) и данные представителя. Иначе новая заявка сохраняется и только
+    получает отметку duplicate_of.
+    """
+    since = (now - datetime.timedelta(seconds=DUPLICATE_MERGE_WINDOW)).strftime('%Y-%m-%d %H:%M:%S')
+    candidates = conn.execute(f'''
+        SELECT id, file_paths, {', '.join(columns)} FROM {table_name}
+        WHERE fingerprint = ? AND status = 'на проверке' AND submission_date >= ?
+        ORDER BY id DESC
+    ''', (value, since)).fetchall()
+    for student_id, file_paths, *row in candidates:
+        if row != list(values) or sorted(file_paths.split(',') if file_paths else []) != sorted(file_keys):
+            continue
+        if representative is not None:
+            representative_columns, representative_values = representative
+            stored = conn.execute(f'''
+                SELECT {', '.join(representative_columns)} FROM representatives WHERE student_id = ?
+            ''', (student_id,)).fetchone()
+            if stored is None or list(stored) != list(representative_values):
+                continue
+        return student_id
+    return None
+
+
+def backfill(table_name, batch=500):
+    """Считает отпечатки и отметки дубликатов у заявок без отпечатка. Возвращает число обновлённых строк."""
+    columns = ', '.join(FINGERPRINT_COLUMNS)
+    updated = 0
+    last_id = 0
+    while True:
+        # Каждая пачка - отдельная короткая транзакция, чтобы не держать блокировку записи
+        with db.transaction() as conn:
+            rows = conn.execute(f'''
+                SELECT id, {columns} FROM {table_name} WHERE id > ? AND fingerprint IS NULL ORDER BY id LIMIT ?
+            ''', (last_id, batch)).fetchall()
+            for row in rows:
+                value = fingerprint(*row[1:])
+                duplicate = find_duplicate(conn, table_name, value, before_id=row[0])
+                conn.execute(f'UPDATE {table_name} SET fingerprint = ?, duplicate_of = ? WHERE id = ?',
+                             (value, duplicate[0] if duplicate else None, row[0]))
+            # Карточки из кэшей воркеров должны показать новую отметку дубликата
+            details_cache.invalidate(conn, table_name, [row[0] for row in rows])
+        if not rows:
+            return updated
+        updated += len(rows)
+        last_id = rows[-1][0]
+        print(f"{table_name}: {updated}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("command", choices=["backfill"])
+    parser.add_argument("--batch", type=int, default=500)
+    args = parser.parse_args()
+
+    for table_name in db.APPLICATION_TABLES:
+        print(f"{table_name}: готово, обновлено {backfill(table_name, args.batch)}")
+
+
+if __name__ == "__main__":
+    main()
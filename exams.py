@@ -0,0 +1,151 @@
+"""Справочник экзаменов (таблица exam_catalog): код -> тип, уровень, название, цена.
+
+Изменение справочника без перевыкладки; воркеры подхватывают новую версию
+в течение EXAM_CATALOG_RELOAD_INTERVAL секунд:
+    python exams.py list
+    python exams.py set-price 3 3500
+    python exams.py set-active 11 0
+"""
+import argparse
+import collections
+import os
+import threading
+import time
+import types
+
+import db
+
+EXAM_CATALOG_RELOAD_INTERVAL = float(os.environ["EXAM_CATALOG_RELOAD_INTERVAL"]) if "EXAM_CATALOG_RELOAD_INTERVAL" in os.environ else 30  # с
+
+# Результат select_exam() для неизвестного или пустого кода
+UNKNOWN_EXAM = (0, 0, "_____________")
+
+Exam = collections.namedtuple('Exam', ('code', 'exam_type', 'level', 'label', 'price', 'position', 'active'))
+
+
+def _level(value):
+    # Числовые уровни (HSK, YCT) в договорах и выгрузках всегда были числами
+    return int(value) if value.isdigit() else value
+
+
+class Snapshot:
+    """Неизменяемый срез справочника одной версии.
+
+    Поиск по коду - словарь (MappingProxyType), кортеж (цена, уровень, тип)
+    для select_exam() собран заранее. При перезагрузке срез не меняется,
+    а заменяется новым, поэтому читать его можно без блокировок.
+    """
+
+    __slots__ = ('version', 'exams', 'active', '_by_code', '_selections')
+
+    def __init__(self, version, exams):
+        self.version = version
+        self.exams = tuple(exams)
+        self.active = tuple(i for i in self.exams if i.active)
+        self._by_code = types.MappingProxyType({i.code: i for i in self.exams})
+        self._selections = types.MappingProxyType({i.code: (i.price, _level(i.level), i.exam_type) for i in self.exams})
+
+    def get(self, code):
+        return self._by_code.get(code)
+
+    def select(self, code):
+        return self._selections.get(code, UNKNOWN_EXAM)
+
+    def totals(self, counts):
+        """Суммы по текущим ценам из количества заявок по кодам: [(код, число, сумма)], итог.
+
+        Заявки группируются в SQL (GROUP BY exam_selection), здесь - одно
+        умножение на код, а не проход по заявкам.
+        """
+        rows = []
+        for code, count in counts:
+            price = self.select(code)[0]
+            rows.append((code, count, price * count))
+        return rows, sum(i[2] for i in rows)
+
+
+class ExamCatalog:
+    """Справочник экзаменов процесса с перезагрузкой по номеру версии.
+
+    Не чаще раза в interval секунд читается номер версии (триггеры на
+    exam_catalog увеличивают его при любом изменении); таблица
+    перечитывается, только если номер изменился.
+    """
+
+    def __init__(self, interval=EXAM_CATALOG_RELOAD_INTERVAL):
+        self.interval = interval
+        self.reloads = 0
+        self._snapshot = None
+        self._checked_at = 0
+        self._lock = threading.Lock()
+
+    def _load(self, conn):
+        version = conn.execute('SELECT version FROM exam_catalog_version WHERE id = 1').fetchone()[0]
+        if self._snapshot is not None and self._snapshot.version == version:
+            return self._snapshot
+        rows = conn.execute('''
+            SELECT code, exam_type, level, label, price, position, active FROM exam_catalog ORDER BY position, code
+        ''').fetchall()
+        self.reloads += 1
+        return Snapshot(version, (Exam(*row) for row in rows))
+
+    def snapshot(self):
+        snapshot = self._snapshot
+        if snapshot is not None and time.monotonic() - self._checked_at < self.interval:
+            return snapshot
+        with self._lock:
+            if self._snapshot is None or time.monotonic() - self._checked_at >= self.interval:
+                with db.connection() as conn:
+                    self._snapshot = self._load(conn)
+                self._checked_at = time.monotonic()
+            return self._snapshot
+
+    def select(self, code):
+        """(цена, уровень, тип) по коду exam_selection - замена цепочки условий select_exam()."""
+        return self.snapshot().select(code)
+
+    @property
+    def stats(self):
+        snapshot = self._snapshot
+        return {"version": snapshot.version if snapshot else None, "exams": len(snapshot.exams) if snapshot else 0,
+                "reloads": self.reloads}
+
+
+def count_by_exam(conn, table_name, status='all'):
+    """Число заявок по кодам экзамена: [(код, число)]."""
+    query = f"SELECT exam_selection, COUNT(*) FROM {table_name} WHERE exam_selection IS NOT NULL AND exam_selection != ''"
+    params = []
+    if status != 'all':
+        query += ' AND status = ?'
+        params.append(status)
+    return conn.execute(query + ' GROUP BY exam_selection', params).fetchall()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("list")
+    set_price = subparsers.add_parser("set-price")
+    set_price.add_argument("code")
+    set_price.add_argument("price", type=int)
+    set_active = subparsers.add_parser("set-active")
+    set_active.add_argument("code")
+    set_active.add_argument("active", type=int, choices=[0, 1])
+    args = parser.parse_args()
+
+    if args.command == "list":
+        with db.connection() as conn:
+            for row in conn.execute('SELECT code, label, price, active FROM exam_catalog ORDER BY position, code'):
+                print("\t".join(str(i) for i in row))
+        return
+
+    column, value = ("price", args.price) if args.command == "set-price" else ("active", args.active)
+    with db.transaction() as conn:
+        updated = conn.execute(f'UPDATE exam_catalog SET {column} = ? WHERE code = ?', (value, args.code)).rowcount
+    if not updated:
+        raise SystemExit(f"Экзамен с кодом {args.code} не найден")
+    print(f"{args.code}: {column} = {value}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+import csv
+import datetime
+import io
+import re
+import zipfile
+from xml.sax.saxutils import escape
+
+import db
+
+# Сколько строк копится перед отправкой очередного куска ответа
+EXPORT_CHUNK_ROWS = 500
+
+HEADER = ("Группа", "ID", "Фамилия", "Имя", "Отчество", "Дата рождения", "Адрес", "Пол", "СНИЛС",
+          "Возрастная группа", "Тип документа", "Серия документа", "Номер документа", "Выдан", "Дата выдачи",
+          "Банковские реквизиты", "Телефон", "Email", "Учебный план", "Экзамен (код)", "Тип экзамена",
+          "Уровень экзамена", "Стоимость экзамена", "Дата экзамена", "Статус", "Дата подачи заявки",
+          "Представитель", "Телефон представителя", "Email представителя")
+
+# Столбцы заявки в порядке HEADER (без группы, данных экзамена и представителя)
+_COLUMNS = ('id', 'last_name', 'first_name', 'middle_name', 'birth_date', 'address', 'gender', 'snils', 'age_group',
+            'id_type', 'id_serial', 'id_number', 'id_issued_by', 'id_issued_date', 'bank_details', 'phone', 'email',
+            'study_plan', 'exam_selection', 'exam_date', 'status', 'submission_date')
+
+TABLE_TITLES = {'students': "Несовершеннолетние", 'adult_students': "Взрослые"}
+
+
+def parse_date(value):
+    """Дата фильтра 'ГГГГ-ММ-ДД' или None; ValueError при неверном формате."""
+    return datetime.datetime.strptime(value, '%Y-%m-%d').date() if value else None
+
+
+def _query(table_name, status, date_from, date_to):
+    if table_name == 'students':
+        columns = ', '.join(f's.{i}' for i in _COLUMNS)
+        query = f'''
+            SELECT {columns}, r.last_name, r.first_name, r.middle_name, r.phone, r.email
+            FROM students s LEFT JOIN representatives r ON r.student_id = s.id
+        '''
+        prefix = 's.'
+    else:
+        columns = ', '.join('NULL' if i == 'age_group' else i for i in _COLUMNS)
+        query = f'SELECT {columns}, NULL, NULL, NULL, NULL, NULL FROM {table_name}'
+        prefix = ''
+
+    conditions = []
+    params = []
+    if status != 'all':
+        conditions.append(f'{prefix}status = ?')
+        params.append(status)
+    if date_from is not None:
+        conditions.append(f'{prefix}submission_date >= ?')
+        params.append(date_from.isoformat())
+    if date_to is not None:
+        # Включительно: всё, что подано до начала следующего дня
+        conditions.append(f'{prefix}submission_date < ?')
+        params.append((date_to + datetime.timedelta(days=1)).isoformat())
+    if conditions:
+        query += ' WHERE ' + ' AND '.join(conditions)
+    return query + f' ORDER BY {prefix}id', params
+
+
+def iter_rows(tables, status='all', date_from=None, date_to=None, decode_exam=None):
+    """Строки выгрузки по одной, в порядке HEADER.
+
+    Соединение из пула держится, пока генератор не исчерпан или не закрыт;
+    строки читаются курсором по мере отправки, в памяти только текущая.
+    decode_exam(exam_selection) -> (стоимость, уровень, тип), как select_exam().
+    """
+    with db.connection() as conn:
+        for table_name in tables:
+            query, params = _query(table_name, status, date_from, date_to)
+            for row in conn.execute(query, params):
+                student = row[:len(_COLUMNS)]
+                representative = row[len(_COLUMNS):]
+                price, level, exam_type = decode_exam(student[18]) if decode_exam and student[18] else ('', '', '')
+                yield ((TABLE_TITLES[table_name],) + student[:19] + (exam_type, level, price) + student[19:]
+                       + (' '.join(i for i in representative[:3] if i),) + representative[3:])
+
+
+def csv_stream(rows):
+    """CSV для Excel: UTF-8 с BOM, разделитель ';'."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, delimiter=';')
+    buffer.write('\ufeff')
+    writer.writerow(HEADER)
+    for number, row in enumerate(rows, start=1):
+        writer.writerow(['' if i is None else i for i in row])
+        if number % EXPORT_CHUNK_ROWS == 0:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode('utf-8')
+
+
+class _Pipe:
+    # Поток без seek/tell: zipfile пишет в него в потоковом режиме (с дескрипторами данных)
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+_ILLEGAL_XML = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    '<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+    '</Types>'
+)
+_ROOT_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>'
+    '</Relationships>'
+)
+_WORKBOOK = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+    '<sheets><sheet name="Заявки" sheetId="1" r:id="rId1"/></sheets></workbook>'
+)
+_WORKBOOK_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet1.xml"/>'
+    '</Relationships>'
+)
+
+
+def _xlsx_row(values):
+    cells = []
+    for value in values:
+        if value is None or value == '':
+            cells.append('<c/>')
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            cells.append(f'<c><v>{value}</v></c>')
+        else:
+            text = escape(_ILLEGAL_XML.sub('', str(value)))
+            cells.append(f'<c t="inlineStr"><is><t xml:space="preserve">{text}</t></is></c>')
+    return f'<row>{"".join(cells)}</row>'
+
+
+def xlsx_stream(rows):
+    """Минимальная книга XLSX из одного листа, собираемая на лету.
+
+    Строки пишутся в лист как inline-строки (без общей таблицы строк), ZIP -
+    в потоковом режиме, поэтому память не зависит от числа строк.
+    """
+    pipe = _Pipe()
+    with zipfile.ZipFile(pipe, 'w', zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr('[Content_Types].xml', _CONTENT_TYPES)
+        archive.writestr('_rels/.rels', _ROOT_RELS)
+        archive.writestr('xl/workbook.xml', _WORKBOOK)
+        archive.writestr('xl/_rels/workbook.xml.rels', _WORKBOOK_RELS)
+        with archive.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True) as sheet:
+            sheet.write(('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                         '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+                         + _xlsx_row(HEADER)).encode('utf-8'))
+            chunk = []
+            for row in rows:
+                chunk.append(_xlsx_row(row))
+                if len(chunk) == EXPORT_CHUNK_ROWS:
+                    sheet.write(''.join(chunk).encode('utf-8'))
+                    chunk = []
+                    yield pipe.drain()
+            sheet.write((''.join(chunk) + '</sheetData></worksheet>').encode('utf-8'))
+    yield pipe.drain()
@@ -0,0 +1,58 @@
+"""Выдача загрузок и договоров: приложение проверяет доступ, байты отдаёт фронт-прокси.
+
+FILE_DELIVERY=x-accel (nginx) - ответ содержит только X-Accel-Redirect на
+internal-location, файл (с Range, ETag, sendfile) отдаёт nginx:
+    location /_protected/uploads/ { internal; alias /app/uploads/; }
+    location /_protected/docs/    { internal; alias /docs/; }
+FILE_DELIVERY=x-sendfile (Apache mod_xsendfile, lighttpd) - заголовок X-Sendfile
+с абсолютным путём.
+FILE_DELIVERY=app (по умолчанию, без прокси) - файл отдаёт воркер через
+send_file: Range, ETag, If-None-Match и If-Modified-Since (ответы 206/304).
+"""
+import mimetypes
+import os
+from urllib.parse import quote
+
+import flask
+
+FILE_DELIVERY = os.environ["FILE_DELIVERY"] if "FILE_DELIVERY" in os.environ else "app"
+X_ACCEL_PREFIX = os.environ["X_ACCEL_PREFIX"] if "X_ACCEL_PREFIX" in os.environ else "/_protected"
+UPLOADS_MAX_AGE = int(os.environ["UPLOADS_MAX_AGE"]) if "UPLOADS_MAX_AGE" in os.environ else 3600  # с
+
+FILE_DELIVERY_MODES = ('app', 'x-accel', 'x-sendfile')
+
+
+class FileSender:
+    """Ответ с файлом из каталога directory в выбранном режиме FILE_DELIVERY.
+
+    name - имя internal-location прокси (X_ACCEL_PREFIX/name/). Файлы
+    содержат персональные данные, поэтому кэшируются только браузером
+    (Cache-Control: private) на max_age секунд.
+    """
+
+    def __init__(self, directory, name, max_age, mode=FILE_DELIVERY, accel_prefix=X_ACCEL_PREFIX):
+        if mode not in FILE_DELIVERY_MODES:
+            raise ValueError(f"FILE_DELIVERY должен быть одним из {', '.join(FILE_DELIVERY_MODES)}: {mode}")
+        self.directory = os.path.abspath(directory)
+        self.location = f"{accel_prefix.rstrip('/')}/{name}/"
+        self.max_age = max_age
+        self.mode = mode
+        self.stats = {mode: 0 for mode in FILE_DELIVERY_MODES}
+
+    def send(self, path):
+        """path - путь к существующему файлу внутри directory (проверяет вызывающий код)."""
+        path = os.path.abspath(path)
+        self.stats[self.mode] += 1
+        if self.mode == 'app':
+            response = flask.send_file(path, conditional=True, etag=True, max_age=self.max_age)
+        else:
+            response = flask.Response(mimetype=mimetypes.guess_type(path)[0] or 'application/octet-stream')
+            if self.mode == 'x-accel':
+                relative = os.path.relpath(path, self.directory).replace(os.sep, '/')
+                response.headers['X-Accel-Redirect'] = self.location + quote(relative)
+            else:
+                response.headers['X-Sendfile'] = path
+            response.cache_control.max_age = self.max_age
+        response.cache_control.public = False
+        response.cache_control.private = True
+        return response
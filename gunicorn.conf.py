@@ -0,0 +1,30 @@
+# Настройки gunicorn из переменных окружения:
+#     gunicorn -c gunicorn.conf.py chinaekb-forms:app
+#
+# GUNICORN_WORKER_CLASS=gevent - асинхронные воркеры: медленная загрузка файла
+# или зависший запрос к 1С занимает одну гринлет-задачу, а не весь воркер.
+# socket, time и threading подменяются gevent до импорта приложения, поэтому
+# requests (отправка в 1С) и чтение тела запроса становятся кооперативными,
+# а db.py переключается на повтор блокировок SQLite без ожидания в busy_timeout.
+import os
+
+import metrics
+
+bind = os.environ["GUNICORN_BIND"] if "GUNICORN_BIND" in os.environ else "0.0.0.0:80"
+workers = int(os.environ["GUNICORN_WORKERS"]) if "GUNICORN_WORKERS" in os.environ else 2
+worker_class = os.environ["GUNICORN_WORKER_CLASS"] if "GUNICORN_WORKER_CLASS" in os.environ else "sync"
+# Одновременных соединений на воркер (только для gevent)
+worker_connections = int(os.environ["GUNICORN_WORKER_CONNECTIONS"]) if "GUNICORN_WORKER_CONNECTIONS" in os.environ else 200
+timeout = int(os.environ["GUNICORN_TIMEOUT"]) if "GUNICORN_TIMEOUT" in os.environ else 120
+graceful_timeout = int(os.environ["GUNICORN_GRACEFUL_TIMEOUT"]) if "GUNICORN_GRACEFUL_TIMEOUT" in os.environ else 30
+keepalive = int(os.environ["GUNICORN_KEEPALIVE"]) if "GUNICORN_KEEPALIVE" in os.environ else 5
+loglevel = os.environ["GUNICORN_LOG_LEVEL"] if "GUNICORN_LOG_LEVEL" in os.environ else "info"
+
+
+# Файлы метрик завершившихся воркеров переносятся в общий (см. metrics.Registry)
+def on_starting(server):
+    metrics.registry.fold()
+
+
+def child_exit(server, worker):
+    metrics.registry.fold(worker.pid)
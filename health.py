@@ -0,0 +1,100 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+import db
+import outbox
+
+HEALTH_CACHE_TTL = float(os.environ["HEALTH_CACHE_TTL"]) if "HEALTH_CACHE_TTL" in os.environ else 10  # с
+HEALTH_DB_LATENCY = float(os.environ["HEALTH_DB_LATENCY"]) if "HEALTH_DB_LATENCY" in os.environ else 0.5  # с
+HEALTH_MIN_FREE_MB = int(os.environ["HEALTH_MIN_FREE_MB"]) if "HEALTH_MIN_FREE_MB" in os.environ else 200
+HEALTH_OUTBOX_BACKLOG = int(os.environ["HEALTH_OUTBOX_BACKLOG"]) if "HEALTH_OUTBOX_BACKLOG" in os.environ else 100
+HEALTH_OUTBOX_AGE = float(os.environ["HEALTH_OUTBOX_AGE"]) if "HEALTH_OUTBOX_AGE" in os.environ else 3600  # с
+
+# Состояния проверок: fail делает сервис неготовым (503), degraded - только сообщается
+OK = "ok"
+DEGRADED = "degraded"
+FAIL = "fail"
+_SEVERITY = {OK: 0, DEGRADED: 1, FAIL: 2}
+
+
+def check_db():
+    """Время чтения и захвата блокировки записи (BEGIN IMMEDIATE без изменений)."""
+    start = time.perf_counter()
+    with db.connection() as conn:
+        conn.execute('SELECT 1 FROM sqlite_master LIMIT 1').fetchall()
+        read = time.perf_counter() - start
+        isolation_level = conn.isolation_level
+        conn.isolation_level = None
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            conn.execute('ROLLBACK')
+        finally:
+            conn.isolation_level = isolation_level
+    total = time.perf_counter() - start
+    return {"status": DEGRADED if total > HEALTH_DB_LATENCY else OK,
+            "read_ms": round(read * 1000, 2), "write_lock_ms": round((total - read) * 1000, 2)}
+
+
+def check_directory(path):
+    """Свободное место и возможность создать файл в каталоге."""
+    usage = shutil.disk_usage(path)
+    free_mb = usage.free // (1024 * 1024)
+    result = {"free_mb": free_mb, "writable": True}
+    try:
+        with tempfile.NamedTemporaryFile(dir=path, prefix=".health-"):
+            pass
+    except OSError as e:
+        result.update(status=FAIL, writable=False, error=str(e))
+        return result
+    result["status"] = FAIL if free_mb < HEALTH_MIN_FREE_MB else OK
+    return result
+
+
+def check_outbox():
+    """Очередь отправки в 1С: размер, возраст самой старой записи, недоставленные."""
+    with db.connection() as conn:
+        pending, oldest = conn.execute('''
+            SELECT COUNT(*), MIN(created_at) FROM outbox WHERE state IN (?, ?)
+        ''', (outbox.PENDING, outbox.SENDING)).fetchone()
+        dead = conn.execute('SELECT COUNT(*) FROM outbox WHERE state = ?', (outbox.DEAD,)).fetchone()[0]
+    age = time.time() - time.mktime(time.strptime(oldest, '%Y-%m-%d %H:%M:%S')) if oldest else 0
+    degraded = pending > HEALTH_OUTBOX_BACKLOG or age > HEALTH_OUTBOX_AGE or dead > 0
+    return {"status": DEGRADED if degraded else OK, "backlog": pending, "oldest_age_s": round(age), "dead": dead}
+
+
+class Readiness:
+    """Проверки готовности с кэшем результата на HEALTH_CACHE_TTL секунд.
+
+    Проба healthcheck приходит каждые несколько секунд; пока результат
+    свежий, запрос к /ready не трогает ни базу, ни диск. Ошибка проверки
+    (исключение) считается состоянием fail этой подсистемы.
+    """
+
+    def __init__(self, checks, ttl=HEALTH_CACHE_TTL):
+        self.checks = checks
+        self.ttl = ttl
+        self._result = None
+        self._checked_at = 0
+        self._lock = threading.Lock()
+
+    def run(self):
+        subsystems = {}
+        for name, check in self.checks.items():
+            start = time.perf_counter()
+            try:
+                subsystems[name] = check()
+            except Exception as e:
+                subsystems[name] = {"status": FAIL, "error": str(e) or e.__class__.__name__}
+            subsystems[name]["duration_ms"] = round((time.perf_counter() - start) * 1000, 2)
+        status = max((i["status"] for i in subsystems.values()), key=_SEVERITY.get, default=OK)
+        return {"status": status, "checked_at": time.strftime('%Y-%m-%d %H:%M:%S'), "subsystems": subsystems}
+
+    def result(self):
+        with self._lock:
+            if self._result is None or time.monotonic() - self._checked_at >= self.ttl:
+                self._result = self.run()
+                self._checked_at = time.monotonic()
+            return self._result
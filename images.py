@@ -0,0 +1,185 @@
+"""Нормализация загруженных фотографий документов и превью для модерации.
+
+После фиксации заявки изображения (JPEG, PNG, WebP) пережимаются в пуле
+процессов: поворот по EXIF, уменьшение до IMAGE_MAX_SIDE по большей стороне,
+сохранение с IMAGE_QUALITY без EXIF/XMP (геометка, модель телефона). Рядом
+с файлом кладётся превью <ключ>.thumb.jpg, которое student_details показывает
+вместо оригинала. Без Pillow файлы хранятся как загружены, превью нет.
+
+Обработка файлов, загруженных раньше:
+    python images.py backfill
+"""
+import argparse
+import logging
+import os
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import db
+import uploads
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = None
+
+IMAGE_MAX_SIDE = int(os.environ["IMAGE_MAX_SIDE"]) if "IMAGE_MAX_SIDE" in os.environ else 2000  # px
+IMAGE_QUALITY = int(os.environ["IMAGE_QUALITY"]) if "IMAGE_QUALITY" in os.environ else 85
+THUMBNAIL_SIDE = int(os.environ["THUMBNAIL_SIDE"]) if "THUMBNAIL_SIDE" in os.environ else 320  # px
+THUMBNAIL_QUALITY = int(os.environ["THUMBNAIL_QUALITY"]) if "THUMBNAIL_QUALITY" in os.environ else 70
+IMAGES_WORKERS = int(os.environ["IMAGES_WORKERS"]) if "IMAGES_WORKERS" in os.environ else 2
+
+# Расширение ключа -> формат Pillow; формат файла не меняется, чтобы ключ оставался верным
+IMAGE_FORMATS = {'.jpg': 'JPEG', '.jpeg': 'JPEG', '.png': 'PNG', '.webp': 'WEBP'}
+
+logger = logging.getLogger(__name__)
+
+
+def _temp_path(directory, suffix):
+    fd, path = tempfile.mkstemp(dir=directory, prefix="image-", suffix=suffix)
+    os.close(fd)
+    return path
+
+
+def _save(image, path, image_format, quality, icc_profile):
+    if image_format in ('JPEG', 'WEBP') and image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+    options = {'quality': quality} if image_format != 'PNG' else {}
+    if icc_profile:
+        options['icc_profile'] = icc_profile
+    image.save(path, image_format, optimize=True, **options)
+
+
+def normalize(path, tmp_dir, image_format, max_side=IMAGE_MAX_SIDE, quality=IMAGE_QUALITY,
+              thumbnail_side=THUMBNAIL_SIDE, thumbnail_quality=THUMBNAIL_QUALITY):
+    """Выполняется в процессе пула. Возвращает (путь нового файла или None, путь превью).
+
+    Новый файл возвращается, если он меньше исходного, исходный был больше
+    max_side или содержал EXIF/XMP; иначе исходный файл остаётся как есть.
+    """
+    with Image.open(path) as source:
+        oversized = max(source.size) > max_side
+        metadata = any(source.info.get(key) for key in ('exif', 'xmp', 'XML:com.adobe.xmp'))
+        icc_profile = source.info.get('icc_profile')
+        if image_format == 'JPEG':
+            # Декодирование JPEG сразу в уменьшенном масштабе (кратно 1/2..1/8)
+            source.draft('RGB', (max_side, max_side))
+        image = ImageOps.exif_transpose(source)
+        image.thumbnail((max_side, max_side), Image.LANCZOS)
+
+    image_path = _temp_path(tmp_dir, os.path.splitext(path)[1])
+    _save(image, image_path, image_format, quality, icc_profile)
+    if not (metadata or oversized or os.path.getsize(image_path) < os.path.getsize(path)):
+        os.remove(image_path)
+        image_path = None
+
+    image.thumbnail((thumbnail_side, thumbnail_side), Image.LANCZOS)
+    thumbnail_path = _temp_path(tmp_dir, uploads.THUMBNAIL_SUFFIX)
+    _save(image, thumbnail_path, 'JPEG', thumbnail_quality, None)
+    return image_path, thumbnail_path
+
+
+class ImageProcessor:
+    """Фоновая обработка изображений из UploadStore в пуле процессов.
+
+    Пул только готовит новый файл и превью во временном каталоге хранилища;
+    подмена файла идёт в транзакции (под той же блокировкой записи, что и
+    UploadStore.release), поэтому файл, удалённый за время обработки, не
+    появится снова. Файл с готовым превью уже обработан и повторно не пережимается.
+    """
+
+    def __init__(self, store, workers=IMAGES_WORKERS):
+        self.store = store
+        self.workers = workers
+        self.stats = {"queued": 0, "processed": 0, "replaced": 0, "saved_bytes": 0, "errors": 0}
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._executor = None
+
+    @property
+    def enabled(self):
+        return Image is not None
+
+    def submit(self, keys):
+        if not self.enabled:
+            return
+        for key in keys:
+            image_format = IMAGE_FORMATS.get(os.path.splitext(key)[1])
+            path = self.store.path(key)
+            if image_format is None or path is None or os.path.exists(path + uploads.THUMBNAIL_SUFFIX):
+                continue
+            with self._lock:
+                if key in self._pending:
+                    continue
+                if self._executor is None:
+                    self._executor = ProcessPoolExecutor(max_workers=self.workers)
+                self._pending.add(key)
+                self.stats["queued"] += 1
+                future = self._executor.submit(normalize, path, self.store.tmp_dir, image_format)
+            future.add_done_callback(lambda f, key=key: self._done(key, f))
+
+    def _done(self, key, future):
+        with self._lock:
+            self._pending.discard(key)
+        error = future.exception()
+        if error is not None:
+            self.stats["errors"] += 1
+            logger.error(f"Ошибка обработки изображения {key}: {error}")
+            return
+        image_path, thumbnail_path = future.result()
+        try:
+            self._replace(key, image_path, thumbnail_path)
+        except Exception as e:
+            self.stats["errors"] += 1
+            logger.error(f"Ошибка сохранения изображения {key}: {e}")
+        finally:
+            for tmp_path in (image_path, thumbnail_path):
+                if tmp_path is not None and os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+
+    def _replace(self, key, image_path, thumbnail_path):
+        path = self.store.path(key)
+        with db.transaction() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            if conn.execute('SELECT 1 FROM uploads WHERE key = ?', (key,)).fetchone() is None or not os.path.exists(path):
+                return
+            if image_path is not None:
+                size = os.path.getsize(image_path)
+                self.stats["saved_bytes"] += os.path.getsize(path) - size
+                self.stats["replaced"] += 1
+                uploads.publish(image_path, path)
+                conn.execute('UPDATE uploads SET size = ? WHERE key = ?', (size, key))
+            uploads.publish(thumbnail_path, path + uploads.THUMBNAIL_SUFFIX)
+        self.stats["processed"] += 1
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+
+def backfill(store):
+    """Обрабатывает изображения хранилища без превью; возвращает статистику."""
+    with db.connection() as conn:
+        keys = [row[0] for row in conn.execute('SELECT key FROM uploads ORDER BY key')]
+    processor = ImageProcessor(store)
+    processor.submit(keys)
+    processor.shutdown()
+    return processor.stats
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("command", choices=["backfill"])
+    parser.add_argument("--upload-folder", default="uploads")
+    args = parser.parse_args()
+
+    if Image is None:
+        parser.error("нужен пакет Pillow")
+    print(backfill(uploads.UploadStore(args.upload_folder)))
+
+
+if __name__ == "__main__":
+    main()
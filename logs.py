@@ -0,0 +1,151 @@
+"""Логирование через очередь: запрос только кладёт запись в очередь, форматирует и пишет фоновый поток.
+
+Записи выводятся в stderr одной строкой JSON (LOG_FORMAT=text - обычный текст).
+Структурированные поля передаются через event():
+    logs.event(logger, "moderation.page", table_name=table_name, rows=len(rows))
+Поля с персональными данными (ФИО, паспорт, СНИЛС, реквизиты, контакты)
+заменяются на "***" при выводе, в том числе во вложенных словарях.
+
+Частые события можно выборочно пропускать: LOG_SAMPLE="moderation.page=0.01,search=0.1"
+оставляет 1% и 10% таких записей; предупреждения и ошибки пишутся всегда.
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import threading
+
+LOG_LEVEL = os.environ["LOG_LEVEL"] if "LOG_LEVEL" in os.environ else "INFO"
+LOG_FORMAT = os.environ["LOG_FORMAT"] if "LOG_FORMAT" in os.environ else "json"
+LOG_QUEUE_SIZE = int(os.environ["LOG_QUEUE_SIZE"]) if "LOG_QUEUE_SIZE" in os.environ else 10000
+LOG_SAMPLE = os.environ["LOG_SAMPLE"] if "LOG_SAMPLE" in os.environ else ""
+
+# Поля, значения которых не попадают в журнал
+PII_FIELDS = frozenset((
+    'last_name', 'first_name', 'middle_name', 'birth_date', 'address', 'snils', 'id_serial', 'id_number',
+    'id_issued_by', 'id_issued_date', 'bank_details', 'phone', 'email', 'password',
+))
+REDACTED = '***'
+
+# Атрибуты LogRecord, которые не являются полями события
+_RECORD_ATTRIBUTES = frozenset(logging.makeLogRecord({}).__dict__) | {'message', 'asctime', 'event'}
+
+stats = {"queued": 0, "dropped": 0, "sampled_out": 0}
+
+
+def redact(value):
+    """Копия значения с замаскированными полями из PII_FIELDS (словари и списки - рекурсивно)."""
+    if isinstance(value, dict):
+        return {key: REDACTED if key in PII_FIELDS and item is not None else redact(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [redact(item) for item in value]
+    return value
+
+
+def parse_sample(spec):
+    """"moderation.page=0.01,search=0.1" -> {"moderation.page": 0.01, "search": 0.1}."""
+    rates = {}
+    for part in spec.split(','):
+        if '=' in part:
+            name, rate = part.split('=', 1)
+            rates[name.strip()] = min(max(float(rate), 0.0), 1.0)
+    return rates
+
+
+def event(logger, name, level=logging.INFO, **fields):
+    """Структурированная запись: name - имя события (по нему работает выборка), fields - поля JSON.
+
+    Выборка проверяется до создания LogRecord, поэтому пропущенное событие почти ничего не стоит.
+    """
+    rate = _rates.get(name)
+    if rate is not None and level < logging.WARNING and random.random() >= rate:
+        stats["sampled_out"] += 1
+        return
+    if logger.isEnabledFor(level):
+        logger.log(level, name, extra=dict(fields, event=name), stacklevel=2)
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        data = {
+            "time": self.formatTime(record, "%Y-%m-%dT%H:%M:%S"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if getattr(record, 'event', None):
+            data["event"] = record.event
+        fields = {key: value for key, value in record.__dict__.items() if key not in _RECORD_ATTRIBUTES}
+        if fields:
+            data.update(redact(fields))
+        if record.exc_info:
+            data["exception"] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    def format(self, record):
+        line = super().format(record)
+        fields = {key: value for key, value in record.__dict__.items() if key not in _RECORD_ATTRIBUTES}
+        if fields:
+            line += ' ' + json.dumps(redact(fields), ensure_ascii=False, default=str)
+        return line
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    # Стандартный prepare() форматирует сообщение в потоке запроса; здесь это делает
+    # фоновый поток, а при переполнении очереди запись отбрасывается без ожидания
+    def prepare(self, record):
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+            stats["queued"] += 1
+        except queue.Full:
+            stats["dropped"] += 1
+
+
+_rates = {}
+_listener = None
+_lock = threading.Lock()
+
+
+def setup(level=LOG_LEVEL, fmt=LOG_FORMAT, sample=LOG_SAMPLE, stream=None):
+    """Направляет корневой логгер в очередь с фоновой записью. Повторный вызов ничего не делает."""
+    global _listener
+    with _lock:
+        if _listener is not None:
+            return
+        output = logging.StreamHandler(stream or sys.stderr)
+        if fmt == 'json':
+            output.setFormatter(JsonFormatter())
+        else:
+            output.setFormatter(TextFormatter('%(asctime)s %(levelname)s %(name)s: %(message)s'))
+
+        handler = _QueueHandler(queue.Queue(LOG_QUEUE_SIZE))
+        _rates.clear()
+        _rates.update(parse_sample(sample))
+
+        root = logging.getLogger()
+        for old in root.handlers[:]:
+            root.removeHandler(old)
+        root.addHandler(handler)
+        root.setLevel(level)
+
+        _listener = logging.handlers.QueueListener(handler.queue, output, respect_handler_level=True)
+        _listener.start()
+        atexit.register(shutdown)
+
+
+def shutdown():
+    """Дописывает оставшиеся в очереди записи и останавливает фоновый поток."""
+    global _listener
+    with _lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
@@ -0,0 +1,319 @@
+import bisect
+import fcntl
+import glob
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+
+import flask
+import jinja2
+
+METRICS_ENABLED = os.environ["METRICS_ENABLED"] != "0" if "METRICS_ENABLED" in os.environ else True
+METRICS_DIR = os.environ["METRICS_DIR"] if "METRICS_DIR" in os.environ else os.path.join(tempfile.gettempdir(), "chinaekb-metrics")
+METRICS_FLUSH_INTERVAL = float(os.environ["METRICS_FLUSH_INTERVAL"]) if "METRICS_FLUSH_INTERVAL" in os.environ else 5  # с
+
+# Сумма значений завершившихся процессов
+AGGREGATE_FILE = "aggregate.json"
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+logger = logging.getLogger(__name__)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _merge(total, data, names=None):
+    """Добавляет значения data ({имя: {метки: значение}}) к total; names - только эти метрики."""
+    for name, samples in data.items():
+        if names is not None and name not in names:
+            continue
+        current_samples = total.setdefault(name, {})
+        for labels, value in samples.items():
+            current = current_samples.get(labels)
+            if current is None:
+                current_samples[labels] = value
+            elif isinstance(value, list):
+                current_samples[labels] = [a + b for a, b in zip(current, value)]
+            else:
+                current_samples[labels] = current + value
+
+
+def _read(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class Metric:
+    """Счётчик (counter) или гистограмма (histogram) с метками.
+
+    Значения текущего процесса лежат в памяти; запись - словарь и bisect
+    под общей блокировкой реестра, без ввода-вывода.
+    """
+
+    def __init__(self, registry, kind, name, documentation, labels, buckets=DEFAULT_BUCKETS):
+        self.registry = registry
+        self.kind = kind
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        self.values = {}
+
+    def inc(self, *labels, amount=1):
+        if not METRICS_ENABLED:
+            return
+        with self.registry.lock:
+            self.registry.check_pid()
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def observe(self, value, *labels):
+        if not METRICS_ENABLED:
+            return
+        index = bisect.bisect_left(self.buckets, value)
+        with self.registry.lock:
+            self.registry.check_pid()
+            sample = self.values.get(labels)
+            if sample is None:
+                # [счётчики корзин (без +Inf)..., сумма, количество]
+                sample = self.values[labels] = [0] * len(self.buckets) + [0.0, 0]
+            if index < len(self.buckets):
+                sample[index] += 1
+            sample[-2] += value
+            sample[-1] += 1
+
+    def time(self, *labels):
+        return _Timer(self, labels)
+
+
+class _Timer:
+    __slots__ = ("metric", "labels", "start")
+
+    def __init__(self, metric, labels):
+        self.metric = metric
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metric.observe(time.perf_counter() - self.start, *self.labels)
+
+
+class Registry:
+    """Метрики процесса и их сбор со всех воркеров gunicorn.
+
+    Каждый процесс раз в METRICS_FLUSH_INTERVAL сбрасывает свои значения в
+    METRICS_DIR/<pid>-<время запуска>.json; /metrics складывает файлы всех
+    процессов. Файлы завершившихся процессов переносятся в AGGREGATE_FILE и
+    удаляются (fold), поэтому счётчики не уменьшаются при перезапуске воркера,
+    а число файлов не растёт: мастер gunicorn делает это при выходе воркера
+    (child_exit) и при старте (on_starting), /metrics - для файлов процессов,
+    которых уже нет. Перенос и чтение файлов идут под flock на каталог.
+    """
+
+    def __init__(self, directory=METRICS_DIR, interval=METRICS_FLUSH_INTERVAL):
+        self.directory = directory
+        self.interval = interval
+        self.metrics = []
+        self.lock = threading.Lock()
+        self._pid = None
+        self._path = None
+        self._thread = None
+
+    def counter(self, name, documentation, labels=()):
+        metric = Metric(self, "counter", name, documentation, labels)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        metric = Metric(self, "histogram", name, documentation, labels, buckets)
+        self.metrics.append(metric)
+        return metric
+
+    def check_pid(self):
+        # Вызывается под self.lock. После fork значения родителя не наследуются
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._path = os.path.join(self.directory, f"{self._pid}-{int(time.time() * 1000)}.json")
+            for metric in self.metrics:
+                metric.values = {}
+            self._thread = threading.Thread(target=self._run, name="metrics-flush", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        pid = os.getpid()
+        while self._pid == pid:
+            time.sleep(self.interval)
+            try:
+                self.flush()
+            except OSError as e:
+                logger.error(f"Ошибка записи метрик в {self.directory}: {e}")
+
+    def snapshot(self):
+        with self.lock:
+            self.check_pid()
+            return {metric.name: {json.dumps(labels, ensure_ascii=False): value if metric.kind == "counter" else list(value)
+                                  for labels, value in metric.values.items()}
+                    for metric in self.metrics}
+
+    def flush(self):
+        os.makedirs(self.directory, exist_ok=True)
+        data = self.snapshot()
+        tmp_path = self._path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, self._path)
+
+    def _process_files(self):
+        """{путь: pid} файлов процессов (без AGGREGATE_FILE)."""
+        files = {}
+        for path in glob.glob(os.path.join(self.directory, "*-*.json")):
+            pid = os.path.basename(path).split("-", 1)[0]
+            if pid.isdigit():
+                files[path] = int(pid)
+        return files
+
+    def _locked(self, operation):
+        os.makedirs(self.directory, exist_ok=True)
+        lock = open(os.path.join(self.directory, ".lock"), "a")
+        fcntl.flock(lock, operation)
+        return lock
+
+    def fold(self, pid=None):
+        """Переносит в AGGREGATE_FILE и удаляет файлы процесса pid (None - всех процессов).
+
+        Вызывается, когда процессы уже завершились: из child_exit и on_starting мастера gunicorn.
+        Возвращает число перенесённых файлов.
+        """
+        with self._locked(fcntl.LOCK_EX):
+            paths = [path for path, file_pid in self._process_files().items() if pid is None or file_pid == pid]
+            return self._fold(paths)
+
+    def _fold(self, paths):
+        # Вызывается под эксклюзивной блокировкой каталога
+        if not paths:
+            return 0
+        aggregate_path = os.path.join(self.directory, AGGREGATE_FILE)
+        total = _read(aggregate_path) or {}
+        for path in paths:
+            data = _read(path)
+            if data is not None:
+                _merge(total, data)
+        tmp_path = aggregate_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(total, f)
+        os.replace(tmp_path, aggregate_path)
+        for path in paths:
+            os.remove(path)
+        return len(paths)
+
+    def prune(self):
+        """Переносит в AGGREGATE_FILE файлы процессов, которых уже нет (упавших без child_exit)."""
+        with self._locked(fcntl.LOCK_EX):
+            return self._fold([path for path, pid in self._process_files().items() if not _pid_alive(pid)])
+
+    def collect(self):
+        """Сумма значений всех процессов: {имя метрики: {метки: значение}}."""
+        if METRICS_ENABLED:
+            self.flush()
+        self.prune()
+        names = {metric.name for metric in self.metrics}
+        total = {name: {} for name in names}
+        with self._locked(fcntl.LOCK_SH):
+            for path in glob.glob(os.path.join(self.directory, "*.json")):
+                data = _read(path)
+                if data is not None:
+                    _merge(total, data, names)
+        return total
+
+    def exposition(self):
+        """Все метрики в текстовом формате Prometheus."""
+        total = self.collect()
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for key, value in sorted(total[metric.name].items()):
+                labels = [f'{name}="{_escape(label)}"' for name, label in zip(metric.labels, json.loads(key))]
+                if metric.kind == "counter":
+                    lines.append(f"{metric.name}{{{','.join(labels)}}} {value}")
+                    continue
+                cumulative = 0
+                for bound, count in zip(metric.buckets, value):
+                    cumulative += count
+                    bucket_labels = ','.join(labels + [f'le="{bound}"'])
+                    lines.append(f"{metric.name}_bucket{{{bucket_labels}}} {cumulative}")
+                bucket_labels = ','.join(labels + ['le="+Inf"'])
+                lines.append(f"{metric.name}_bucket{{{bucket_labels}}} {value[-1]}")
+                lines.append(f"{metric.name}_sum{{{','.join(labels)}}} {value[-2]}")
+                lines.append(f"{metric.name}_count{{{','.join(labels)}}} {value[-1]}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+HTTP_REQUESTS = registry.counter(
+    "http_requests_total", "Обработанные HTTP-запросы", ("method", "route", "status"))
+HTTP_REQUEST_DURATION = registry.histogram(
+    "http_request_duration_seconds", "Время обработки HTTP-запроса", ("method", "route"))
+DB_QUERY_DURATION = registry.histogram(
+    "db_query_duration_seconds", "Время выполнения запроса SQLite (execute/commit)", ("operation",))
+UPLOAD_DURATION = registry.histogram(
+    "upload_save_duration_seconds", "Время сохранения загруженного файла", ("stage",))
+TEMPLATE_RENDER_DURATION = registry.histogram(
+    "template_render_duration_seconds", "Время отрисовки шаблона Jinja", ("template",))
+OUTBOUND_HTTP_DURATION = registry.histogram(
+    "outbound_http_duration_seconds", "Время исходящего HTTP-запроса", ("target", "outcome"))
+
+
+class TimedTemplate(jinja2.Template):
+    """Шаблон Jinja, замеряющий время render() (app.jinja_env.template_class)."""
+
+    def render(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return super().render(*args, **kwargs)
+        finally:
+            TEMPLATE_RENDER_DURATION.observe(time.perf_counter() - start, self.name or "<string>")
+
+
+def init_app(app, route="/metrics"):
+    """Замер запросов приложения, времени шаблонов и маршрут с метриками."""
+    app.jinja_env.template_class = TimedTemplate
+
+    @app.before_request
+    def start_timer():
+        flask.g.metrics_start = time.perf_counter()
+
+    @app.after_request
+    def record_request(response):
+        start = flask.g.pop("metrics_start", None)
+        if start is not None:
+            rule = flask.request.url_rule.rule if flask.request.url_rule is not None else "<unmatched>"
+            HTTP_REQUEST_DURATION.observe(time.perf_counter() - start, flask.request.method, rule)
+            HTTP_REQUESTS.inc(flask.request.method, rule, str(response.status_code))
+        return response
+
+    def metrics_view():
+        return flask.Response(registry.exposition(), 200, mimetype="text/plain; version=0.0.4")
+
+    app.add_url_rule(route, "metrics", metrics_view)
@@ -0,0 +1,225 @@
+import datetime
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import db
+import details_cache
+import metrics
+
+ONEC_URL = os.environ["ONEC_URL"] if "ONEC_URL" in os.environ else "https://1c.rsvpu.ru/univer_prof_test/hs/confucius_center/put_contract"
+ONEC_USER = os.environ["ONEC_USER"] if "ONEC_USER" in os.environ else "AbiturWeb"
+ONEC_PASSWORD = os.environ["ONEC_PASSWORD"] if "ONEC_PASSWORD" in os.environ else "s5*Uzjea"
+ONEC_TIMEOUT = float(os.environ["ONEC_TIMEOUT"]) if "ONEC_TIMEOUT" in os.environ else 30
+OUTBOX_WORKER = os.environ["OUTBOX_WORKER"] != "0" if "OUTBOX_WORKER" in os.environ else True
+OUTBOX_CONCURRENCY = int(os.environ["OUTBOX_CONCURRENCY"]) if "OUTBOX_CONCURRENCY" in os.environ else 4
+OUTBOX_MAX_ATTEMPTS = int(os.environ["OUTBOX_MAX_ATTEMPTS"]) if "OUTBOX_MAX_ATTEMPTS" in os.environ else 8
+OUTBOX_BACKOFF = float(os.environ["OUTBOX_BACKOFF"]) if "OUTBOX_BACKOFF" in os.environ else 5  # с
+OUTBOX_BACKOFF_MAX = float(os.environ["OUTBOX_BACKOFF_MAX"]) if "OUTBOX_BACKOFF_MAX" in os.environ else 3600  # с
+OUTBOX_POLL_INTERVAL = float(os.environ["OUTBOX_POLL_INTERVAL"]) if "OUTBOX_POLL_INTERVAL" in os.environ else 2  # с
+
+# Состояния записи очереди: pending -> sending -> delivered,
+# после OUTBOX_MAX_ATTEMPTS неудачных попыток - dead.
+PENDING = 'pending'
+SENDING = 'sending'
+DELIVERED = 'delivered'
+DEAD = 'dead'
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue(conn, table_name, student_id, payload):
+    """Ставит заявку в очередь отправки в той же транзакции, что и вызывающий код.
+
+    Возвращает False, если заявка уже ждёт отправки.
+    """
+    try:
+        conn.execute('''
+            INSERT INTO outbox (table_name, student_id, payload, state, next_attempt_at, created_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', (table_name, student_id, json.dumps(payload, ensure_ascii=False), PENDING, time.time(),
+              datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
+    except sqlite3.IntegrityError:
+        return False
+    if _worker is not None:
+        _worker.wake()
+    return True
+
+
+def delivery_state(conn, table_name, student_id):
+    """Последняя запись очереди по заявке: (state, attempts, last_error) или None."""
+    return conn.execute('''
+        SELECT state, attempts, last_error FROM outbox
+        WHERE table_name = ? AND student_id = ?
+        ORDER BY id DESC LIMIT 1
+    ''', (table_name, student_id)).fetchone()
+
+
+def backoff(attempts):
+    return min(OUTBOX_BACKOFF * 2 ** (attempts - 1), OUTBOX_BACKOFF_MAX)
+
+
+class OutboxWorker:
+    """Фоновая доставка заявок из таблицы outbox в 1С.
+
+    Поток-диспетчер забирает не больше OUTBOX_CONCURRENCY готовых к отправке
+    записей и отправляет их параллельно пулом потоков через общую сессию
+    requests с keep-alive соединениями, так что захват (locked_until, 2 *
+    ONEC_TIMEOUT на соединение и ответ) покрывает одну отправку. Результат
+    записывается сразу после отправки. Записи захватываются под BEGIN IMMEDIATE,
+    поэтому воркеры нескольких процессов gunicorn не отправят одну заявку
+    дважды; захват с истёкшим locked_until (процесс упал во время отправки)
+    снимается. Результат записывается, только если захват ещё принадлежит
+    этому воркеру (state и locked_until не изменились).
+    """
+
+    def __init__(self, on_delivered=None):
+        self.on_delivered = on_delivered
+        self.url = ONEC_URL
+        self.auth = (ONEC_USER, ONEC_PASSWORD)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=OUTBOX_CONCURRENCY)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._executor = ThreadPoolExecutor(max_workers=OUTBOX_CONCURRENCY, thread_name_prefix="outbox")
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="outbox-dispatcher", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        self._stopped.set()
+        self._wakeup.set()
+        self._thread.join(timeout)
+        self._executor.shutdown(wait=True)
+
+    def wake(self):
+        self._wakeup.set()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            try:
+                claimed = self.process_due()
+            except Exception as e:
+                logger.error(f"Ошибка обработки очереди 1С: {e}")
+                claimed = 0
+            if not claimed:
+                self._wakeup.wait(OUTBOX_POLL_INTERVAL)
+                self._wakeup.clear()
+
+    def claim(self, limit):
+        now = time.time()
+        lock_until = now + ONEC_TIMEOUT * 2
+        with db.connection() as conn:
+            isolation_level = conn.isolation_level
+            conn.isolation_level = None
+            try:
+                conn.execute('BEGIN IMMEDIATE')
+                rows = conn.execute('''
+                    SELECT id, table_name, student_id, payload, attempts FROM outbox
+                    WHERE (state = ? AND next_attempt_at <= ?) OR (state = ? AND locked_until < ?)
+                    ORDER BY next_attempt_at
+                    LIMIT ?
+                ''', (PENDING, now, SENDING, now, limit)).fetchall()
+                conn.executemany('''
+                    UPDATE outbox SET state = ?, locked_until = ?, attempts = attempts + 1 WHERE id = ?
+                ''', [(SENDING, lock_until, row[0]) for row in rows])
+                conn.execute('COMMIT')
+            except BaseException:
+                if conn.in_transaction:
+                    conn.execute('ROLLBACK')
+                raise
+            finally:
+                conn.isolation_level = isolation_level
+        return [(row_id, table_name, student_id, json.loads(payload), attempts + 1, lock_until)
+                for row_id, table_name, student_id, payload, attempts in rows]
+
+    def process_due(self):
+        """Отправляет захваченные записи (не больше OUTBOX_CONCURRENCY) и ждёт их. Возвращает их число."""
+        items = self.claim(OUTBOX_CONCURRENCY)
+        if not items:
+            return 0
+        list(self._executor.map(self.process, items))
+        return len(items)
+
+    def process(self, item):
+        self.apply(item, self.deliver(item))
+
+    def send(self, payload):
+        start = time.perf_counter()
+        outcome = "error"
+        try:
+            response = self.session.post(self.url, json=payload, auth=self.auth, timeout=ONEC_TIMEOUT)
+            outcome = str(response.status_code)
+        finally:
+            metrics.OUTBOUND_HTTP_DURATION.observe(time.perf_counter() - start, "1c", outcome)
+        response.raise_for_status()
+
+    def deliver(self, item):
+        """Отправляет одну запись. Возвращает None при успехе или текст ошибки."""
+        row_id, table_name, student_id, payload, attempts, lock_until = item
+        try:
+            self.send(payload)
+        except requests.exceptions.RequestException as e:
+            return str(e)[:1000] or e.__class__.__name__
+        return None
+
+    def apply(self, item, error):
+        """Записывает результат одной отправки, если захват записи ещё принадлежит этому воркеру."""
+        row_id, table_name, student_id, payload, attempts, lock_until = item
+        now = time.time()
+        with db.transaction() as conn:
+            if error is None:
+                updated = conn.execute('''
+                    UPDATE outbox SET state = ?, locked_until = NULL, delivered_at = ?
+                    WHERE id = ? AND state = ? AND locked_until = ?
+                ''', (DELIVERED, datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                      row_id, SENDING, lock_until)).rowcount
+                if updated:
+                    # Статус "проверено" выставляется только после подтверждения от 1С
+                    conn.execute(f'UPDATE {table_name} SET status = ? WHERE id = ?', ('проверено', student_id))
+                    details_cache.invalidate(conn, table_name, [student_id])
+            else:
+                if attempts >= OUTBOX_MAX_ATTEMPTS:
+                    state, next_attempt_at = DEAD, now
+                else:
+                    state, next_attempt_at = PENDING, now + backoff(attempts)
+                updated = conn.execute('''
+                    UPDATE outbox SET state = ?, next_attempt_at = ?, locked_until = NULL, last_error = ?
+                    WHERE id = ? AND state = ? AND locked_until = ?
+                ''', (state, next_attempt_at, error, row_id, SENDING, lock_until)).rowcount
+
+        if not updated:
+            logger.warning(f"Захват заявки {student_id} ({table_name}) в очереди 1С истёк, результат не записан")
+        elif error is None:
+            logger.info(f"Заявка {student_id} ({table_name}) отправлена в 1С")
+            if self.on_delivered is not None:
+                try:
+                    self.on_delivered(table_name, student_id, payload)
+                except Exception as e:
+                    logger.error(f"Ошибка постобработки заявки {student_id} ({table_name}): {e}")
+        elif state == DEAD:
+            logger.error(f"Заявка {student_id} ({table_name}) не доставлена в 1С после {attempts} попыток: {error}")
+        else:
+            logger.warning(f"Ошибка при отправке заявки {student_id} ({table_name}) в 1С, попытка {attempts}: {error}")
+
+
+_worker = None
+
+
+def start(on_delivered=None):
+    """Запускает фоновую доставку в текущем процессе (один раз)."""
+    global _worker
+    if _worker is None and OUTBOX_WORKER:
+        _worker = OutboxWorker(on_delivered)
+        _worker.start()
+    return _worker
@@ -0,0 +1,78 @@
+"""Записи заявок: доступ к полям по имени вместо индексов строк SQLite.
+
+Классы записей - именованные кортежи с __slots__ = () (без __dict__ на
+каждую строку). Запросы выбирают только столбцы класса (select()), поэтому
+порядок полей не зависит от SELECT * и от того, в какой таблице есть age_group.
+"""
+from collections import namedtuple
+
+# Столбцы в порядке схемы (db.init_db и миграции)
+STUDENT_COLUMNS = (
+    'id', 'last_name', 'first_name', 'middle_name', 'birth_date', 'address', 'gender', 'snils', 'age_group',
+    'id_type', 'id_serial', 'id_number', 'id_issued_by', 'id_issued_date', 'bank_details', 'phone', 'email',
+    'study_plan', 'exam_selection', 'exam_date', 'status', 'submission_date', 'file_paths',
+    'fingerprint', 'duplicate_of',
+)
+ADULT_STUDENT_COLUMNS = tuple(column for column in STUDENT_COLUMNS if column != 'age_group')
+REPRESENTATIVE_COLUMNS = (
+    'id', 'student_id', 'last_name', 'first_name', 'middle_name', 'birth_date', 'address', 'gender', 'snils',
+    'id_serial', 'id_number', 'id_issued_by', 'id_issued_date', 'bank_details', 'phone', 'email',
+)
+# Строка списка модерации: остальные поля странице не нужны и из базы не читаются
+SUMMARY_COLUMNS = ('id', 'last_name', 'first_name', 'middle_name', 'status', 'duplicate_of')
+
+# Поля JSON для 1С (служебные fingerprint и duplicate_of не передаются)
+STUDENT_PAYLOAD = STUDENT_COLUMNS[:STUDENT_COLUMNS.index('file_paths') + 1]
+ADULT_STUDENT_PAYLOAD = ADULT_STUDENT_COLUMNS[:ADULT_STUDENT_COLUMNS.index('file_paths') + 1]
+REPRESENTATIVE_PAYLOAD = REPRESENTATIVE_COLUMNS[2:]
+
+
+def select(columns, alias=None):
+    """Список столбцов для SELECT, при необходимости с псевдонимом таблицы."""
+    return ', '.join(f'{alias}.{column}' if alias else column for column in columns)
+
+
+class _Application:
+    __slots__ = ()
+    payload_columns = ()
+
+    @property
+    def files(self):
+        return self.file_paths.split(',') if self.file_paths else []
+
+    def to_1c(self, representative=None):
+        """JSON заявки для отправки в 1С (и для шаблона договора)."""
+        return {column: getattr(self, column) for column in self.payload_columns}
+
+
+class Student(_Application, namedtuple('Student', STUDENT_COLUMNS)):
+    __slots__ = ()
+    table_name = 'students'
+    payload_columns = STUDENT_PAYLOAD
+
+    def to_1c(self, representative=None):
+        data = super().to_1c()
+        data['representative'] = representative.to_1c() if representative else None
+        return data
+
+
+class AdultStudent(_Application, namedtuple('AdultStudent', ADULT_STUDENT_COLUMNS)):
+    __slots__ = ()
+    table_name = 'adult_students'
+    payload_columns = ADULT_STUDENT_PAYLOAD
+    # Возрастной группы у взрослых нет; поле есть, чтобы шаблоны не проверяли таблицу
+    age_group = None
+
+
+class Representative(namedtuple('Representative', REPRESENTATIVE_COLUMNS)):
+    __slots__ = ()
+
+    def to_1c(self):
+        return {column: getattr(self, column) for column in REPRESENTATIVE_PAYLOAD}
+
+
+class Summary(namedtuple('Summary', SUMMARY_COLUMNS)):
+    __slots__ = ()
+
+
+APPLICATIONS = {'students': Student, 'adult_students': AdultStudent}
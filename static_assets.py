@@ -0,0 +1,112 @@
+import gzip
+import hashlib
+import mimetypes
+import os
+import posixpath
+
+import flask
+
+try:
+    import brotli
+except ImportError:
+    # Без пакета brotli отдаются только gzip и исходный файл
+    brotli = None
+
+# Файл с хэшем в имени не меняется, поэтому кэшируется браузером на год
+STATIC_MAX_AGE = int(os.environ["STATIC_MAX_AGE"]) if "STATIC_MAX_AGE" in os.environ else 365 * 24 * 3600  # с
+# Старые адреса без хэша (и /favicon.ico) - с коротким сроком и проверкой по ETag
+STATIC_FALLBACK_MAX_AGE = int(os.environ["STATIC_FALLBACK_MAX_AGE"]) if "STATIC_FALLBACK_MAX_AGE" in os.environ else 3600  # с
+STATIC_MIN_COMPRESS = 512  # байт; меньшие файлы не сжимаются
+
+COMPRESSIBLE_TYPES = ('text/', 'application/javascript', 'application/json', 'image/svg+xml', 'image/x-icon',
+                      'image/vnd.microsoft.icon')
+
+
+class Asset:
+    __slots__ = ('path', 'name', 'mimetype', 'digest', 'variants')
+
+    def __init__(self, path, name, mimetype, digest, variants):
+        self.path = path
+        self.name = name
+        self.mimetype = mimetype
+        self.digest = digest
+        # {кодировка: байты}; '' - исходный файл
+        self.variants = variants
+
+
+def _fingerprinted(path, digest):
+    root, ext = posixpath.splitext(path)
+    return f"{root}.{digest}{ext}"
+
+
+class StaticAssets:
+    """Статические файлы с хэшем содержимого в имени и заранее сжатыми вариантами.
+
+    build() читает каталог один раз при старте: считает sha256, готовит
+    gzip (и brotli, если установлен) и держит все варианты в памяти.
+    Шаблоны получают адрес через url('bootstrap.min.css') ->
+    /static/bootstrap.min.<хэш>.css; такой адрес отдаётся с immutable
+    Cache-Control, и браузер больше не обращается за файлом к воркеру.
+    """
+
+    def __init__(self, directory, url_prefix):
+        self.directory = directory
+        self.url_prefix = url_prefix
+        self.by_path = {}
+        self.by_name = {}
+
+    def build(self):
+        by_path = {}
+        for root, _, files in os.walk(self.directory):
+            for filename in sorted(files):
+                full_path = os.path.join(root, filename)
+                path = os.path.relpath(full_path, self.directory).replace(os.sep, '/')
+                with open(full_path, 'rb') as f:
+                    data = f.read()
+                digest = hashlib.sha256(data).hexdigest()[:12]
+                mimetype = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+                variants = {'': data}
+                if len(data) >= STATIC_MIN_COMPRESS and mimetype.startswith(COMPRESSIBLE_TYPES):
+                    compressed = gzip.compress(data, compresslevel=9, mtime=0)
+                    if len(compressed) < len(data):
+                        variants['gzip'] = compressed
+                    if brotli is not None:
+                        compressed = brotli.compress(data, quality=11)
+                        if len(compressed) < len(data):
+                            variants['br'] = compressed
+                by_path[path] = Asset(path, _fingerprinted(path, digest), mimetype, digest, variants)
+        self.by_path = by_path
+        self.by_name = {asset.name: asset for asset in by_path.values()}
+        return self
+
+    def url(self, path):
+        asset = self.by_path.get(path)
+        return f"{self.url_prefix}/{asset.name if asset is not None else path}"
+
+    def send(self, path):
+        """Ответ для файла по адресу с хэшем или по исходному имени; None, если такого файла не было при сборке."""
+        asset = self.by_name.get(path)
+        immutable = asset is not None
+        if asset is None:
+            asset = self.by_path.get(path)
+        if asset is None:
+            return None
+
+        encoding = ''
+        accepted = flask.request.accept_encodings
+        for candidate in ('br', 'gzip'):
+            if candidate in asset.variants and accepted[candidate]:
+                encoding = candidate
+                break
+
+        response = flask.Response(asset.variants[encoding], mimetype=asset.mimetype)
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+        if len(asset.variants) > 1:
+            response.vary.add('Accept-Encoding')
+        response.set_etag(f"{asset.digest}-{encoding or 'identity'}")
+        if immutable:
+            response.headers['Cache-Control'] = f"public, max-age={STATIC_MAX_AGE}, immutable"
+        else:
+            response.headers['Cache-Control'] = f"public, max-age={STATIC_FALLBACK_MAX_AGE}"
+        return response.make_conditional(flask.request)
@@ -0,0 +1,198 @@
+import datetime
+
+import db
+import details_cache
+import duplicates
+
+# Поля персональных данных: (столбец, суффикс имени поля формы, нормализатор).
+# У студента поля формы начинаются со "student", у представителя - с "client".
+PERSON_FIELDS = (
+    ('last_name', 'name-lastname', 'name'),
+    ('first_name', 'name-name', 'name'),
+    ('middle_name', 'name-surname', 'name'),
+    ('birth_date', 'birth', 'str'),
+    ('address', 'address', None),
+    ('gender', 'gender', None),
+    ('snils', 'snils', None),
+    ('id_serial', 'id-serial', None),
+    ('id_number', 'id-number', None),
+    ('id_issued_by', 'id-by', None),
+    ('id_issued_date', 'id-issued', 'str'),
+    ('bank_details', 'bank', None),
+    ('phone', 'phone', None),
+    ('email', 'email', None),
+)
+
+APPLICATION_FIELDS = (
+    ('exam_selection', 'examselection', None),
+    ('exam_date', 'examdate', None),
+)
+
+# Порядок столбцов INSERT. submission_date, file_paths, fingerprint и duplicate_of
+# всегда последние: их значения известны только в момент записи.
+TABLE_COLUMNS = {
+    'students': ('last_name', 'first_name', 'middle_name', 'birth_date', 'address', 'gender', 'snils', 'age_group',
+                 'id_type', 'id_serial', 'id_number', 'id_issued_by', 'id_issued_date', 'bank_details', 'phone',
+                 'email', 'study_plan', 'exam_selection', 'exam_date', 'status', 'submission_date', 'file_paths',
+                 'fingerprint', 'duplicate_of'),
+    'adult_students': ('last_name', 'first_name', 'middle_name', 'birth_date', 'address', 'gender', 'snils',
+                       'id_type', 'id_serial', 'id_number', 'id_issued_by', 'id_issued_date', 'bank_details',
+                       'phone', 'email', 'study_plan', 'exam_selection', 'exam_date', 'status', 'submission_date',
+                       'file_paths', 'fingerprint', 'duplicate_of'),
+    'representatives': ('student_id', 'last_name', 'first_name', 'middle_name', 'birth_date', 'address', 'gender',
+                        'snils', 'id_serial', 'id_number', 'id_issued_by', 'id_issued_date', 'bank_details', 'phone',
+                        'email'),
+}
+RUNTIME_COLUMNS = ('submission_date', 'file_paths', 'fingerprint', 'duplicate_of')
+
+
+def _insert(table, columns):
+    return f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+
+
+INSERTS = {table: _insert(table, columns) for table, columns in TABLE_COLUMNS.items()}
+
+
+class FormError(ValueError):
+    pass
+
+
+def normalize_name(value):
+    return value.strip().lower().capitalize()
+
+
+NORMALIZERS = {
+    'name': normalize_name,
+    'str': str,
+}
+
+
+class FormSpec:
+    """Описание формы заявки: шаблон, таблица и постоянные значения столбцов.
+
+    При создании по списку столбцов таблицы составляется план извлечения
+    значений: для каждого столбца - поле формы с нормализатором или константа.
+    Обработка запроса сводится к одному проходу по плану.
+    """
+
+    def __init__(self, name, template, title, table, constants, representative=False):
+        self.name = name
+        self.template = template
+        self.title = title
+        self.table = table
+        self.constants = dict(constants, status='на проверке')
+        self.representative = representative
+
+        fields = {column: ('student' + suffix, normalizer) for column, suffix, normalizer in PERSON_FIELDS}
+        fields.update({column: (key, normalizer) for column, key, normalizer in APPLICATION_FIELDS})
+        self.columns = columns = tuple(i for i in TABLE_COLUMNS[table] if i not in RUNTIME_COLUMNS)
+        self.student_plan = self._compile(columns, fields, self.constants)
+        self.fingerprint_columns = [columns.index(i) for i in duplicates.FINGERPRINT_COLUMNS]
+
+        self.representative_plan = None
+        if representative:
+            fields = {column: ('client' + suffix, normalizer) for column, suffix, normalizer in PERSON_FIELDS}
+            self.representative_plan = self._compile(TABLE_COLUMNS['representatives'][1:], fields, {})
+
+    @staticmethod
+    def _compile(columns, fields, constants):
+        # (шаблон строки с константами, поля без обработки, поля с нормализатором)
+        template, raw, normalized = [], [], []
+        for index, column in enumerate(columns):
+            template.append(constants.get(column))
+            if column in constants:
+                continue
+            key, normalizer = fields[column]
+            if normalizer is None:
+                raw.append((index, key))
+            else:
+                normalized.append((index, key, NORMALIZERS[normalizer]))
+        return template, tuple(raw), tuple(normalized)
+
+    @staticmethod
+    def _values(plan, form):
+        template, raw, normalized = plan
+        values = template.copy()
+        for index, key in raw:
+            values[index] = form.get(key)
+        for index, key, normalize in normalized:
+            try:
+                values[index] = normalize(form.get(key))
+            except AttributeError:
+                # .strip() у отсутствующего поля
+                raise FormError(f"Не заполнено поле {key}")
+        return values
+
+    def rows(self, form):
+        """Значения для INSERT студента (без submission_date и file_paths) и представителя.
+
+        form - MultiDict запроса; он один раз приводится к обычному dict,
+        дальше все поля читаются из него.
+        """
+        form = form.to_dict()
+        student = self._values(self.student_plan, form)
+        representative = self._values(self.representative_plan, form) if self.representative else None
+        return student, representative
+
+
+def submit(spec, form, files, store):
+    """Сохраняет заявку: файлы в хранилище, студента и представителя - одной транзакцией.
+
+    Повторная отправка той же формы с теми же данными и файлами (см.
+    duplicates.find_resubmission) не создаёт новую запись, другие заявки того же
+    человека сохраняются с отметкой duplicate_of.
+    Возвращает id созданной (или совпавшей) записи. FormError - форма заполнена не полностью.
+    """
+    student, representative = spec.rows(form)
+    staged_files = [store.stage(file) for file in files if file and file.filename]
+    now = datetime.datetime.now()
+    fingerprint = duplicates.fingerprint(*(student[i] for i in spec.fingerprint_columns))
+
+    with db.transaction() as conn:
+        # Блокировка записи до проверки: два одновременных запроса (двойной клик)
+        # не должны оба не найти друг друга
+        conn.execute('BEGIN IMMEDIATE')
+        existing_id = duplicates.find_resubmission(
+            conn, spec.table, fingerprint, now, spec.columns, student, [staged.key for staged in staged_files],
+            (TABLE_COLUMNS['representatives'][1:], representative) if representative is not None else None)
+        if existing_id is not None:
+            for staged in staged_files:
+                store.discard(staged)
+            return existing_id
+        duplicate = duplicates.find_duplicate(conn, spec.table, fingerprint)
+
+        file_paths = [store.commit(conn, staged) for staged in staged_files]
+        student += [now.strftime('%Y-%m-%d %H:%M:%S'), ','.join(file_paths), fingerprint,
+                    duplicate[0] if duplicate else None]
+        student_id = conn.execute(INSERTS[spec.table], student).lastrowid
+        if representative is not None:
+            conn.execute(INSERTS['representatives'], [student_id] + representative)
+        details_cache.invalidate(conn, spec.table, [student_id])
+    store.committed(file_paths)
+    return student_id
+
+
+EDUCATION_CHILDREN = "Практический базовый курс китайского языка для детей"
+
+FORMS = (
+    FormSpec('education_adult', 'education_adult.html', "Образование для взрослых", 'adult_students',
+             {'id_type': 'passport', 'study_plan': "Практический курс китайского языка для взрослых"}),
+    FormSpec('exam_adult', 'exam_adult.html', None, 'adult_students',
+             {'id_type': 'passport', 'study_plan': "Экзамен для взрослых"}),
+    FormSpec('education_children_under14', 'education_children_under14.html',
+             "Образование для несовершеннолетних (до 14 лет)", 'students',
+             {'age_group': 'under14', 'id_type': 'birth certificate', 'study_plan': EDUCATION_CHILDREN},
+             representative=True),
+    FormSpec('education_children_over14', 'education_children_over14.html',
+             "Образование для несовершеннолетних (от 14 до 18 лет)", 'students',
+             {'age_group': 'over14', 'id_type': 'passport', 'study_plan': EDUCATION_CHILDREN},
+             representative=True),
+    FormSpec('exam_children_under14', 'exam_children_under14.html',
+             "Экзамен для несовершеннолетних(до 14 лет)", 'students',
+             {'age_group': 'under14', 'id_type': 'birth certificate', 'study_plan': "Экзамен для детей (до 14 лет)"},
+             representative=True),
+    FormSpec('exam_children_over14', 'exam_children_over14.html',
+             "Экзамен для несовершеннолетних (от 14 до 18 лет)", 'students',
+             {'age_group': 'over14', 'id_type': 'passport', 'study_plan': "Экзамен для детей (от 14 до 18 лет)"},
+             representative=True),
+)
@@ -0,0 +1,42 @@
+import logging
+import os
+import tempfile
+import time
+
+import jinja2
+
+TEMPLATE_CACHE_DIR = os.environ["TEMPLATE_CACHE_DIR"] if "TEMPLATE_CACHE_DIR" in os.environ else os.path.join(tempfile.gettempdir(), "chinaekb-jinja")
+# 0 - шаблоны компилируются при первом обращении, как раньше
+TEMPLATE_PREWARM = os.environ["TEMPLATE_PREWARM"] != "0" if "TEMPLATE_PREWARM" in os.environ else True
+
+logger = logging.getLogger(__name__)
+
+
+def bytecode_cache(directory=TEMPLATE_CACHE_DIR):
+    """Кэш скомпилированных шаблонов на диске, общий для всех воркеров.
+
+    Ключ - имя и путь шаблона, запись сверяется с контрольной суммой
+    исходника, поэтому изменённый шаблон перекомпилируется. Пустая строка
+    в TEMPLATE_CACHE_DIR или недоступный каталог - без кэша.
+    """
+    if not directory:
+        return None
+    try:
+        os.makedirs(directory, exist_ok=True)
+    except OSError as e:
+        logger.error(f"Кэш шаблонов отключён, каталог {directory} недоступен: {e}")
+        return None
+    return jinja2.FileSystemBytecodeCache(directory)
+
+
+def prewarm(env):
+    """Компиляция всех шаблонов окружения до приёма запросов: (число шаблонов, секунды)."""
+    start = time.perf_counter()
+    count = 0
+    for name in env.list_templates(extensions=("html",)):
+        try:
+            env.get_template(name)
+            count += 1
+        except jinja2.TemplateError as e:
+            logger.error(f"Ошибка компиляции шаблона {name}: {e}")
+    return count, time.perf_counter() - start
@@ -0,0 +1,45 @@
+import importlib.util
+import os
+import sys
+import tempfile
+
+import pytest
+
+# Модули читают настройки из окружения при импорте (db.py сразу создаёт базу),
+# поэтому временные пути задаются до импорта модулей проекта
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WORKDIR = tempfile.mkdtemp(prefix="chinaekb-tests-")
+os.environ.update(
+    DB_PATH=os.path.join(WORKDIR, "test.db"),
+    ARCHIVE_DB_PATH=os.path.join(WORKDIR, "test-archive.db"),
+    DOCS_PATH=os.path.join(WORKDIR, "docs"),
+    METRICS_DIR=os.path.join(WORKDIR, "metrics"),
+    TEMPLATE_CACHE_DIR=os.path.join(WORKDIR, "jinja"),
+    OUTBOX_WORKER="0",
+    LOG_LEVEL="WARNING",
+)
+sys.path.insert(0, ROOT)
+
+
+@pytest.fixture(scope="session")
+def forms():
+    """Модуль приложения chinaekb-forms.py (шаблоны ищутся относительно текущего каталога)."""
+    cwd = os.getcwd()
+    os.chdir(ROOT)
+    try:
+        spec = importlib.util.spec_from_file_location("chinaekb_forms", os.path.join(ROOT, "chinaekb-forms.py"))
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        yield module
+    finally:
+        os.chdir(cwd)
+
+
+@pytest.fixture
+def client(forms):
+    return forms.app.test_client()
+
+
+def login(client):
+    response = client.post("/login", data={"username": "moder1", "password": "password1"})
+    assert response.status_code == 302
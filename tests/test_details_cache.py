@@ -0,0 +1,15 @@
+import db
+import details_cache
+
+
+def test_batched_invalidations_prune_the_log(monkeypatch):
+    monkeypatch.setattr(details_cache, "INVALIDATION_LOG_SIZE", 20)
+    monkeypatch.setattr(details_cache, "INVALIDATION_PRUNE_EVERY", 10)
+    # Пачки по 3 id: последний seq пачки почти никогда не кратен 10
+    for batch in range(40):
+        with db.transaction() as conn:
+            details_cache.invalidate(conn, "students", [batch * 3 + i for i in range(3)])
+
+    with db.connection() as conn:
+        oldest, newest = conn.execute("SELECT MIN(seq), MAX(seq) FROM cache_invalidations").fetchone()
+    assert newest - oldest < details_cache.INVALIDATION_LOG_SIZE + details_cache.INVALIDATION_PRUNE_EVERY + 3
@@ -0,0 +1,94 @@
+import os
+
+import pytest
+
+import file_delivery
+import uploads
+from conftest import login
+
+KEY = "ab/cd/" + "ab" * 32 + ".pdf"
+CONTENT = b"%PDF-1.4 passport scan"
+
+
+@pytest.fixture
+def store(forms, tmp_path, monkeypatch):
+    store = uploads.UploadStore(str(tmp_path))
+    os.makedirs(os.path.dirname(store.path(KEY)))
+    with open(store.path(KEY), "wb") as f:
+        f.write(CONTENT)
+    monkeypatch.setattr(forms, "upload_store", store)
+    return store
+
+
+def use_mode(forms, store, monkeypatch, mode):
+    monkeypatch.setattr(forms, "upload_sender", file_delivery.FileSender(store.root, "uploads", 60, mode=mode))
+
+
+def test_file_requires_login(client, store):
+    for path in (KEY, "no/such/file.pdf"):
+        response = client.get("/" + path)
+        assert response.status_code == 302
+        assert "/login" in response.headers["Location"]
+
+
+def test_missing_key_is_404_after_login(client, store):
+    login(client)
+    assert client.get("/no/such/file.pdf").status_code == 404
+    assert client.get("/../chinaekb.db").status_code == 404
+
+
+def test_app_mode_sends_file(forms, client, store, monkeypatch):
+    use_mode(forms, store, monkeypatch, "app")
+    login(client)
+    response = client.get("/" + KEY)
+    assert response.status_code == 200
+    assert response.data == CONTENT
+    assert "private" in response.headers["Cache-Control"]
+    assert "X-Accel-Redirect" not in response.headers and "X-Sendfile" not in response.headers
+
+
+def test_x_accel_mode_sets_internal_redirect(forms, client, store, monkeypatch):
+    use_mode(forms, store, monkeypatch, "x-accel")
+    login(client)
+    response = client.get("/" + KEY)
+    assert response.status_code == 200
+    assert response.headers["X-Accel-Redirect"] == "/_protected/uploads/" + KEY
+    assert response.data == b""
+    assert "private" in response.headers["Cache-Control"]
+
+
+def test_x_sendfile_mode_sets_absolute_path(forms, client, store, monkeypatch):
+    use_mode(forms, store, monkeypatch, "x-sendfile")
+    login(client)
+    response = client.get("/" + KEY)
+    assert response.status_code == 200
+    assert response.headers["X-Sendfile"] == store.path(KEY)
+    assert response.data == b""
+    assert "private" in response.headers["Cache-Control"]
+
+
+def test_app_mode_range_returns_partial_content(forms, client, store, monkeypatch):
+    use_mode(forms, store, monkeypatch, "app")
+    login(client)
+    response = client.get("/" + KEY, headers={"Range": "bytes=0-7"})
+    assert response.status_code == 206
+    assert response.headers["Content-Range"] == f"bytes 0-7/{len(CONTENT)}"
+    assert response.data == CONTENT[:8]
+
+
+def test_app_mode_if_none_match_returns_not_modified(forms, client, store, monkeypatch):
+    use_mode(forms, store, monkeypatch, "app")
+    login(client)
+    etag = client.get("/" + KEY).headers["ETag"]
+    response = client.get("/" + KEY, headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.data == b""
+
+
+def test_app_mode_if_modified_since_returns_not_modified(forms, client, store, monkeypatch):
+    use_mode(forms, store, monkeypatch, "app")
+    login(client)
+    last_modified = client.get("/" + KEY).headers["Last-Modified"]
+    response = client.get("/" + KEY, headers={"If-Modified-Since": last_modified})
+    assert response.status_code == 304
+    assert response.data == b""
@@ -0,0 +1,45 @@
+import json
+import os
+import subprocess
+import sys
+
+import metrics
+
+
+def dead_pid():
+    process = subprocess.Popen([sys.executable, "-c", "pass"])
+    process.wait()
+    return process.pid
+
+
+def write_process_file(directory, pid, value):
+    path = os.path.join(directory, f"{pid}-1000.json")
+    with open(path, "w") as f:
+        json.dump({"jobs_total": {json.dumps(["done"]): value}}, f)
+    return path
+
+
+def test_dead_process_file_is_folded_into_aggregate(tmp_path):
+    registry = metrics.Registry(directory=str(tmp_path), interval=3600)
+    jobs = registry.counter("jobs_total", "Задачи", ("state",))
+    jobs.inc("done", amount=2)
+    stale = [write_process_file(str(tmp_path), dead_pid(), 5) for _ in range(3)]
+
+    assert registry.collect()["jobs_total"] == {json.dumps(["done"]): 17}
+    assert not any(os.path.exists(path) for path in stale)
+    assert os.path.exists(tmp_path / metrics.AGGREGATE_FILE)
+    # Повторный сбор не считает перенесённые значения дважды
+    assert registry.collect()["jobs_total"] == {json.dumps(["done"]): 17}
+    assert sorted(os.listdir(tmp_path)) == sorted([".lock", metrics.AGGREGATE_FILE, os.path.basename(registry._path)])
+
+
+def test_fold_exited_worker(tmp_path):
+    registry = metrics.Registry(directory=str(tmp_path), interval=3600)
+    registry.counter("jobs_total", "Задачи", ("state",))
+    worker = write_process_file(str(tmp_path), 4242, 3)
+    other = write_process_file(str(tmp_path), 4243, 4)
+
+    assert registry.fold(4242) == 1
+    assert not os.path.exists(worker) and os.path.exists(other)
+    with open(tmp_path / metrics.AGGREGATE_FILE) as f:
+        assert json.load(f) == {"jobs_total": {json.dumps(["done"]): 3}}
@@ -0,0 +1,81 @@
+import io
+import itertools
+
+import pytest
+from werkzeug.datastructures import FileStorage, MultiDict
+
+import db
+import details_cache
+import outbox
+import submissions
+import uploads
+from conftest import login
+
+ADULT = {spec.name: spec for spec in submissions.FORMS}['education_adult']
+_numbers = itertools.count(700000)
+
+
+@pytest.fixture
+def application(tmp_path):
+    data = {
+        'studentname-lastname': 'Модерация', 'studentname-name': 'Тест', 'studentname-surname': '',
+        'studentbirth': '1990-01-01', 'studentaddress': 'Екатеринбург', 'studentgender': 'female',
+        'studentsnils': '', 'studentid-serial': '6500', 'studentid-number': str(next(_numbers)),
+        'studentid-by': 'УФМС', 'studentid-issued': '2010-01-01', 'studentbank': '',
+        'studentphone': '+79000000000', 'studentemail': 'test@example.com', 'examselection': '', 'examdate': '',
+    }
+    files = [FileStorage(io.BytesIO(b'%PDF passport'), filename='passport.pdf')]
+    return submissions.submit(ADULT, MultiDict(data), files, uploads.UploadStore(str(tmp_path)))
+
+
+def set_status(student_id, status):
+    with db.transaction() as conn:
+        conn.execute('UPDATE adult_students SET status = ? WHERE id = ?', (status, student_id))
+        details_cache.invalidate(conn, 'adult_students', [student_id])
+
+
+def outbox_rows(student_id):
+    with db.connection() as conn:
+        return conn.execute("SELECT COUNT(*) FROM outbox WHERE table_name = 'adult_students' AND student_id = ?",
+                            (student_id,)).fetchone()[0]
+
+
+def post(client, student_id, action):
+    return client.post(f"/moderation/adult_students/student/{student_id}", data={"action": action})
+
+
+@pytest.mark.parametrize("status", ["проверено", "отклонено"])
+def test_processed_application_is_not_sent_again(client, application, status):
+    login(client)
+    set_status(application, status)
+
+    assert post(client, application, "approve").status_code == 409
+    assert outbox_rows(application) == 0
+
+
+def test_delivered_application_cannot_be_rejected(client, application):
+    login(client)
+    set_status(application, "проверено")
+
+    assert post(client, application, "reject").status_code == 409
+    with db.connection() as conn:
+        assert conn.execute('SELECT status FROM adult_students WHERE id = ?', (application,)).fetchone()[0] == "проверено"
+
+
+def test_pending_application_is_approved_once(client, application):
+    login(client)
+    assert post(client, application, "approve").status_code == 302
+    assert post(client, application, "approve").status_code == 302
+    assert outbox_rows(application) == 1
+    with db.connection() as conn:
+        assert outbox.delivery_state(conn, "adult_students", application)[0] == outbox.PENDING
+
+
+def test_details_page_without_form_has_no_form_script(client, application):
+    login(client)
+    page = client.get(f"/moderation/adult_students/student/{application}").get_data(as_text=True)
+    assert "moderationForm" in page
+
+    set_status(application, "отклонено")
+    page = client.get(f"/moderation/adult_students/student/{application}").get_data(as_text=True)
+    assert "moderationForm" not in page
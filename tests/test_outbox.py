@@ -0,0 +1,90 @@
+import http.server
+import json
+import threading
+import time
+from collections import Counter
+
+import db
+import outbox
+
+
+class SlowOneC(http.server.ThreadingHTTPServer):
+    """Заглушка 1С: отвечает через delay секунд и считает полученные заявки."""
+
+    daemon_threads = True
+
+    def __init__(self, delay):
+        super().__init__(("127.0.0.1", 0), SlowOneCHandler)
+        self.delay = delay
+        self.posted = Counter()
+        self.lock = threading.Lock()
+
+
+class SlowOneCHandler(http.server.BaseHTTPRequestHandler):
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        time.sleep(self.server.delay)
+        with self.server.lock:
+            self.server.posted[payload["id"]] += 1
+        self.send_response(200)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+def test_two_workers_deliver_each_row_once(monkeypatch):
+    # Отправка (0.9 с) близка к ONEC_TIMEOUT, а строк втрое больше OUTBOX_CONCURRENCY:
+    # захват всей очереди одним воркером истёк бы до конца отправки
+    monkeypatch.setattr(outbox, "ONEC_TIMEOUT", 1)
+    server = SlowOneC(0.9)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setattr(outbox, "ONEC_URL", f"http://127.0.0.1:{server.server_address[1]}/put_contract")
+
+    ids = list(range(900001, 900001 + outbox.OUTBOX_CONCURRENCY * 3))
+    with db.transaction() as conn:
+        for student_id in ids:
+            outbox.enqueue(conn, "students", student_id, {"id": student_id})
+
+    workers = [outbox.OutboxWorker(), outbox.OutboxWorker()]
+    placeholders = ", ".join("?" * len(ids))
+
+    def remaining():
+        with db.connection() as conn:
+            return conn.execute(f"SELECT COUNT(*) FROM outbox WHERE student_id IN ({placeholders}) AND state != ?",
+                                (*ids, outbox.DELIVERED)).fetchone()[0]
+
+    def drain(worker):
+        deadline = time.monotonic() + 30
+        while remaining() and time.monotonic() < deadline:
+            if not worker.process_due():
+                time.sleep(0.05)
+
+    try:
+        threads = [threading.Thread(target=drain, args=(worker,)) for worker in workers]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        server.shutdown()
+
+    assert remaining() == 0
+    assert {student_id: server.posted[student_id] for student_id in ids} == {student_id: 1 for student_id in ids}
+
+
+def test_result_of_expired_claim_is_not_written():
+    with db.transaction() as conn:
+        outbox.enqueue(conn, "students", 900101, {"id": 900101})
+    worker = outbox.OutboxWorker()
+    [item] = [item for item in worker.claim(100) if item[2] == 900101]
+
+    # Захват истёк, запись забрал другой воркер
+    with db.transaction() as conn:
+        conn.execute("UPDATE outbox SET locked_until = ? WHERE id = ?", (item[5] + 60, item[0]))
+    worker.apply(item, "timeout")
+
+    with db.connection() as conn:
+        state, last_error = conn.execute("SELECT state, last_error FROM outbox WHERE id = ?", (item[0],)).fetchone()
+    assert (state, last_error) == (outbox.SENDING, None)
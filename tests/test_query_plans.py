@@ -0,0 +1,25 @@
+import os
+import sys
+
+import pytest
+
+import db
+import duplicates
+from conftest import ROOT
+
+sys.path.insert(0, os.path.join(ROOT, "bench"))
+import check_query_plans  # noqa: E402
+
+CHECKS = check_query_plans.checks(db, duplicates)
+
+
+@pytest.mark.parametrize("name, call, expected", CHECKS, ids=[name for name, _, _ in CHECKS])
+def test_query_uses_index(name, call, expected):
+    with db.connection() as conn:
+        results = check_query_plans.explain(conn, call, expected)
+
+    assert results, "запрос не выполнен"
+    for query, plan, problems in results:
+        assert not problems, f"{' '.join(query.split())}\n" + "\n".join(plan)
+        assert any("USING INDEX" in step or "USING COVERING INDEX" in step or "USING INTEGER PRIMARY KEY" in step
+                   for step in plan)
@@ -0,0 +1,71 @@
+import io
+import itertools
+
+import pytest
+from werkzeug.datastructures import FileStorage, MultiDict
+
+import db
+import submissions
+import uploads
+
+FORMS = {spec.name: spec for spec in submissions.FORMS}
+_numbers = itertools.count(100000)
+
+
+def person(prefix, number):
+    return {
+        prefix + 'name-lastname': f'Фамилия{number}', prefix + 'name-name': 'Имя', prefix + 'name-surname': 'Отчество',
+        prefix + 'birth': '2012-05-01', prefix + 'address': 'Екатеринбург', prefix + 'gender': 'male',
+        prefix + 'snils': '', prefix + 'id-serial': 'IV-АИ', prefix + 'id-number': str(number),
+        prefix + 'id-by': 'ЗАГС', prefix + 'id-issued': '2012-05-10', prefix + 'bank': '',
+        prefix + 'phone': '+79000000000', prefix + 'email': 'parent@example.com',
+    }
+
+
+@pytest.fixture
+def payload():
+    number = next(_numbers)
+    return dict(person('student', number), **person('client', number + 500000), examselection='', examdate='')
+
+
+@pytest.fixture
+def submit(tmp_path):
+    store = uploads.UploadStore(str(tmp_path))
+
+    def submit(form_name, data, content=b'%PDF scan'):
+        return submissions.submit(FORMS[form_name], MultiDict(data),
+                                  [FileStorage(io.BytesIO(content), filename='scan.pdf')], store)
+    return submit
+
+
+def stored(student_id):
+    with db.connection() as conn:
+        return conn.execute('SELECT age_group, address, file_paths, duplicate_of FROM students WHERE id = ?',
+                            (student_id,)).fetchone()
+
+
+def test_same_form_same_data_and_files_is_merged(submit, payload):
+    first = submit('education_children_under14', payload)
+    assert submit('education_children_under14', payload) == first
+
+
+def test_other_form_of_same_person_is_kept(submit, payload):
+    # Оба детских курса - один study_plan, различаются age_group и id_type
+    under14 = submit('education_children_under14', payload)
+    over14 = submit('education_children_over14', payload)
+
+    assert over14 != under14
+    assert stored(over14)[0] == 'over14'
+    assert stored(over14)[3] == under14
+
+
+def test_changed_data_or_files_is_kept(submit, payload):
+    first = submit('education_children_under14', payload)
+    moved = submit('education_children_under14', dict(payload, studentaddress='Москва'))
+    rescanned = submit('education_children_under14', payload, content=b'%PDF another scan')
+    other_parent = submit('education_children_under14', dict(payload, clientphone='+79111111111'))
+
+    assert len({first, moved, rescanned, other_parent}) == 4
+    assert stored(moved)[1] == 'Москва'
+    assert stored(rescanned)[2] != stored(first)[2]
+    assert all(stored(i)[3] == first for i in (moved, rescanned, other_parent))
@@ -0,0 +1,36 @@
+import io
+import os
+import stat
+
+import pytest
+from werkzeug.datastructures import FileStorage
+
+import images
+import uploads
+
+
+def test_stored_file_is_readable_by_proxy(tmp_path):
+    store = uploads.UploadStore(str(tmp_path))
+    key = store.save(FileStorage(io.BytesIO(b"%PDF-1.4 scan"), filename="scan.pdf"))
+
+    mode = stat.S_IMODE(os.stat(store.path(key)).st_mode)
+    assert mode == uploads.UPLOAD_FILE_MODE & ~uploads._umask
+
+
+def test_normalized_image_and_thumbnail_keep_store_mode(tmp_path):
+    pytest.importorskip("PIL")
+    from PIL import Image
+
+    image = io.BytesIO()
+    Image.new("RGB", (images.IMAGE_MAX_SIDE + 100, 100), "white").save(image, "JPEG")
+    image.seek(0)
+    store = uploads.UploadStore(str(tmp_path))
+    key = store.save(FileStorage(image, filename="passport.jpg"))
+
+    processor = images.ImageProcessor(store, workers=1)
+    processor.submit([key])
+    processor.shutdown()
+
+    assert processor.stats["replaced"] == 1
+    for path in (store.path(key), store.path(key) + uploads.THUMBNAIL_SUFFIX):
+        assert stat.S_IMODE(os.stat(path).st_mode) == uploads.UPLOAD_FILE_MODE & ~uploads._umask
@@ -0,0 +1,214 @@
+import datetime
+import hashlib
+import logging
+import os
+import re
+import shutil
+import tempfile
+
+import flask
+
+import db
+import metrics
+
+UPLOAD_CHUNK_SIZE = 64 * 1024
+# Превью изображения лежит рядом с файлом: <ключ>.thumb.jpg (см. images.py)
+THUMBNAIL_SUFFIX = ".thumb.jpg"
+# Права файлов хранилища: временные файлы создаются с 0600, а при отдаче через
+# X-Accel-Redirect/X-Sendfile (file_delivery.py) их читает прокси от другого пользователя
+UPLOAD_FILE_MODE = 0o644
+
+# umask процесса читается при импорте, пока нет других потоков: os.umask() его меняет
+_umask = os.umask(0)
+os.umask(_umask)
+
+logger = logging.getLogger(__name__)
+
+
+def publish(tmp_path, path):
+    """Переносит готовый временный файл в хранилище с правами UPLOAD_FILE_MODE (с учётом umask)."""
+    os.chmod(tmp_path, UPLOAD_FILE_MODE & ~_umask)
+    os.replace(tmp_path, path)
+
+
+class HashingTempFile:
+    """Временный файл в каталоге загрузок, считающий SHA-256 по мере записи.
+
+    Werkzeug пишет в него тело файла из multipart-запроса кусками,
+    поэтому память на загрузку не зависит от размера файла, а хэш готов
+    к моменту, когда обработчик получает FileStorage.
+    """
+
+    def __init__(self, directory):
+        self.file = tempfile.NamedTemporaryFile(dir=directory, prefix="upload-", delete=False)
+        self.name = self.file.name
+        self.hash = hashlib.sha256()
+        self.size = 0
+
+    def write(self, data):
+        self.hash.update(data)
+        self.size += len(data)
+        return self.file.write(data)
+
+    def __getattr__(self, item):
+        return getattr(self.file, item)
+
+    def discard(self):
+        self.file.close()
+        if os.path.exists(self.name):
+            os.remove(self.name)
+
+
+class UploadRequest(flask.Request):
+    """Запрос, сохраняющий файлы multipart сразу в HashingTempFile."""
+
+    upload_tmp_dir = None
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        stream = HashingTempFile(self.upload_tmp_dir)
+        if not hasattr(self, "_upload_streams"):
+            self._upload_streams = []
+        self._upload_streams.append(stream)
+        return stream
+
+    def discard_uploads(self):
+        # Вызывается в teardown_request: удаляет временные файлы, не попавшие в хранилище
+        for stream in getattr(self, "_upload_streams", ()):
+            stream.discard()
+
+
+class StagedUpload:
+    __slots__ = ("tmp_path", "digest", "ext", "size")
+
+    def __init__(self, tmp_path, digest, ext, size):
+        self.tmp_path = tmp_path
+        self.digest = digest
+        self.ext = ext
+        self.size = size
+
+    @property
+    def key(self):
+        return f"{self.digest[:2]}/{self.digest[2:4]}/{self.digest}{self.ext}"
+
+
+class UploadStore:
+    """Хранилище загруженных файлов с адресацией по содержимому.
+
+    Файл лежит в root/<2 символа хэша>/<ещё 2>/<sha256><расширение>; ключ
+    (относительный путь) записывается в file_paths заявки. Одинаковые файлы
+    хранятся один раз, число ссылок ведётся в таблице uploads, файл удаляется,
+    когда на него не остаётся ссылок.
+
+    on_commit(keys) вызывается после фиксации заявки с ключами её файлов
+    (фоновая обработка изображений, см. images.py).
+    """
+
+    def __init__(self, root, on_commit=None):
+        self.root = root
+        self.tmp_dir = os.path.join(root, ".tmp")
+        self.on_commit = on_commit
+        os.makedirs(self.tmp_dir, exist_ok=True)
+
+    @staticmethod
+    def extension(filename):
+        ext = os.path.splitext(filename or "")[1].lower()
+        return ext if re.fullmatch(r"\.[a-z0-9]{1,10}", ext) else ""
+
+    def stage(self, file_storage):
+        """Доводит загрузку до временного файла с известным хэшем (без работы с БД)."""
+        with metrics.UPLOAD_DURATION.time("stage"):
+            return self._stage(file_storage)
+
+    def _stage(self, file_storage):
+        ext = self.extension(file_storage.filename)
+        stream = file_storage.stream
+        if isinstance(stream, HashingTempFile):
+            stream.file.close()
+            return StagedUpload(stream.name, stream.hash.hexdigest(), ext, stream.size)
+
+        # Поток не от UploadRequest - копируем кусками, считая хэш
+        stream = HashingTempFile(self.tmp_dir)
+        try:
+            shutil.copyfileobj(file_storage.stream, stream, UPLOAD_CHUNK_SIZE)
+        finally:
+            stream.file.close()
+        return StagedUpload(stream.name, stream.hash.hexdigest(), ext, stream.size)
+
+    def commit(self, conn, staged):
+        """Добавляет ссылку на файл в транзакции conn и возвращает ключ."""
+        with metrics.UPLOAD_DURATION.time("commit"):
+            return self._commit(conn, staged)
+
+    def _commit(self, conn, staged):
+        key = staged.key
+        conn.execute('''
+            INSERT INTO uploads (key, size, refcount, created_at) VALUES (?, ?, 1, ?)
+            ON CONFLICT(key) DO UPDATE SET refcount = refcount + 1
+        ''', (key, staged.size, datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
+        path = os.path.join(self.root, key)
+        if os.path.exists(path):
+            os.remove(staged.tmp_path)
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            publish(staged.tmp_path, path)
+        return key
+
+    def committed(self, keys):
+        """Сообщает on_commit о файлах, ссылки на которые уже зафиксированы в базе."""
+        if self.on_commit is not None and keys:
+            self.on_commit(keys)
+
+    def discard(self, staged):
+        if os.path.exists(staged.tmp_path):
+            os.remove(staged.tmp_path)
+
+    def save(self, file_storage):
+        """stage() + commit() в отдельной транзакции."""
+        staged = self.stage(file_storage)
+        try:
+            with db.transaction() as conn:
+                return self.commit(conn, staged)
+        finally:
+            self.discard(staged)
+
+    def release(self, keys):
+        """Снимает ссылки на файлы одной транзакцией, файлы без ссылок удаляются.
+
+        Удаление идёт под той же блокировкой записи, что и commit(), чтобы
+        параллельная загрузка того же файла не осталась без содержимого.
+        Возвращает ключи, которых нет в хранилище (файлы, загруженные до него).
+        """
+        unknown = []
+        with db.transaction() as conn:
+            for key in keys:
+                row = conn.execute('SELECT refcount FROM uploads WHERE key = ?', (key,)).fetchone()
+                if row is None:
+                    unknown.append(key)
+                elif row[0] > 1:
+                    conn.execute('UPDATE uploads SET refcount = refcount - 1 WHERE key = ?', (key,))
+                else:
+                    conn.execute('DELETE FROM uploads WHERE key = ?', (key,))
+                    path = self.path(key)
+                    if path is not None and os.path.exists(path):
+                        os.remove(path)
+                        logger.info(f"Файл {path} удален")
+                    if path is not None and os.path.exists(path + THUMBNAIL_SUFFIX):
+                        os.remove(path + THUMBNAIL_SUFFIX)
+        return unknown
+
+    def path(self, key):
+        """Абсолютный путь к файлу по ключу или None для ключа вне хранилища."""
+        root = os.path.abspath(self.root)
+        path = os.path.abspath(os.path.join(root, key))
+        if os.path.commonpath([root, path]) != root or path.startswith(os.path.abspath(self.tmp_dir) + os.sep):
+            return None
+        return path
+
+    def thumbnails(self, keys):
+        """{ключ: ключ превью} для файлов, у которых превью уже готово."""
+        result = {}
+        for key in keys:
+            path = self.path(key)
+            if path is not None and os.path.exists(path + THUMBNAIL_SUFFIX):
+                result[key] = key + THUMBNAIL_SUFFIX
+        return result